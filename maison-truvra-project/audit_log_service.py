@@ -5,6 +5,7 @@ from datetime import datetime
 
 # Import the centralized get_db_connection function
 from backend.database import get_db_connection, query_db # query_db might be useful for fetching username
+from backend.pagination import Keyset
 
 class AuditLogService:
     def __init__(self, app=None):
@@ -24,18 +25,14 @@ class AuditLogService:
         Relies on the connection being managed by backend.database.get_db_connection().
         """
         # Always use the get_db_connection from the centralized database module.
-        # This ensures it uses g.db_conn and is managed within the app context.
+        # This ensures it uses g.db_conn (a pooled connection) and shares the caller's transaction.
         try:
             return get_db_connection()
         except RuntimeError as e:
             # This might happen if called outside of an app context where 'g' is not available
             # or current_app is not set up correctly.
-            # For audit logging, it's critical to have a valid app and request context.
-            if self.app: # Try to use self.app if current_app is not available (less ideal)
-                with self.app.app_context():
-                    # current_app.logger.warning("AuditLogService._get_db: Re-attempting DB connection within explicit app_context.")
-                    return get_db_connection()
-            # If still failing, log to stderr as app logger might not be available.
+            # A temporary app context is not an option: its teardown would hand the
+            # connection back to the pool while this service is still using it.
             print(f"CRITICAL: AuditLogService could not obtain database connection: {e}")
             raise RuntimeError(f"AuditLogService failed to get DB connection: {e}. Ensure it's used within an active Flask app/request context.")
 
@@ -43,7 +40,8 @@ class AuditLogService:
     def log_action(self, action: str, user_id: int = None, username: str = None,
                    target_type: str = None, target_id = None, # target_id can be int or str (e.g. item_uid)
                    details: str = None, status: str = 'success', 
-                   ip_address: str = None, email: str = None): # Added email for logging attempts before user_id is known
+                   ip_address: str = None, email: str = None, # Added email for logging attempts before user_id is known
+                   db_conn=None): # Explicit connection, e.g. the writer connection inside a write-queue job
         """
         Logs an action to the audit log table.
         The database commit is expected to be handled by the caller as part of the main transaction.
@@ -59,7 +57,7 @@ class AuditLogService:
             return # Cannot proceed without an app context
 
         try:
-            db = self._get_db() # Get connection from app context
+            db = db_conn if db_conn is not None else self._get_db() # Get connection from app context
             cursor = db.cursor()
 
             # If user_id is provided but username is not, try to fetch it
@@ -122,9 +120,51 @@ class AuditLogService:
             logger.error(f"AuditLogService: Unexpected error logging action '{action}': {e}")
             # Similar to above, decide on re-raising.
 
+    # Newest first; id breaks ties between entries logged in the same second.
+    LOG_KEYSET = Keyset(('timestamp', 'id'), descending=True)
+
+    def _log_filters(self, user_id_filter=None, action_filter=None, target_type_filter=None, status_filter=None):
+        conditions = []
+        params = []
+        if user_id_filter:
+            conditions.append("user_id = ?")
+            params.append(user_id_filter)
+        if action_filter:
+            conditions.append("action LIKE ?")
+            params.append(f"%{action_filter}%")
+        if target_type_filter:
+            conditions.append("target_type = ?")
+            params.append(target_type_filter)
+        if status_filter:
+            conditions.append("status = ?")
+            params.append(status_filter)
+        return conditions, params
+
+    def get_logs_page(self, cursor=None, limit=50, user_id_filter=None, action_filter=None, target_type_filter=None, status_filter=None):
+        """
+        Retrieves one page of audit logs using keyset pagination (see backend.pagination).
+        Unlike get_logs, the cost of a page does not grow with its depth.
+        Returns (logs, next_cursor); next_cursor is None on the last page.
+        Raises pagination.InvalidCursorError for a malformed cursor.
+        """
+        db = self._get_db()
+        conditions, params = self._log_filters(user_id_filter, action_filter, target_type_filter, status_filter)
+        cursor_condition, cursor_params = self.LOG_KEYSET.condition(cursor)
+        if cursor_condition:
+            conditions.append(cursor_condition)
+            params.extend(cursor_params)
+
+        query = f"SELECT * {self.LOG_KEYSET.select_columns()} FROM audit_log"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += f" {self.LOG_KEYSET.order_by()} LIMIT ?"
+        rows = query_db(query, params + [limit + 1], db_conn=db)
+        return self.LOG_KEYSET.paginate(rows, limit)
+
     def get_logs(self, page=1, per_page=20, user_id_filter=None, action_filter=None, target_type_filter=None, status_filter=None):
         """
         Retrieves audit logs with pagination and optional filters.
+        Page-number based; prefer get_logs_page for deep pages.
         """
         if not self.app and not current_app:
             print("ERROR: AuditLogService cannot get logs - Flask app not configured.")
@@ -141,28 +181,14 @@ class AuditLogService:
         
         base_query = "SELECT * FROM audit_log"
         count_query = "SELECT COUNT(*) FROM audit_log"
-        conditions = []
-        params = []
-
-        if user_id_filter:
-            conditions.append("user_id = ?")
-            params.append(user_id_filter)
-        if action_filter:
-            conditions.append("action LIKE ?")
-            params.append(f"%{action_filter}%")
-        if target_type_filter:
-            conditions.append("target_type = ?")
-            params.append(target_type_filter)
-        if status_filter:
-            conditions.append("status = ?")
-            params.append(status_filter)
+        conditions, params = self._log_filters(user_id_filter, action_filter, target_type_filter, status_filter)
 
         if conditions:
             where_clause = " WHERE " + " AND ".join(conditions)
             base_query += where_clause
             count_query += where_clause
         
-        base_query += " ORDER BY timestamp DESC LIMIT ? OFFSET ?"
+        base_query += " ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?"
         query_params = params + [per_page, offset]
         
         try:
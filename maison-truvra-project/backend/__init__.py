@@ -8,7 +8,16 @@ import logging
 from .config import get_config_by_name, Config, AppConfig # Ensure AppConfig is imported or use Config directly
 
 # Updated database import
-from .database import register_db_commands, init_db_schema, populate_initial_data
+from .database import register_db_commands, ensure_schema_current
+from .db_profiler import init_query_profiler, init_slow_query_log
+from .benchmarks import register_bench_commands
+from .recommendations import register_recommendation_commands
+from .product_feed import register_feed_commands
+from .order_export import register_order_export_commands
+from .fec_export import register_fec_commands
+from .stock_reservations import register_reservation_commands
+from .order_events import init_order_event_worker, register_order_event_commands
+from .pagination import NEXT_CURSOR_HEADER
 
 # Import AuditLogService
 from ..audit_log_service import AuditLogService # Assuming audit_log_service.py is in maison-truvra-project/
@@ -42,7 +51,8 @@ def create_app(config_name=None):
         pass 
 
     # Initialize CORS
-    CORS(app, resources={r"/api/*": {"origins": app.config.get("CORS_ORIGINS", "*").split(',')}})
+    CORS(app, resources={r"/api/*": {"origins": app.config.get("CORS_ORIGINS", "*").split(',')}},
+         expose_headers=[NEXT_CURSOR_HEADER]) # Keyset pagination cursor on admin list endpoints
 
     # Setup logging
     log_level_str = app.config.get('LOG_LEVEL', 'INFO').upper()
@@ -61,10 +71,21 @@ def create_app(config_name=None):
     app.jwt = JWTManager(app) # Use app.jwt to avoid conflicts if JWTManager is imported elsewhere
 
     # Initialize Database and Commands
+    register_db_commands(app) # Registers CLI commands like 'flask init-db' and 'flask db upgrade'
+    register_bench_commands(app) # 'flask bench ...' micro-benchmarks against a scratch database
+    register_recommendation_commands(app) # 'flask recommendations refresh' (run periodically, e.g. from cron)
+    register_feed_commands(app) # 'flask export-feed' marketplace product feed (XML / CSV)
+    register_order_export_commands(app) # 'flask export-orders' accounting export of orders and lines (CSV / JSONL)
+    register_fec_commands(app) # 'flask fec export|validate' FEC file for tax audits
+    register_reservation_commands(app) # 'flask reservations sweep' releases expired checkout holds (run from cron)
+    register_order_event_commands(app) # 'flask order-events run|stats|requeue' post-order pipeline
+    init_query_profiler(app) # No-op unless DB_PROFILING_ENABLED
+    init_slow_query_log(app) # No-op when DB_SLOW_QUERY_MS is 0
+    init_order_event_worker(app) # No-op unless ORDER_EVENTS_WORKER_ENABLED
     with app.app_context():
-        init_db_schema()  # Initializes schema from schema.sql
-        populate_initial_data() # Populates initial admin user, etc.
-    register_db_commands(app) # Registers CLI commands like 'flask init-db'
+        # Fast path: a single schema_version read when the database is current.
+        # Pending migrations (and initial data on a fresh database) are applied once.
+        ensure_schema_current()
 
     # Initialize AuditLogService
     # The AuditLogService in maison-truvra-project expects app object
@@ -2,13 +2,25 @@ import os
 import json
 import uuid
 import sqlite3 # Added for explicit error handling
+from datetime import timedelta
 from werkzeug.utils import secure_filename
-from flask import Blueprint, request, jsonify, current_app, send_from_directory
+from flask import Blueprint, Response, request, jsonify, current_app, send_from_directory, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
-from ..database import get_db_connection, query_db, record_stock_movement
+from ..category_tree import is_in_subtree
+from ..database import get_db_connection, get_db_pool, load_child_rows, query_db, record_stock_movement, stream_from_pool
+from ..db_profiler import get_query_profiler, get_slow_query_log
+from ..fec_export import FEC_ENCODING, FecExportError, check_fec_exportable, fec_filename, fiscal_year_bounds, generate_fec
+from ..order_events import dead_order_events, get_order_event_worker, order_event_metrics, requeue_dead_events
+from ..order_export import (
+    ORDER_EXPORT_FORMATS, generate_order_export, order_export_filename, parse_export_date, parse_export_statuses
+)
+from ..write_queue import WriteQueueFullError, get_write_queue, run_write
+from ..pagination import InvalidCursorError, Keyset, get_page_size, list_response
+from ..product_cache import get_product_detail_cache, invalidate_product_detail
+from ..product_feed import FEED_FORMATS, generate_feed, parse_feed_since
 from ..services.asset_service import generate_qr_code_for_item, generate_item_passport, generate_product_label
 from ..utils import (
-    allowed_file, get_file_extension, generate_slug, 
+    allowed_file, get_file_extension, generate_slug, RESERVED_PRODUCT_SLUGS,
     format_datetime_for_display, parse_datetime_from_iso
 )
 # Assuming AuditLogService is initialized in create_app and available via current_app
@@ -53,6 +65,263 @@ def get_dashboard_stats():
         current_app.logger.error(f"Error fetching dashboard stats: {e}")
         return jsonify(message="Failed to fetch dashboard statistics"), 500
 
+# --- Database Diagnostics ---
+@admin_api_bp.route('/db/pool-stats', methods=['GET'])
+@admin_required
+def get_db_pool_stats():
+    """Connection pool metrics for this worker process."""
+    try:
+        return jsonify(get_db_pool().stats()), 200
+    except Exception as e:
+        current_app.logger.error(f"Error fetching database pool stats: {e}")
+        return jsonify(message="Failed to fetch database pool statistics"), 500
+
+@admin_api_bp.route('/db/write-queue', methods=['GET'])
+@admin_required
+def get_db_write_queue_stats():
+    """Single-writer queue metrics (depth, batch sizes, wait times, rejections) for this worker process."""
+    write_queue = get_write_queue()
+    if write_queue is None:
+        return jsonify(enabled=False), 200
+    return jsonify(dict(write_queue.stats(), enabled=True)), 200
+
+@admin_api_bp.route('/db/order-events', methods=['GET'])
+@admin_required
+def get_order_events_stats():
+    """Post-order pipeline: events per status, backlog age, recent dead events and this process's worker metrics."""
+    db = get_db_connection()
+    try:
+        metrics = order_event_metrics(db)
+        dead_events = dead_order_events(db, limit=min(request.args.get('dead_limit', 20, type=int), 200))
+    except Exception as e:
+        current_app.logger.error(f"Error fetching order event metrics: {e}")
+        return jsonify(message="Failed to fetch order event metrics"), 500
+    worker = get_order_event_worker()
+    return jsonify(queue=metrics, dead_events=dead_events,
+                   worker=dict(worker.stats(), enabled=True) if worker is not None else {'enabled': False}), 200
+
+@admin_api_bp.route('/db/order-events/requeue', methods=['POST'])
+@admin_required
+def requeue_order_events():
+    """Retries dead order events: {"eventIds": [...]} or, without ids, every dead event."""
+    event_ids = (request.get_json(silent=True) or {}).get('eventIds') or []
+    if not isinstance(event_ids, list) or not all(isinstance(event_id, int) for event_id in event_ids):
+        return jsonify(message="eventIds must be a list of event ids."), 400
+    current_user_id, ip_address = get_jwt_identity(), request.remote_addr
+
+    def requeue_and_audit(db):
+        requeued = requeue_dead_events(db, event_ids)
+        current_app.audit_log_service.log_action(
+            user_id=current_user_id, action='requeue_order_events', target_type='order_event',
+            details=f"Requeued {requeued} dead order event(s){f': {event_ids}' if event_ids else ''}.", status='success',
+            ip_address=ip_address, db_conn=db
+        )
+        return requeued
+
+    try:
+        requeued = run_write(requeue_and_audit)
+    except WriteQueueFullError:
+        return jsonify(message="Service temporarily overloaded, please retry."), 503
+    except Exception as e:
+        current_app.logger.error(f"Error requeuing order events {event_ids}: {e}")
+        return jsonify(message="Failed to requeue order events"), 500
+    worker = get_order_event_worker()
+    if worker is not None:
+        worker.wake()
+    return jsonify(requeued=requeued), 200
+
+@admin_api_bp.route('/db/query-report', methods=['GET'])
+@admin_required
+def get_db_query_report():
+    """Rolling query profile (per-endpoint averages, top fingerprints, recent N+1 hits) for this worker."""
+    profiler = get_query_profiler()
+    if profiler is None:
+        return jsonify(message="Query profiling is disabled. Set DB_PROFILING_ENABLED to enable it."), 404
+    top = request.args.get('top', 25, type=int)
+    return jsonify(profiler.report(top=top)), 200
+
+@admin_api_bp.route('/db/query-report', methods=['DELETE'])
+@admin_required
+def reset_db_query_report():
+    profiler = get_query_profiler()
+    if profiler is None:
+        return jsonify(message="Query profiling is disabled."), 404
+    profiler.reset()
+    return jsonify(message="Query report reset"), 200
+
+@admin_api_bp.route('/db/slow-queries', methods=['GET'])
+@admin_required
+def get_db_slow_queries():
+    """Recent slow statements for this worker; ?full_scans=true keeps only those whose plan scans a table."""
+    slow_query_log = get_slow_query_log()
+    if slow_query_log is None:
+        return jsonify(message="Slow-query log is disabled. Set DB_SLOW_QUERY_MS to enable it."), 404
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    full_scans_only = request.args.get('full_scans', 'false').lower() == 'true'
+    return jsonify(stats=slow_query_log.stats(),
+                   entries=slow_query_log.entries(limit=limit, full_scans_only=full_scans_only)), 200
+
+@admin_api_bp.route('/db/slow-queries', methods=['DELETE'])
+@admin_required
+def reset_db_slow_queries():
+    slow_query_log = get_slow_query_log()
+    if slow_query_log is None:
+        return jsonify(message="Slow-query log is disabled."), 404
+    slow_query_log.reset()
+    return jsonify(message="Slow-query log reset"), 200
+
+# --- Caches ---
+@admin_api_bp.route('/cache/product-detail', methods=['GET'])
+@admin_required
+def get_product_detail_cache_stats():
+    """Product page cache counters (hits, misses, stale, expired, evictions) for this worker process."""
+    cache = get_product_detail_cache()
+    if cache is None:
+        return jsonify(enabled=False), 200
+    return jsonify(dict(cache.stats(), enabled=True)), 200
+
+@admin_api_bp.route('/cache/product-detail', methods=['DELETE'])
+@admin_required
+def clear_product_detail_cache():
+    invalidate_product_detail()
+    return jsonify(message="Product detail cache cleared"), 200
+
+# --- Audit Log ---
+@admin_api_bp.route('/audit-logs', methods=['GET'])
+@admin_required
+def get_audit_logs():
+    """Audit log, newest first, one keyset page at a time (?limit=, ?cursor= from the X-Next-Cursor header)."""
+    try:
+        logs, next_cursor = current_app.audit_log_service.get_logs_page(
+            cursor=request.args.get('cursor'),
+            limit=get_page_size(request.args),
+            user_id_filter=request.args.get('user_id', type=int),
+            action_filter=request.args.get('action'),
+            target_type_filter=request.args.get('target_type'),
+            status_filter=request.args.get('status')
+        )
+        return list_response(logs, next_cursor)
+    except InvalidCursorError as e:
+        return jsonify(message=str(e)), 400
+    except Exception as e:
+        current_app.logger.error(f"Error fetching audit logs: {e}")
+        return jsonify(message="Failed to fetch audit logs"), 500
+
+# --- Exports ---
+def _log_export_action(**audit):
+    """
+    Writes an export's audit entry in its own committed write job, before the response streams:
+    the request's connection must not hold a write transaction while the file is generated.
+    """
+    audit.setdefault('ip_address', request.remote_addr) # The write queue's thread has no request
+    run_write(lambda db: current_app.audit_log_service.log_action(db_conn=db, **audit))
+
+@admin_api_bp.route('/exports/product-feed', methods=['GET'])
+@admin_required
+def export_product_feed():
+    """
+    Marketplace product feed (?format=xml|csv, ?since=ISO date for changed products only),
+    streamed as it is generated; see product_feed.py. `flask export-feed` writes the same file.
+    """
+    feed_format = request.args.get('format', 'xml').lower()
+    if feed_format not in FEED_FORMATS:
+        return jsonify(message=f"Unsupported feed format. Use one of: {', '.join(sorted(FEED_FORMATS))}"), 400
+    try:
+        since = parse_feed_since(request.args.get('since'))
+    except ValueError as e:
+        return jsonify(message=str(e)), 400
+
+    try:
+        _log_export_action(
+            user_id=get_jwt_identity(),
+            action='export_product_feed',
+            target_type='product',
+            details=f"Product feed export ({feed_format}{', since ' + since if since else ''}).",
+            status='success'
+        )
+    except WriteQueueFullError:
+        return jsonify(message="Service temporarily overloaded, please retry."), 503
+    response = Response(stream_with_context(stream_from_pool(generate_feed, feed_format=feed_format, since=since)),
+                        mimetype=FEED_FORMATS[feed_format])
+    response.headers['Content-Disposition'] = f'attachment; filename="product-feed.{feed_format}"'
+    return response
+
+@admin_api_bp.route('/exports/orders', methods=['GET'])
+@admin_required
+def export_orders():
+    """
+    Orders and their lines for accounting (?format=csv|jsonl, ?from= and ?to= ISO dates, `to`
+    exclusive, ?status=paid,shipped, ?gzip=true), streamed as it is generated; see order_export.py.
+    `flask export-orders` writes the same file.
+    """
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in ORDER_EXPORT_FORMATS:
+        return jsonify(message=f"Unsupported export format. Use one of: {', '.join(sorted(ORDER_EXPORT_FORMATS))}"), 400
+    try:
+        date_from = parse_export_date(request.args.get('from'), 'from')
+        date_to = parse_export_date(request.args.get('to'), 'to')
+        statuses = parse_export_statuses(request.args.get('status'))
+    except ValueError as e:
+        return jsonify(message=str(e)), 400
+    compress = request.args.get('gzip', 'false').lower() in ('true', '1')
+
+    try:
+        _log_export_action(
+            user_id=get_jwt_identity(),
+            action='export_orders',
+            target_type='order',
+            details=f"Order export ({export_format}, from {date_from or '-'} to {date_to or '-'}, statuses {','.join(statuses) if statuses else 'all'}).",
+            status='success'
+        )
+    except WriteQueueFullError:
+        return jsonify(message="Service temporarily overloaded, please retry."), 503
+    chunks = stream_from_pool(generate_order_export, export_format=export_format, date_from=date_from, date_to=date_to,
+                              statuses=statuses, compress=compress)
+    response = Response(stream_with_context(chunks),
+                        mimetype='application/gzip' if compress else ORDER_EXPORT_FORMATS[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename="{order_export_filename(export_format, date_from, date_to, compress)}"'
+    return response
+
+@admin_api_bp.route('/exports/fec', methods=['GET'])
+@admin_required
+def export_fec():
+    """
+    FEC (Fichier des Écritures Comptables) of a calendar fiscal year (?year=2024), streamed as
+    it is generated; see fec_export.py. `flask fec export` writes the same file and validates it.
+    """
+    year = request.args.get('year', type=int)
+    if not year or not 2000 <= year <= 2100:
+        return jsonify(message="A fiscal year is required (?year=YYYY)."), 400
+    start_date, end_date = fiscal_year_bounds(year)
+
+    try:
+        check_fec_exportable(get_db_connection(), start_date, end_date)
+    except FecExportError as e:
+        return jsonify(message=str(e)), 422
+    try:
+        _log_export_action(
+            user_id=get_jwt_identity(),
+            action='export_fec',
+            target_type='invoice',
+            details=f"FEC export for fiscal year {year}.",
+            status='success'
+        )
+    except WriteQueueFullError:
+        return jsonify(message="Service temporarily overloaded, please retry."), 503
+    totals = {}
+
+    def stream(db):
+        yield from generate_fec(db, start_date, end_date, totals=totals)
+        current_app.logger.info(
+            f"FEC {year} exported: {totals['entries']} entries, {totals['lines']} lines, "
+            f"debit {totals['debit_cents']} / credit {totals['credit_cents']} cents."
+        )
+
+    response = Response(stream_with_context(stream_from_pool(stream)), mimetype='text/plain')
+    response.headers['Content-Type'] = f'text/plain; charset={FEC_ENCODING}'
+    response.headers['Content-Disposition'] = f'attachment; filename="{fec_filename(end_date - timedelta(days=1))}"'
+    return response
+
 # --- Category Management ---
 @admin_api_bp.route('/categories', methods=['POST'])
 @admin_required
@@ -247,6 +516,9 @@ def update_category(category_id):
                 if parent_id_to_update == category_id: # Prevent self-parenting
                     audit_logger.log_action(user_id=current_user_id, action='update_category_fail', target_type='category', target_id=category_id, details="Category cannot be its own parent.", status='failure')
                     return jsonify(message="Category cannot be its own parent."), 400
+                if is_in_subtree(db, parent_id_to_update, category_id): # Prevent cycles (closure table)
+                    audit_logger.log_action(user_id=current_user_id, action='update_category_fail', target_type='category', target_id=category_id, details=f"Category {parent_id_to_update} is a subcategory of this category.", status='failure')
+                    return jsonify(message="A category cannot be moved under one of its own subcategories."), 400
             except ValueError:
                 audit_logger.log_action(user_id=current_user_id, action='update_category_fail', target_type='category', target_id=category_id, details="Invalid parent ID format.", status='failure')
                 return jsonify(message="Invalid parent ID format."), 400
@@ -391,6 +663,9 @@ def create_product():
         meta_description = data.get('meta_description', '')
         
         slug = generate_slug(name)
+        if slug in RESERVED_PRODUCT_SLUGS:
+            audit_logger.log_action(user_id=current_user_id, action='create_product_fail', details=f"Product slug '{slug}' is reserved.", status='failure')
+            return jsonify(message=f"Product name (slug: '{slug}') is reserved. Choose a different name."), 409
 
         # Validate SKU prefix uniqueness
         existing_sku = query_db("SELECT id FROM products WHERE sku_prefix = ?", [sku_prefix], db_conn=db, one=True)
@@ -504,6 +779,17 @@ def get_products():
         """
         products_data = query_db(query, db_conn=db)
         products = [dict(row) for row in products_data] if products_data else []
+        # Children of all listed products, one query per table instead of two per product
+        weight_options = load_child_rows(
+            db,
+            "SELECT * FROM product_weight_options WHERE product_id IN ({placeholders}) AND is_active = TRUE ORDER BY product_id, weight_grams",
+            (product['id'] for product in products if product['type'] == 'variable_weight'), 'product_id'
+        )
+        images = load_child_rows(
+            db,
+            "SELECT id, product_id, image_url, alt_text, is_primary FROM product_images WHERE product_id IN ({placeholders}) ORDER BY product_id, is_primary DESC, id ASC",
+            (product['id'] for product in products), 'product_id'
+        )
 
         for product in products:
             product['created_at'] = format_datetime_for_display(product['created_at'])
@@ -511,19 +797,16 @@ def get_products():
             if product.get('main_image_url'):
                 product['main_image_full_url'] = f"{request.host_url.rstrip('/')}{admin_api_bp.url_prefix}/assets/{product['main_image_url']}"
             
-            # Fetch weight options if variable_weight
+            # Weight options if variable_weight
             if product['type'] == 'variable_weight':
-                options_data = query_db("SELECT * FROM product_weight_options WHERE product_id = ? AND is_active = TRUE ORDER BY weight_grams", [product['id']], db_conn=db)
-                product['weight_options'] = [dict(opt_row) for opt_row in options_data] if options_data else []
+                product['weight_options'] = weight_options.get(product['id'], [])
             
-            # Fetch additional images
-            images_data = query_db("SELECT id, image_url, alt_text, is_primary FROM product_images WHERE product_id = ? ORDER BY is_primary DESC, id ASC", [product['id']], db_conn=db)
+            # Additional images
             product['additional_images'] = []
-            if images_data:
-                for img_row in images_data:
-                    img_dict = dict(img_row)
-                    img_dict['image_full_url'] = f"{request.host_url.rstrip('/')}{admin_api_bp.url_prefix}/assets/{img_dict['image_url']}"
-                    product['additional_images'].append(img_dict)
+            for img_dict in images.get(product['id'], []):
+                del img_dict['product_id']
+                img_dict['image_full_url'] = f"{request.host_url.rstrip('/')}{admin_api_bp.url_prefix}/assets/{img_dict['image_url']}"
+                product['additional_images'].append(img_dict)
 
 
         return jsonify(products), 200
@@ -595,6 +878,9 @@ def update_product(product_id):
 
         # Check for slug conflict (if name changed)
         if data.get('name') and new_slug != current_product['slug']:
+            if new_slug in RESERVED_PRODUCT_SLUGS:
+                audit_logger.log_action(user_id=current_user_id, action='update_product_fail', target_type='product', target_id=product_id, details=f"Product slug '{new_slug}' is reserved.", status='failure')
+                return jsonify(message=f"Product name (slug: '{new_slug}') is reserved."), 409
             existing_slug = query_db("SELECT id FROM products WHERE slug = ? AND id != ?", [new_slug, product_id], db_conn=db, one=True)
             if existing_slug:
                 audit_logger.log_action(user_id=current_user_id, action='update_product_fail', target_type='product', target_id=product_id, details=f"Product name/slug '{new_slug}' already exists.", status='failure')
@@ -688,6 +974,7 @@ def update_product(product_id):
 
 
         db.commit()
+        invalidate_product_detail(product_id)
         audit_logger.log_action(
             user_id=current_user_id, 
             action='update_product', 
@@ -762,6 +1049,7 @@ def delete_product(product_id):
         # Serialized items are RESTRICTED. Stock movements CASCADE. Reviews CASCADE.
         cursor.execute("DELETE FROM products WHERE id = ?", (product_id,))
         db.commit()
+        invalidate_product_detail(product_id)
 
         if cursor.rowcount > 0:
             audit_logger.log_action(
@@ -834,6 +1122,7 @@ def add_product_image(product_id):
         )
         image_id = cursor.lastrowid
         db.commit()
+        invalidate_product_detail(product_id)
 
         audit_logger.log_action(
             user_id=current_user_id, 
@@ -872,6 +1161,7 @@ def delete_product_image(product_id, image_id):
         cursor = db.cursor()
         cursor.execute("DELETE FROM product_images WHERE id = ?", (image_id,))
         db.commit()
+        invalidate_product_detail(product_id)
 
         audit_logger.log_action(
             user_id=current_user_id, 
@@ -892,14 +1182,23 @@ def delete_product_image(product_id, image_id):
 @admin_api_bp.route('/users', methods=['GET'])
 @admin_required
 def get_users():
+    """Users, newest first, one keyset page at a time (?limit=, ?cursor= from the X-Next-Cursor header)."""
     db = get_db_connection()
     try:
-        # Add query params for filtering by role, status, pagination
-        users_data = query_db("SELECT id, email, first_name, last_name, role, is_active, is_verified, company_name, vat_number, siret_number, professional_status, created_at FROM users ORDER BY created_at DESC", db_conn=db)
-        users = [dict(row) for row in users_data] if users_data else []
+        # Add query params for filtering by role, status
+        keyset = Keyset(('created_at', 'id'), descending=True)
+        limit = get_page_size(request.args)
+        cursor_condition, params = keyset.condition(request.args.get('cursor'))
+        query = f"SELECT id, email, first_name, last_name, role, is_active, is_verified, company_name, vat_number, siret_number, professional_status, created_at {keyset.select_columns()} FROM users"
+        if cursor_condition:
+            query += f" WHERE {cursor_condition}"
+        query += f" {keyset.order_by()} LIMIT ?"
+        users, next_cursor = keyset.paginate(query_db(query, params + [limit + 1], db_conn=db), limit)
         for user in users:
             user['created_at'] = format_datetime_for_display(user['created_at'])
-        return jsonify(users), 200
+        return list_response(users, next_cursor)
+    except InvalidCursorError as e:
+        return jsonify(message=str(e)), 400
     except Exception as e:
         current_app.logger.error(f"Error fetching users: {e}")
         return jsonify(message="Failed to fetch users"), 500
@@ -1001,28 +1300,39 @@ def update_user(user_id):
 @admin_api_bp.route('/orders', methods=['GET'])
 @admin_required
 def get_orders():
+    """Orders, newest first, one keyset page at a time (?limit=, ?cursor= from the X-Next-Cursor header)."""
     db = get_db_connection()
     try:
-        # Add query params for filtering by status, user, date range, pagination
+        # Add query params for filtering by status, user, date range
+        keyset = Keyset(('o.order_date', 'o.id'), descending=True)
+        limit = get_page_size(request.args)
+        cursor_condition, params = keyset.condition(request.args.get('cursor'))
         orders_data = query_db(
-            """SELECT o.*, u.email as user_email, u.first_name, u.last_name 
+            f"""SELECT o.*, u.email as user_email, u.first_name, u.last_name {keyset.select_columns()}
                FROM orders o
                JOIN users u ON o.user_id = u.id
-               ORDER BY o.order_date DESC""", db_conn=db)
-        orders = [dict(row) for row in orders_data] if orders_data else []
+               {'WHERE ' + cursor_condition if cursor_condition else ''}
+               {keyset.order_by()} LIMIT ?""", params + [limit + 1], db_conn=db)
+        orders, next_cursor = keyset.paginate(orders_data, limit)
+        # Items of every order on the page in one query
+        order_items = load_child_rows(
+            db,
+            """SELECT oi.*, p.name as product_name_current, p.sku_prefix, si.item_uid as serialized_item_uid_actual
+               FROM order_items oi
+               LEFT JOIN products p ON oi.product_id = p.id
+               LEFT JOIN serialized_inventory_items si ON oi.serialized_item_id = si.id
+               WHERE oi.order_id IN ({placeholders})
+               ORDER BY oi.order_id, oi.id""",
+            (order['id'] for order in orders), 'order_id'
+        )
         for order in orders:
             order['order_date'] = format_datetime_for_display(order['order_date'])
             order['created_at'] = format_datetime_for_display(order['created_at'])
             order['updated_at'] = format_datetime_for_display(order['updated_at'])
-            # Fetch order items
-            items_data = query_db(
-                """SELECT oi.*, p.name as product_name_current, p.sku_prefix, si.item_uid as serialized_item_uid_actual
-                   FROM order_items oi
-                   LEFT JOIN products p ON oi.product_id = p.id
-                   LEFT JOIN serialized_inventory_items si ON oi.serialized_item_id = si.id
-                   WHERE oi.order_id = ?""", [order['id']], db_conn=db)
-            order['items'] = [dict(item_row) for item_row in items_data] if items_data else []
-        return jsonify(orders), 200
+            order['items'] = order_items.get(order['id'], [])
+        return list_response(orders, next_cursor)
+    except InvalidCursorError as e:
+        return jsonify(message=str(e)), 400
     except Exception as e:
         current_app.logger.error(f"Error fetching orders: {e}")
         return jsonify(message="Failed to fetch orders"), 500
@@ -1123,7 +1433,7 @@ def _update_review_approval(review_id, is_approved_status):
     action_verb = "approve" if is_approved_status else "unapprove"
 
     try:
-        review_exists = query_db("SELECT id FROM reviews WHERE id = ?", [review_id], db_conn=db, one=True)
+        review_exists = query_db("SELECT id, product_id FROM reviews WHERE id = ?", [review_id], db_conn=db, one=True)
         if not review_exists:
             audit_logger.log_action(user_id=current_admin_id, action=f'{action_verb}_review_fail', target_type='review', target_id=review_id, details="Review not found.", status='failure')
             return jsonify(message="Review not found"), 404
@@ -1131,6 +1441,7 @@ def _update_review_approval(review_id, is_approved_status):
         cursor = db.cursor()
         cursor.execute("UPDATE reviews SET is_approved = ? WHERE id = ?", (is_approved_status, review_id))
         db.commit()
+        invalidate_product_detail(review_exists['product_id'])
         
         audit_logger.log_action(
             user_id=current_admin_id, 
@@ -1154,7 +1465,7 @@ def delete_review(review_id):
     audit_logger = current_app.audit_log_service
     db = get_db_connection()
     try:
-        review_exists = query_db("SELECT id FROM reviews WHERE id = ?", [review_id], db_conn=db, one=True)
+        review_exists = query_db("SELECT id, product_id FROM reviews WHERE id = ?", [review_id], db_conn=db, one=True)
         if not review_exists:
             audit_logger.log_action(user_id=current_admin_id, action='delete_review_fail', target_type='review', target_id=review_id, details="Review not found.", status='failure')
             return jsonify(message="Review not found"), 404
@@ -1162,6 +1473,7 @@ def delete_review(review_id):
         cursor = db.cursor()
         cursor.execute("DELETE FROM reviews WHERE id = ?", (review_id,))
         db.commit()
+        invalidate_product_detail(review_exists['product_id'])
 
         audit_logger.log_action(
             user_id=current_admin_id, 
@@ -0,0 +1,534 @@
+import collections
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from .db_pool import SQLiteConnectionPool
+from .checkout import place_order, reserve_cart
+from .database import insert_serialized_items_bulk, record_stock_movement, record_stock_movements_bulk
+from .facets import FACET_EXPRESSIONS, build_facet_query, fetch_facet_rows, shape_facets
+from .migrations import apply_migrations
+from .recommendations import refresh_recommendations
+from .search import build_fts_query, fts_products_source
+from .stock_reservations import release_expired_holds, release_hold
+from .write_queue import WriteQueue
+
+# --- Benchmarks ---
+# `flask bench <name>` runs a micro-benchmark against a scratch database created from the
+# migrations in a temporary directory, tuned with the app's DB_* PRAGMA settings.
+# The application database is never touched.
+
+
+class ScratchDatabase:
+    """A throwaway, fully migrated database. Use as a context manager; yields a connection."""
+
+    def __init__(self, app):
+        self.app = app
+        self.directory = None
+        self.path = None
+        self.pool = None
+
+    def create_pool(self, size):
+        """Another pool on the scratch database (e.g. one connection per thread for concurrency benchmarks)."""
+        return SQLiteConnectionPool(
+            self.path,
+            size=size,
+            busy_timeout_ms=self.app.config.get('DB_BUSY_TIMEOUT_MS', 5000),
+            journal_mode=self.app.config.get('DB_JOURNAL_MODE', 'WAL'),
+            synchronous=self.app.config.get('DB_SYNCHRONOUS', 'NORMAL'),
+            mmap_size=self.app.config.get('DB_MMAP_SIZE', 0),
+            cache_size=self.app.config.get('DB_CACHE_SIZE', -2000)
+        )
+
+    def __enter__(self):
+        self.directory = tempfile.mkdtemp(prefix='truvra-bench-')
+        self.path = os.path.join(self.directory, 'bench.sqlite3')
+        self.pool = self.create_pool(1)
+        self.conn = self.pool.acquire()
+        apply_migrations(self.conn)
+        return self.conn
+
+    def __exit__(self, *exc_info):
+        self.pool.release(self.conn)
+        self.pool.close_all()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def create_bench_product(db_conn, name='Bench product', sku_prefix=None, **columns):
+    """Inserts a minimal product row and returns its id."""
+    sku_prefix = sku_prefix or f"BENCH-{uuid.uuid4().hex[:8].upper()}"
+    values = {'name': name, 'slug': sku_prefix.lower(), 'sku_prefix': sku_prefix, 'type': 'simple', 'base_price': 10.0}
+    values.update(columns)
+    cursor = db_conn.execute(
+        f"INSERT INTO products ({', '.join(values)}) VALUES ({', '.join('?' for _ in values)})",
+        list(values.values())
+    )
+    db_conn.commit()
+    return cursor.lastrowid
+
+
+_CATALOG_WORDS = {
+    'product': ['Truffe', 'Trüffe', 'Brisures', 'Huile', 'Sel', 'Foie gras', 'Confit', 'Crème', 'Pâté', 'Miel', 'Œufs'],
+    'variety': ['noire', 'blanche', "d'été", "d'hiver", 'melanosporum', 'aestivum', 'brumale', 'fumé', 'nature'],
+    'origin': ['du Périgord', 'de Provence', "d'Alba", 'du Quercy', 'de Bourgogne', 'des Cévennes', "d'Italie"],
+    'brand': ['Maison Trüvra', 'Domaine Élise', 'Les Causses', 'Truffières Réunies'],
+    'category': ['Truffes fraîches', 'Épicerie fine', 'Huiles & condiments', 'Coffrets cadeaux', 'Conserves'],
+}
+
+
+def seed_bench_catalog(db_conn, product_count, seed=42):
+    """Fills a scratch database with categories and `product_count` active products (synthetic names)."""
+    rng = random.Random(seed)
+    category_ids = []
+    for index, name in enumerate(_CATALOG_WORDS['category']):
+        cursor = db_conn.execute("INSERT INTO categories (name, slug) VALUES (?, ?)", (name, f"bench-category-{index}"))
+        category_ids.append(cursor.lastrowid)
+
+    def rows():
+        for index in range(product_count):
+            name = f"{rng.choice(_CATALOG_WORDS['product'])} {rng.choice(_CATALOG_WORDS['variety'])} {rng.choice(_CATALOG_WORDS['origin'])} n°{index}"
+            description = (f"{rng.choice(_CATALOG_WORDS['product'])} {rng.choice(_CATALOG_WORDS['variety'])} "
+                           f"sélectionnée {rng.choice(_CATALOG_WORDS['origin'])}, récolte {2015 + index % 10}.")
+            price = round(rng.uniform(5, 400), 2)
+            yield (name, description, rng.choice(category_ids), rng.choice(_CATALOG_WORDS['brand']),
+                   f"BENCH-{index:07d}", f"bench-product-{index}", price, rng.randint(0, 50))
+
+    db_conn.executemany(
+        """INSERT INTO products (name, description, category_id, brand, sku_prefix, slug, base_price, aggregate_stock_quantity)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+        rows()
+    )
+    db_conn.commit()
+    return category_ids
+
+
+def report_timing(label, elapsed, count, unit='item'):
+    click.echo(f"{label:<28} {elapsed * 1000.0:10.1f} ms total  {elapsed * 1e6 / max(count, 1):9.2f} µs/{unit}")
+
+
+@click.group('bench')
+def bench_cli():
+    """Database micro-benchmarks (run against a scratch database)."""
+
+
+def _serialized_items(product_id, count):
+    return [
+        {'item_uid': f"BENCH-{uuid.uuid4().hex[:12].upper()}", 'product_id': product_id,
+         'batch_number': 'B-BENCH', 'cost_price': 4.2, 'status': 'available'}
+        for _ in range(count)
+    ]
+
+
+def _receive_row_by_row(db, product_id, items):
+    for item in items:
+        cursor = db.execute(
+            "INSERT INTO serialized_inventory_items (item_uid, product_id, batch_number, cost_price, status) VALUES (?, ?, ?, ?, ?)",
+            (item['item_uid'], product_id, item['batch_number'], item['cost_price'], item['status'])
+        )
+        record_stock_movement(db, product_id, 'receive_serialized', quantity_change=1,
+                              serialized_item_id=cursor.lastrowid, reason='bench')
+    db.commit()
+
+
+def _receive_bulk(db, product_id, items):
+    ids_by_uid = insert_serialized_items_bulk(db, items)
+    record_stock_movements_bulk(db, (
+        {'product_id': product_id, 'serialized_item_id': ids_by_uid[item['item_uid']],
+         'movement_type': 'receive_serialized', 'quantity_change': 1, 'reason': 'bench'}
+        for item in items
+    ))
+    db.commit()
+
+
+@bench_cli.command('stock-bulk')
+@click.option('--items', 'item_count', default=10000, show_default=True, help='Serialized items to receive.')
+@with_appcontext
+def bench_stock_bulk_command(item_count):
+    """Per-item cost of receiving serialized stock: row-by-row inserts vs. the bulk executemany path."""
+    app = current_app._get_current_object()
+    for label, receive in (('row-by-row', _receive_row_by_row), ('bulk (executemany)', _receive_bulk)):
+        with ScratchDatabase(app) as db: # Fresh database per variant, so index sizes are comparable
+            product_id = create_bench_product(db)
+            items = _serialized_items(product_id, item_count)
+            start = time.perf_counter()
+            receive(db, product_id, items)
+            report_timing(label, time.perf_counter() - start, item_count)
+
+
+@bench_cli.command('search')
+@click.option('--products', 'product_count', default=100000, show_default=True, help='Catalog size.')
+@click.option('--repeat', default=20, show_default=True, help='Executions per search term.')
+@with_appcontext
+def bench_search_command(product_count, repeat):
+    """Product search: the old LOWER(...) LIKE '%term%' scan vs. FTS5 MATCH ranked by bm25 (first page)."""
+    app = current_app._get_current_object()
+    terms = ['truffe', 'perigord', 'foie gras', 'oeufs', 'melano', '4242'] # Broad terms match a large share of the synthetic catalog
+    like_sql = """
+        SELECT p.id FROM products p LEFT JOIN categories c ON p.category_id = c.id
+        WHERE p.is_active = TRUE AND (LOWER(p.name) LIKE ? OR LOWER(p.description) LIKE ?)
+        ORDER BY p.name ASC LIMIT 20
+    """
+    fts_sql = f"""
+        SELECT p.id FROM {fts_products_source()} LEFT JOIN categories c ON p.category_id = c.id
+        WHERE p.is_active = TRUE ORDER BY fts.rank ASC, p.id ASC LIMIT 20
+    """
+    like_count_sql = "SELECT COUNT(*) FROM products p WHERE p.is_active = TRUE AND (LOWER(p.name) LIKE ? OR LOWER(p.description) LIKE ?)"
+    fts_count_sql = f"SELECT COUNT(*) FROM {fts_products_source()} WHERE p.is_active = TRUE"
+
+    with ScratchDatabase(app) as db:
+        start = time.perf_counter()
+        seed_bench_catalog(db, product_count)
+        report_timing(f'seed {product_count} products', time.perf_counter() - start, product_count, unit='product')
+
+        for term in terms:
+            like_args = [f"%{term.lower()}%", f"%{term.lower()}%"]
+            fts_args = [build_fts_query(term)]
+            click.echo(f"\n'{term}': LIKE matches {db.execute(like_count_sql, like_args).fetchone()[0]}, "
+                       f"FTS matches {db.execute(fts_count_sql, fts_args).fetchone()[0]}")
+            for label, sql, args in (('  LIKE page 1', like_sql, like_args), ('  FTS5 page 1', fts_sql, fts_args)):
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    db.execute(sql, args).fetchall()
+                report_timing(label, time.perf_counter() - start, repeat, unit='query')
+
+
+@bench_cli.command('facets')
+@click.option('--products', 'product_count', default=100000, show_default=True, help='Catalog size.')
+@click.option('--repeat', default=10, show_default=True, help='Executions per variant.')
+@with_appcontext
+def bench_facets_command(product_count, repeat):
+    """Facet counts: one COUNT(*) per facet value vs. the single grouped query (facets.py)."""
+    app = current_app._get_current_object()
+    with ScratchDatabase(app) as db:
+        seed_bench_catalog(db, product_count)
+        facet_sql, facet_params = build_facet_query("products p", [], [])
+        facet_values = [(facet, entry['value'])
+                        for facet, entries in shape_facets(db.execute(facet_sql, facet_params).fetchall(), {}).items()
+                        if facet != 'in_stock' for entry in entries] + [('in_stock', 1), ('in_stock', 0)]
+        click.echo(f"{len(facet_values)} facet values over {product_count} products")
+
+        def per_value_counts():
+            for facet, value in facet_values:
+                column = 'c.slug' if facet == 'category' else FACET_EXPRESSIONS[facet]
+                db.execute(f"""SELECT COUNT(*) FROM products p LEFT JOIN categories c ON p.category_id = c.id
+                               WHERE p.is_active = TRUE AND {column} = ?""", [value]).fetchone()
+
+        def grouped_query():
+            shape_facets(db.execute(facet_sql, facet_params).fetchall(), {})
+
+        def cached_grouped_query(): # Repeat requests for the same filters at the same catalog version
+            shape_facets(fetch_facet_rows(db, facet_sql, facet_params), {})
+
+        for label, run in (('COUNT per facet value', per_value_counts), ('single grouped query', grouped_query),
+                           ('grouped query, cached', cached_grouped_query)):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                run()
+            report_timing(label, time.perf_counter() - start, repeat, unit='request')
+
+
+def seed_bench_orders(db_conn, order_count, product_ids, max_lines=6, seed=42):
+    """Adds `order_count` paid orders of 1..max_lines lines each; popular products are picked more often."""
+    rng = random.Random(seed)
+    user_id = db_conn.execute(
+        "INSERT INTO users (email, password_hash) VALUES (?, ?)", (f"bench-{uuid.uuid4().hex[:8]}@example.com", 'x')
+    ).lastrowid
+    first_order_id = (db_conn.execute("SELECT COALESCE(MAX(id), 0) FROM orders").fetchone()[0]) + 1
+    db_conn.executemany("INSERT INTO orders (id, user_id, status, total_amount) VALUES (?, ?, 'paid', 0)",
+                        ((first_order_id + index, user_id) for index in range(order_count)))
+
+    def lines():
+        for order_id in range(first_order_id, first_order_id + order_count):
+            for product_id in rng.choices(product_ids, k=rng.randint(1, max_lines)):
+                yield (order_id, product_id, 1, 10.0, 10.0)
+
+    db_conn.executemany("INSERT INTO order_items (order_id, product_id, quantity, unit_price, total_price) VALUES (?, ?, ?, ?, ?)",
+                        lines())
+    db_conn.commit()
+
+
+@bench_cli.command('recommendations')
+@click.option('--products', 'product_count', default=2000, show_default=True, help='Catalog size.')
+@click.option('--orders', 'order_count', default=500000, show_default=True, help='Orders counted by the full refresh.')
+@click.option('--new-orders', 'new_order_count', default=5000, show_default=True, help='Orders counted by the incremental refresh.')
+@with_appcontext
+def bench_recommendations_command(product_count, order_count, new_order_count):
+    """"Frequently bought together": full co-occurrence refresh, then an incremental one over new orders only."""
+    app = current_app._get_current_object()
+    with ScratchDatabase(app) as db:
+        seed_bench_catalog(db, product_count)
+        product_ids = [row[0] for row in db.execute("SELECT id FROM products")]
+        weights = [1.0 / (rank + 1) for rank in range(len(product_ids))] # Zipf-like popularity
+        popular_ids = random.Random(7).choices(product_ids, weights=weights, k=len(product_ids) * 20)
+        seed_bench_orders(db, order_count, popular_ids)
+        line_count = db.execute("SELECT COUNT(*) FROM order_items").fetchone()[0]
+        click.echo(f"{order_count} orders, {line_count} order lines over {product_count} products")
+
+        start = time.perf_counter()
+        stats = refresh_recommendations(db, full=True)
+        report_timing('full refresh', time.perf_counter() - start, line_count, unit='line')
+        click.echo(f"  {db.execute('SELECT COUNT(*) FROM product_pair_counts').fetchone()[0]} product pairs, "
+                   f"top N rebuilt for {stats['products']} products")
+
+        seed_bench_orders(db, new_order_count, popular_ids, seed=43)
+        start = time.perf_counter()
+        stats = refresh_recommendations(db)
+        report_timing('incremental refresh', time.perf_counter() - start, stats['orders'], unit='order')
+        click.echo(f"  top N rebuilt for {stats['products']} products")
+
+
+def _place_order_line_by_line(db, user_id, cart_items):
+    """The previous checkout shape: a SELECT, an INSERT, a stock update and a movement per cart line."""
+    total, items = 0.0, []
+    for item in cart_items:
+        if item.get('variantId'):
+            row = db.execute("SELECT price, aggregate_stock_quantity FROM product_weight_options WHERE id = ? AND product_id = ?",
+                             (item['variantId'], item['id'])).fetchone()
+        else:
+            row = db.execute("SELECT base_price, aggregate_stock_quantity FROM products WHERE id = ?", (item['id'],)).fetchone()
+        if row is None or row[1] < item['quantity']:
+            raise ValueError("Stock insuffisant")
+        total += row[0] * item['quantity']
+        items.append((item, row[0]))
+    order_id = db.execute("INSERT INTO orders (user_id, status, total_amount) VALUES (?, 'paid', ?)", (user_id, total)).lastrowid
+    for item, price in items:
+        db.execute("""INSERT INTO order_items (order_id, product_id, variant_id, quantity, unit_price, total_price)
+                      VALUES (?, ?, ?, ?, ?, ?)""", (order_id, item['id'], item.get('variantId'), item['quantity'], price, price * item['quantity']))
+        if item.get('variantId'):
+            db.execute("UPDATE product_weight_options SET aggregate_stock_quantity = aggregate_stock_quantity - ? WHERE id = ?",
+                       (item['quantity'], item['variantId']))
+        else:
+            db.execute("UPDATE products SET aggregate_stock_quantity = aggregate_stock_quantity - ? WHERE id = ?", (item['quantity'], item['id']))
+        record_stock_movement(db, item['id'], 'sale', quantity_change=-item['quantity'], variant_id=item.get('variantId'),
+                              reason='order', related_order_id=order_id)
+    return order_id, total
+
+
+@bench_cli.command('checkout')
+@click.option('--lines', 'line_count', default=50, show_default=True, help='Cart lines per order (B2B-sized carts).')
+@click.option('--orders', 'order_count', default=200, show_default=True, help='Orders placed per variant.')
+@with_appcontext
+def bench_checkout_command(line_count, order_count):
+    """Checkout write path: a query per cart line vs. the set-based stage (checkout.py)."""
+    app = current_app._get_current_object()
+    shipping_address = {'line1': '1 rue de la Truffe', 'city': 'Périgueux', 'postal_code': '24000', 'country': 'FR'}
+    variants = (('line by line', lambda db, user_id, cart: _place_order_line_by_line(db, user_id, cart)),
+                ('set-based', lambda db, user_id, cart: place_order(db, user_id, cart, shipping_address)))
+    for label, place in variants:
+        with ScratchDatabase(app) as db: # Fresh database per variant, so table sizes are comparable
+            seed_bench_catalog(db, max(line_count * 20, 1000))
+            db.execute("UPDATE products SET aggregate_stock_quantity = 1000000")
+            # Half of each cart is weight options of variable-weight products
+            variable_ids = [row[0] for row in db.execute("SELECT id FROM products ORDER BY id LIMIT ?", (line_count * 10,))]
+            db.execute(f"UPDATE products SET type = 'variable_weight' WHERE id IN ({', '.join('?' for _ in variable_ids)})", variable_ids)
+            db.executemany("INSERT INTO product_weight_options (product_id, weight_grams, price, sku_suffix, aggregate_stock_quantity) VALUES (?, 100, 25.0, '100G', 1000000)",
+                           [(product_id,) for product_id in variable_ids])
+            user_id = db.execute("INSERT INTO users (email, password_hash) VALUES ('bench-checkout@example.com', 'x')").lastrowid
+            db.commit()
+            options = db.execute("SELECT product_id, id FROM product_weight_options").fetchall()
+            simple_ids = [row[0] for row in db.execute("SELECT id FROM products WHERE type = 'simple'")]
+            rng = random.Random(1)
+            carts = []
+            for _ in range(order_count):
+                cart = [{'id': product_id, 'variantId': option_id, 'quantity': rng.randint(1, 5)}
+                        for product_id, option_id in rng.sample(options, line_count // 2)]
+                cart += [{'id': product_id, 'quantity': rng.randint(1, 5)} for product_id in rng.sample(simple_ids, line_count - len(cart))]
+                carts.append(cart)
+
+            start = time.perf_counter()
+            for cart in carts:
+                place(db, user_id, cart)
+                db.commit()
+            report_timing(label, time.perf_counter() - start, order_count * line_count, unit='line')
+
+
+def _seed_contested_stock(db, stock):
+    """One simple product (with as many serialized items as units) and one weight option, `stock` units each."""
+    simple_id = create_bench_product(db, name='Tuber magnatum frais', aggregate_stock_quantity=stock)
+    insert_serialized_items_bulk(db, _serialized_items(simple_id, stock))
+    variable_id = create_bench_product(db, name='Truffe noire du Périgord', type='variable_weight', base_price=None)
+    option_id = db.execute(
+        """INSERT INTO product_weight_options (product_id, weight_grams, price, sku_suffix, aggregate_stock_quantity)
+           VALUES (?, 50, 180.0, '50G', ?)""", (variable_id, stock)
+    ).lastrowid
+    user_id = db.execute("INSERT INTO users (email, password_hash) VALUES ('bench-oversell@example.com', 'x')").lastrowid
+    db.commit()
+    return simple_id, variable_id, option_id, user_id
+
+
+def _check_no_oversell(db, label, stock, simple_id, option_id, serialized=True):
+    """Compares units sold with stock left; raises ClickException on oversell or lost stock."""
+    sold_simple, sold_option = db.execute(
+        """SELECT COALESCE(SUM(CASE WHEN variant_id IS NULL AND product_id = ? THEN quantity END), 0),
+                  COALESCE(SUM(CASE WHEN variant_id = ? THEN quantity END), 0)
+           FROM order_items""", (simple_id, option_id)
+    ).fetchone()
+    left_simple = db.execute("SELECT aggregate_stock_quantity FROM products WHERE id = ?", (simple_id,)).fetchone()[0]
+    left_option = db.execute("SELECT aggregate_stock_quantity FROM product_weight_options WHERE id = ?", (option_id,)).fetchone()[0]
+    items = dict(db.execute("SELECT status, COUNT(*) FROM serialized_inventory_items GROUP BY status").fetchall())
+    live_holds = db.execute("SELECT COUNT(*) FROM stock_reservations WHERE status = 'held'").fetchone()[0]
+    click.echo(f"  product: sold {sold_simple}/{stock}, left {left_simple}; option: sold {sold_option}/{stock}, left {left_option}; "
+               f"serialized items: {items}; live holds: {live_holds}")
+
+    problems = []
+    for name, sold, left in (('product', sold_simple, left_simple), ('option', sold_option, left_option)):
+        if sold > stock or left < 0:
+            problems.append(f"{name} oversold by {max(sold - stock, -left)}")
+        elif sold + left != stock:
+            problems.append(f"{name}: {stock - sold - left} unit(s) neither sold nor in stock")
+    if serialized and items.get('sold', 0) != sold_simple:
+        problems.append(f"{items.get('sold', 0)} serialized items sold for {sold_simple} units")
+    if serialized and (items.get('allocated', 0) or live_holds):
+        problems.append("holds left behind")
+    if problems:
+        raise click.ClickException(f"{label}: {'; '.join(problems)}")
+
+
+def _run_buyers(app, connection_pool, thread_count, attempts, buy):
+    """Calls buy(conn, index) for every attempt from thread_count threads. Returns (elapsed seconds, outcome counts)."""
+    outcomes = collections.Counter()
+    lock = threading.Lock()
+    indexes = iter(range(attempts))
+
+    def worker():
+        conn = connection_pool.acquire() if connection_pool else None
+        try:
+            with app.app_context():
+                while True:
+                    with lock:
+                        index = next(indexes, None)
+                    if index is None:
+                        return
+                    try:
+                        outcome = buy(conn, index)
+                    except ValueError: # InsufficientStockError, or the old path's own stock check
+                        outcome = 'sold out'
+                    except sqlite3.OperationalError:
+                        outcome = 'database locked'
+                    with lock:
+                        outcomes[outcome] += 1
+        finally:
+            if conn is not None:
+                connection_pool.release(conn)
+
+    threads = [threading.Thread(target=worker) for _ in range(thread_count)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, outcomes
+
+
+def _direct_buyer(place, user_id, carts):
+    """Each thread writes on its own connection (no write queue): SQLite's locking is all there is."""
+    def buy(conn, index):
+        try:
+            place(conn, user_id, carts[index])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return 'ordered'
+    return buy
+
+
+@bench_cli.command('oversell')
+@click.option('--threads', 'thread_count', default=16, show_default=True, help='Concurrent buyers.')
+@click.option('--stock', default=100, show_default=True, help='Units of the contested product and of the contested weight option.')
+@click.option('--attempts', default=400, show_default=True, help='Checkout attempts per variant.')
+@click.option('--hold-ttl', default=1, show_default=True, help='Seconds before an abandoned hold expires (holds variant).')
+@with_appcontext
+def bench_oversell_command(thread_count, stock, attempts, hold_ttl):
+    """
+    Concurrent checkouts of scarce stock: fails unless every variant using conditional
+    decrements sells exactly what was in stock, and reports throughput.
+    """
+    app = current_app._get_current_object()
+    shipping_address = {'line1': '1 rue de la Truffe', 'city': 'Périgueux', 'postal_code': '24000', 'country': 'FR'}
+
+    def carts_for(simple_id, variable_id, option_id):
+        rng = random.Random(7)
+        carts = []
+        for _ in range(attempts):
+            simple_line = {'id': simple_id, 'quantity': rng.randint(1, 3)}
+            option_line = {'id': variable_id, 'variantId': option_id, 'quantity': rng.randint(1, 2)}
+            carts.append(rng.choice(([simple_line], [option_line], [simple_line, option_line])))
+        return carts
+
+    hold_limits = {key: app.config.get(key) for key in ('STOCK_RESERVATION_MAX_HOLDS_PER_USER', 'STOCK_RESERVATION_MAX_UNITS_PER_USER')}
+    for label in ('read-check-write (old)', 'conditional, direct', 'conditional, write queue', 'holds, write queue'):
+        scratch = ScratchDatabase(app)
+        with scratch as db:
+            simple_id, variable_id, option_id, user_id = _seed_contested_stock(db, stock)
+            carts = carts_for(simple_id, variable_id, option_id)
+            thread_pool = scratch.create_pool(thread_count)
+            write_queue = WriteQueue(app, scratch.create_pool(1))
+            stop_sweeper = threading.Event()
+            sweeper = None
+            try:
+                if label == 'read-check-write (old)':
+                    elapsed, outcomes = _run_buyers(app, thread_pool, thread_count, attempts,
+                                                    _direct_buyer(_place_order_line_by_line, user_id, carts))
+                elif label == 'conditional, direct':
+                    elapsed, outcomes = _run_buyers(app, thread_pool, thread_count, attempts, _direct_buyer(
+                        lambda conn, user_id, cart: place_order(conn, user_id, cart, shipping_address), user_id, carts))
+                elif label == 'conditional, write queue':
+                    def buy(conn, index):
+                        write_queue.submit(place_order, user_id, carts[index], shipping_address).result(timeout=30)
+                        return 'ordered'
+
+                    elapsed, outcomes = _run_buyers(app, None, thread_count, attempts, buy)
+                else:
+                    # Half the holds become orders, a quarter are released, a quarter abandoned to the sweeper.
+                    def buy(conn, index):
+                        hold_token = write_queue.submit(reserve_cart, user_id, carts[index], hold_ttl).result(timeout=30)[0]
+                        if index % 4 < 2:
+                            write_queue.submit(place_order, user_id, [], shipping_address, hold_token=hold_token).result(timeout=30)
+                            return 'ordered'
+                        if index % 4 == 2:
+                            write_queue.submit(release_hold, hold_token).result(timeout=30)
+                            return 'released'
+                        return 'abandoned'
+
+                    def sweep():
+                        with app.app_context():
+                            while not stop_sweeper.wait(0.1):
+                                write_queue.submit(release_expired_holds).result(timeout=30)
+
+                    # Every buyer is the same bench account: lift the per-account hold limits.
+                    app.config.update(STOCK_RESERVATION_MAX_HOLDS_PER_USER=attempts, STOCK_RESERVATION_MAX_UNITS_PER_USER=attempts * 5)
+                    sweeper = threading.Thread(target=sweep)
+                    sweeper.start()
+                    elapsed, outcomes = _run_buyers(app, None, thread_count, attempts, buy)
+                    stop_sweeper.set()
+                    sweeper.join()
+                    time.sleep(hold_ttl + 1.5) # Let the last abandoned holds expire (timestamps have 1 s resolution)
+                    write_queue.submit(release_expired_holds).result(timeout=30)
+            finally:
+                app.config.update(hold_limits)
+                stop_sweeper.set()
+                write_queue.stop()
+                write_queue.pool.close_all()
+                thread_pool.close_all()
+
+            click.echo(f"{label:<28} {attempts / elapsed:8.0f} checkouts/s  {dict(outcomes)}")
+            if label == 'read-check-write (old)':
+                try:
+                    _check_no_oversell(db, label, stock, simple_id, option_id, serialized=False)
+                except click.ClickException as e:
+                    click.echo(f"  expected with the old shape: {e.message}")
+            else:
+                _check_no_oversell(db, label, stock, simple_id, option_id)
+
+
+def register_bench_commands(app):
+    """Registers the `flask bench` command group."""
+    app.cli.add_command(bench_cli)
@@ -0,0 +1,40 @@
+from .database import query_db
+
+# --- Category Tree ---
+# Helpers over the category_closure table (migration 0006), which triggers keep in sync
+# with categories.parent_id.
+
+
+def subtree_condition(category_column='p.category_id'):
+    """
+    SQL condition (one parameter: the root category's slug) matching rows whose category is
+    that category or any of its descendants. Answered from the closure primary key.
+    """
+    return f"""{category_column} IN (
+        SELECT cc.descendant_id FROM category_closure cc
+        JOIN categories root ON root.id = cc.ancestor_id
+        WHERE root.slug = ?
+    )"""
+
+
+def is_in_subtree(db_conn, category_id, root_id):
+    """True if category_id is root_id itself or one of its descendants."""
+    row = query_db(
+        "SELECT 1 FROM category_closure WHERE ancestor_id = ? AND descendant_id = ?",
+        [root_id, category_id], db_conn=db_conn, one=True
+    )
+    return row is not None
+
+
+def build_category_tree(categories):
+    """
+    Nests a flat list of category dicts (with id and parent_id) into a forest: each dict
+    gets a 'children' list, and the roots are returned in the input order.
+    Categories whose parent is missing from the list are treated as roots.
+    """
+    by_id = {category['id']: dict(category, children=[]) for category in categories}
+    roots = []
+    for category in by_id.values():
+        parent = by_id.get(category['parent_id'])
+        (parent['children'] if parent is not None else roots).append(category)
+    return roots
@@ -0,0 +1,220 @@
+from flask import current_app
+from .database import record_stock_movements_bulk
+from .order_events import enqueue_order_event
+from .stock_reservations import InsufficientStockError, convert_hold, create_hold, decrement_stock, load_hold, sell_serialized_items
+
+# --- Checkout ---
+# Order placement as a set-based stage instead of a query per cart line:
+#   1. normalize_cart_lines: parse and merge the cart (the same product/option twice counts once)
+#   2. load_checkout_catalog: every referenced product and weight option in one query
+#   3. validate_cart_lines: prices, activity and stock checked in memory
+#   4. place_order: conditional stock decrements (stock_reservations.py), then the order row,
+#      order items and stock movements with one executemany each, and the 'order_created'
+#      event whose worker issues the invoice and confirmation e-mail (order_events.py)
+# The in-memory stock check only produces a friendly early error; the conditional decrement is
+# what guarantees no oversell. With a hold token (reserve_cart), the order is placed from the
+# hold's lines, whose stock is already set aside. Prices always come from the database; the
+# cart's are only compared.
+
+CHECKOUT_MAX_LINES = 200 # Distinct products/options per order; keeps the catalog query under the bound-parameter limit
+CHECKOUT_MAX_LINE_QUANTITY = 999 # Units of one product/option per order or hold
+PRICE_TOLERANCE = 0.01
+
+
+def normalize_cart_lines(cart_items):
+    """
+    Parses cart items ({id, quantity, price?, name?, variantId | variant_option_id?}) into
+    lines keyed by (product_id, variant_id), summing quantities of repeated entries.
+    Raises ValueError for malformed items.
+    """
+    lines = {}
+    for item in cart_items:
+        if not isinstance(item, dict):
+            raise ValueError("Article de panier invalide.")
+        try:
+            product_id = int(item.get('id'))
+            quantity = int(item.get('quantity', 0))
+            variant_id = item.get('variant_option_id', item.get('variantId'))
+            variant_id = int(variant_id) if variant_id not in (None, '') else None
+            client_price = float(item['price']) if item.get('price') is not None else None
+        except (TypeError, ValueError):
+            raise ValueError(f"Article de panier invalide : {item.get('name') or item.get('id')}.")
+        if quantity <= 0:
+            raise ValueError(f"Quantité invalide pour {item.get('name') or product_id}.")
+
+        key = (product_id, variant_id)
+        line = lines.get(key)
+        if line is None:
+            lines[key] = {'product_id': product_id, 'variant_id': variant_id, 'quantity': quantity,
+                          'name': item.get('name'), 'client_price': client_price}
+        else:
+            line['quantity'] += quantity
+        if lines[key]['quantity'] > CHECKOUT_MAX_LINE_QUANTITY:
+            raise ValueError(f"Quantité limitée à {CHECKOUT_MAX_LINE_QUANTITY} pour {item.get('name') or product_id}.")
+    if len(lines) > CHECKOUT_MAX_LINES:
+        raise ValueError(f"Le panier ne peut pas contenir plus de {CHECKOUT_MAX_LINES} articles différents.")
+    return list(lines.values())
+
+
+def load_checkout_catalog(db, lines):
+    """
+    Loads every product referenced by the cart, joined to the referenced weight options, in one
+    query. Returns (products by id, options by (product_id, variant_id)).
+    """
+    product_ids = list(dict.fromkeys(line['product_id'] for line in lines))
+    variant_ids = list(dict.fromkeys(line['variant_id'] for line in lines if line['variant_id'] is not None))
+    option_join = f"AND wo.id IN ({', '.join('?' for _ in variant_ids)})" if variant_ids else "AND 0"
+    rows = db.execute(
+        f"""SELECT p.id AS product_id, p.name, p.type, p.base_price, p.is_active, p.aggregate_stock_quantity,
+                   wo.id AS variant_id, wo.weight_grams, wo.price AS variant_price,
+                   wo.is_active AS variant_is_active, wo.aggregate_stock_quantity AS variant_stock_quantity
+            FROM products p
+            LEFT JOIN product_weight_options wo ON wo.product_id = p.id {option_join}
+            WHERE p.id IN ({', '.join('?' for _ in product_ids)})""",
+        variant_ids + product_ids
+    ).fetchall()
+    products, options = {}, {}
+    for row in rows:
+        products[row['product_id']] = row
+        if row['variant_id'] is not None:
+            options[(row['product_id'], row['variant_id'])] = row
+    return products, options
+
+
+def validate_cart_lines(lines, products, options, check_stock=True):
+    """
+    Checks every line against the loaded catalog and prices it from the database.
+    Returns the order items (dicts ready for insertion) and the order total.
+    :param check_stock: False for held lines, whose stock has already been taken out.
+    Raises ValueError naming the first offending line (InsufficientStockError for stock).
+    """
+    order_items, total_amount, price_mismatches = [], 0.0, []
+    for line in lines:
+        label = line['name'] or f"#{line['product_id']}"
+        product = products.get(line['product_id'])
+        if product is None or not product['is_active']:
+            raise ValueError(f"Produit {label} (ID: {line['product_id']}) non trouvé ou indisponible.")
+        label = line['name'] or product['name']
+
+        if line['variant_id'] is not None:
+            option = options.get((line['product_id'], line['variant_id']))
+            if option is None or not option['variant_is_active']:
+                raise ValueError(f"Option de produit {label} (Variante ID: {line['variant_id']}) non trouvée.")
+            unit_price, stock = option['variant_price'], option['variant_stock_quantity'] or 0
+            variant_description = f"{option['weight_grams']:g} g"
+        else:
+            if product['type'] == 'variable_weight' or product['base_price'] is None:
+                raise ValueError(f"Veuillez choisir un poids pour {label}.")
+            unit_price, stock = product['base_price'], product['aggregate_stock_quantity'] or 0
+            variant_description = None
+
+        if check_stock and stock < line['quantity']:
+            raise InsufficientStockError(f"Stock insuffisant pour {label}. Demandé: {line['quantity']}, Disponible: {stock}")
+        if line['client_price'] is not None and abs(unit_price - line['client_price']) > PRICE_TOLERANCE:
+            price_mismatches.append(f"{line['product_id']}/{line['variant_id']}: {line['client_price']} -> {unit_price}")
+
+        line_total = round(unit_price * line['quantity'], 2)
+        total_amount += line_total
+        order_items.append({
+            'product_id': line['product_id'],
+            'variant_id': line['variant_id'],
+            'quantity': line['quantity'],
+            'unit_price': unit_price,
+            'total_price': line_total,
+            'product_name': product['name'],
+            'variant_description': variant_description,
+        })
+
+    if price_mismatches:
+        current_app.logger.warning(f"Discordance de prix panier/base (prix de la base utilisés) : {'; '.join(price_mismatches)}")
+    return order_items, round(total_amount, 2)
+
+
+def _validated_cart(db, cart_items):
+    lines = normalize_cart_lines(cart_items)
+    if not lines:
+        raise ValueError("Panier vide ou invalide.")
+    products, options = load_checkout_catalog(db, lines)
+    return validate_cart_lines(lines, products, options)
+
+
+def _stock_lines(order_items):
+    return [{'product_id': item['product_id'], 'variant_id': item['variant_id'], 'quantity': item['quantity'],
+             'name': item['product_name']} for item in order_items]
+
+
+def reserve_cart(db, user_id, cart_items, ttl_seconds=None):
+    """
+    Write job: validates the cart and holds its stock (see stock_reservations.create_hold).
+    Returns (hold_token, expires_at, order_items, total_amount).
+    Raises ValueError for invalid carts, InsufficientStockError when stock is short.
+    """
+    order_items, total_amount = _validated_cart(db, cart_items)
+    hold_token, expires_at = create_hold(db, user_id, _stock_lines(order_items), ttl_seconds=ttl_seconds)
+    return hold_token, expires_at, order_items, total_amount
+
+
+def place_order(db, user_id, cart_items, shipping_address, internal_note=None, status='paid', payment_method=None,
+                hold_token=None, customer_email=None, customer_name=None):
+    """
+    Write job (see write_queue.run_write): validates the cart, takes its stock with conditional
+    decrements and creates the order, its items, the stock movements and its 'order_created' event.
+    Returns (order_id, total_amount).
+    :param shipping_address: Dict with line1, line2, city, postal_code, country (also used for billing).
+    :param hold_token: A live hold of this user (reserve_cart); the order is then exactly the held
+                       lines and cart_items is ignored.
+    :param customer_email: Where the worker sends the confirmation (with customer_name for the invoice).
+    Raises ValueError for invalid carts or expired holds, InsufficientStockError when stock is
+    short; nothing is written in those cases.
+    """
+    hold_lines = None
+    if hold_token:
+        hold_lines = load_hold(db, hold_token, user_id)
+        if not hold_lines:
+            raise ValueError("Votre réservation a expiré. Veuillez valider votre panier à nouveau.")
+        lines = [{'product_id': line['product_id'], 'variant_id': line['variant_id'], 'quantity': line['quantity'],
+                  'name': None, 'client_price': None} for line in hold_lines]
+        products, options = load_checkout_catalog(db, lines)
+        order_items, total_amount = validate_cart_lines(lines, products, options, check_stock=False)
+    else:
+        order_items, total_amount = _validated_cart(db, cart_items)
+        decrement_stock(db, _stock_lines(order_items))
+
+    address = [shipping_address.get(key) for key in ('line1', 'line2', 'city', 'postal_code', 'country')]
+    cursor = db.execute(
+        """INSERT INTO orders (user_id, status, total_amount, payment_method,
+                               shipping_address_line1, shipping_address_line2, shipping_city, shipping_postal_code, shipping_country,
+                               billing_address_line1, billing_address_line2, billing_city, billing_postal_code, billing_country,
+                               notes_internal)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        [user_id, status, total_amount, payment_method, *address, *address, internal_note]
+    )
+    order_id = cursor.lastrowid
+
+    db.executemany(
+        """INSERT INTO order_items (order_id, product_id, variant_id, quantity, unit_price, total_price, product_name, variant_description)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+        [(order_id, item['product_id'], item['variant_id'], item['quantity'], item['unit_price'],
+          item['total_price'], item['product_name'], item['variant_description']) for item in order_items]
+    )
+    order_item_ids = {
+        (row['product_id'], row['variant_id']): row['id']
+        for row in db.execute("SELECT id, product_id, variant_id FROM order_items WHERE order_id = ?", (order_id,))
+    }
+    if hold_lines is not None:
+        convert_hold(db, hold_lines, order_id, {
+            (item['product_id'], item['variant_id']): (order_item_ids[(item['product_id'], item['variant_id'])], item['unit_price'])
+            for item in order_items
+        })
+    else:
+        sell_serialized_items(db, (
+            dict(item, order_item_id=order_item_ids[(item['product_id'], item['variant_id'])]) for item in order_items
+        ))
+    record_stock_movements_bulk(db, (
+        {'product_id': item['product_id'], 'variant_id': item['variant_id'], 'movement_type': 'sale',
+         'quantity_change': -item['quantity'], 'reason': 'order', 'related_order_id': order_id,
+         'notes': f"Vente pour commande #{order_id}"}
+        for item in order_items
+    ))
+    enqueue_order_event(db, order_id, 'order_created', {'customer_email': customer_email, 'customer_name': customer_name})
+    return order_id, total_amount
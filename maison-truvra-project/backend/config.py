@@ -11,7 +11,62 @@ class Config:
     # Database configuration
     # Assuming DATABASE_PATH will be set in instance or environment-specific config
     DATABASE_PATH = os.environ.get('DATABASE_PATH', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'instance', 'maison_truvra.sqlite3'))
-    
+
+    # Connection pool and SQLite tuning (applied to every pooled connection)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8)) # Connections per worker process
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10.0)) # Seconds to wait for a free connection
+    DB_POOL_HEALTH_CHECK_INTERVAL = float(os.environ.get('DB_POOL_HEALTH_CHECK_INTERVAL', 30.0)) # Ping connections idle longer than this
+    DB_BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000))
+    DB_JOURNAL_MODE = os.environ.get('DB_JOURNAL_MODE', 'WAL')
+    DB_SYNCHRONOUS = os.environ.get('DB_SYNCHRONOUS', 'NORMAL') # NORMAL is durable enough with WAL
+    DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 256 * 1024 * 1024)) # Bytes, 0 disables memory-mapped I/O
+    DB_CACHE_SIZE = int(os.environ.get('DB_CACHE_SIZE', -20000)) # Negative values are KiB (here ~20 MB per connection)
+    # Apply pending schema migrations at startup. Disable to require an explicit 'flask db upgrade'.
+    DB_AUTO_MIGRATE = os.environ.get('DB_AUTO_MIGRATE', 'true').lower() in ('true', '1', 't')
+
+    # Query profiling (opt-in): X-DB-Queries / X-DB-Time headers, N+1 detection, admin report
+    DB_PROFILING_ENABLED = os.environ.get('DB_PROFILING_ENABLED', 'false').lower() in ('true', '1', 't')
+    DB_N_PLUS_ONE_THRESHOLD = int(os.environ.get('DB_N_PLUS_ONE_THRESHOLD', 5)) # Same fingerprint this many times in one request
+    DB_PROFILER_HISTORY_SIZE = int(os.environ.get('DB_PROFILER_HISTORY_SIZE', 200)) # Recent requests kept per worker
+    # Slow-query log: statements at or above this many milliseconds are recorded (0 disables it).
+    DB_SLOW_QUERY_MS = float(os.environ.get('DB_SLOW_QUERY_MS', 200))
+    DB_SLOW_QUERY_BUFFER_SIZE = int(os.environ.get('DB_SLOW_QUERY_BUFFER_SIZE', 200)) # Entries kept in memory per worker
+    DB_SLOW_QUERY_PERSIST = os.environ.get('DB_SLOW_QUERY_PERSIST', 'false').lower() in ('true', '1', 't') # Also write to slow_queries
+
+    # Single-writer queue: route writes through one writer thread per worker with group commit
+    DB_WRITE_QUEUE_ENABLED = os.environ.get('DB_WRITE_QUEUE_ENABLED', 'false').lower() in ('true', '1', 't')
+    DB_WRITE_QUEUE_MAX_SIZE = int(os.environ.get('DB_WRITE_QUEUE_MAX_SIZE', 1000)) # Pending jobs before submitters block
+    DB_WRITE_QUEUE_BATCH_SIZE = int(os.environ.get('DB_WRITE_QUEUE_BATCH_SIZE', 64)) # Jobs per group commit
+    DB_WRITE_QUEUE_BATCH_WAIT_MS = float(os.environ.get('DB_WRITE_QUEUE_BATCH_WAIT_MS', 2.0)) # How long to wait for a batch to fill
+    DB_WRITE_QUEUE_SUBMIT_TIMEOUT = float(os.environ.get('DB_WRITE_QUEUE_SUBMIT_TIMEOUT', 5.0)) # Seconds before a full queue rejects (503)
+    DB_WRITE_QUEUE_RESULT_TIMEOUT = float(os.environ.get('DB_WRITE_QUEUE_RESULT_TIMEOUT', 30.0)) # Seconds a route waits for its job
+    CATALOG_VERSION_CACHE_SECONDS = float(os.environ.get('CATALOG_VERSION_CACHE_SECONDS', 1.0)) # In-process cache of the catalog ETag version
+    PRODUCT_DETAIL_CACHE_ENABLED = os.environ.get('PRODUCT_DETAIL_CACHE_ENABLED', 'true').lower() in ('true', '1', 't')
+    PRODUCT_DETAIL_CACHE_MAX_ENTRIES = int(os.environ.get('PRODUCT_DETAIL_CACHE_MAX_ENTRIES', 1000)) # Assembled product pages per worker
+    PRODUCT_DETAIL_CACHE_TTL_SECONDS = float(os.environ.get('PRODUCT_DETAIL_CACHE_TTL_SECONDS', 300.0))
+    FACET_CACHE_MAX_ENTRIES = int(os.environ.get('FACET_CACHE_MAX_ENTRIES', 256)) # Grouped facet counts per worker; 0 disables
+    RECOMMENDATIONS_TOP_N = int(os.environ.get('RECOMMENDATIONS_TOP_N', 10)) # "Frequently bought together" neighbours kept per product
+    RECOMMENDATIONS_BATCH_ORDERS = int(os.environ.get('RECOMMENDATIONS_BATCH_ORDERS', 20000)) # Order ids counted per transaction by `flask recommendations refresh`
+    FEED_SITE_URL = os.environ.get('FEED_SITE_URL', 'https://www.maisontruvra.com') # Public storefront URL used for product and image links in marketplace feeds
+    FEED_TITLE = os.environ.get('FEED_TITLE', 'Maison Trüvra')
+    FEED_BATCH_SIZE = int(os.environ.get('FEED_BATCH_SIZE', 500)) # Products fetched (fetchmany) and rendered per batch
+    ORDER_EXPORT_BATCH_SIZE = int(os.environ.get('ORDER_EXPORT_BATCH_SIZE', 1000)) # Order lines fetched (fetchmany) per batch by the accounting export
+    STOCK_RESERVATION_TTL_SECONDS = int(os.environ.get('STOCK_RESERVATION_TTL_SECONDS', 900)) # How long a checkout hold keeps stock out of sale
+    STOCK_RESERVATION_SWEEP_LIMIT = int(os.environ.get('STOCK_RESERVATION_SWEEP_LIMIT', 200)) # Expired hold lines released by each new hold (the CLI sweeps them all)
+    STOCK_RESERVATION_MAX_HOLDS_PER_USER = int(os.environ.get('STOCK_RESERVATION_MAX_HOLDS_PER_USER', 3)) # Live holds one account may have at a time
+    STOCK_RESERVATION_MAX_UNITS_PER_USER = int(os.environ.get('STOCK_RESERVATION_MAX_UNITS_PER_USER', 100)) # Units one account may keep out of sale across its live holds
+    IDEMPOTENCY_KEY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_KEY_TTL_SECONDS', 86400)) # How long a stored response is replayed for its Idempotency-Key
+    IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', 60)) # An unfinished request's claim is considered abandoned after this
+    IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', 10.0)) # How long a duplicate waits for the first request's result before a 409
+    ORDER_EVENTS_WORKER_ENABLED = os.environ.get('ORDER_EVENTS_WORKER_ENABLED', 'true').lower() in ('true', '1', 't') # In-process post-order worker; turn off when running `flask order-events run` instead
+    ORDER_EVENTS_BATCH_SIZE = int(os.environ.get('ORDER_EVENTS_BATCH_SIZE', 20)) # Events claimed per poll
+    ORDER_EVENTS_POLL_SECONDS = float(os.environ.get('ORDER_EVENTS_POLL_SECONDS', 5.0)) # Idle poll interval (checkouts wake the worker immediately)
+    ORDER_EVENTS_LEASE_SECONDS = int(os.environ.get('ORDER_EVENTS_LEASE_SECONDS', 300)) # A claimed event is retried by any worker after this
+    ORDER_EVENTS_MAX_ATTEMPTS = int(os.environ.get('ORDER_EVENTS_MAX_ATTEMPTS', 8)) # Then the event is dead-lettered
+    ORDER_EVENTS_RETRY_BASE_SECONDS = int(os.environ.get('ORDER_EVENTS_RETRY_BASE_SECONDS', 30)) # First retry delay, doubled each attempt (capped at 1h)
+    ORDER_INVOICE_PREFIX = os.environ.get('ORDER_INVOICE_PREFIX', 'FAC') # Web order invoices are numbered <prefix>-<order id>
+    ORDER_INVOICE_DUE_DAYS = int(os.environ.get('ORDER_INVOICE_DUE_DAYS', 0)) # Web orders are paid at checkout
+
     # JWT Extended Settings
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your_default_jwt_secret_key_please_change_me') # Load from env
     JWT_TOKEN_LOCATION = ['headers', 'cookies'] # Allow JWT in headers and cookies
@@ -70,6 +125,11 @@ class Config:
         "vat_number": os.environ.get('INVOICE_COMPANY_VAT', "FRXX123456789"),
         "logo_path": os.environ.get('INVOICE_COMPANY_LOGO_PATH', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static_assets', 'logos', 'maison_truvra_invoice_logo.png'))
     }
+
+    # FEC accounting export (fec_export.py)
+    FEC_SIREN = os.environ.get('FEC_SIREN', '') # 9-digit SIREN for the FEC file name; derived from the company VAT number when empty
+    FEC_VAT_RATE = float(os.environ.get('FEC_VAT_RATE', 5.5)) # VAT rate (%) included in sale prices; 5.5 is the reduced rate on foodstuffs
+    FEC_BATCH_SIZE = int(os.environ.get('FEC_BATCH_SIZE', 2000)) # Invoices fetched (fetchmany) per batch
     
     # API Version
     API_VERSION = "v1"
@@ -103,6 +163,7 @@ class TestingConfig(Config):
     # Disable CSRF protection for testing forms if applicable and handled by test client
     # WTF_CSRF_ENABLED = False
     MAIL_SUPPRESS_SEND = True # Do not send emails during tests
+    ORDER_EVENTS_WORKER_ENABLED = False # Tests drive the post-order pipeline explicitly (OrderEventWorker.run_once)
 
 
 class ProductionConfig(Config):
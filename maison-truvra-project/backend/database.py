@@ -5,27 +5,60 @@ from flask import current_app, g
 from flask.cli import with_appcontext
 from werkzeug.security import generate_password_hash
 import datetime # Added for populate_initial_data and record_stock_movement
+import threading
+from .db_pool import SQLiteConnectionPool
+from .db_profiler import ProfilingConnection, uses_profiling_connections
+from .migrations import (
+    MigrationError, apply_migrations, get_current_version, get_migration_history, latest_version
+)
 
 # --- Database Initialization and Connection Management ---
 
+_pool_lock = threading.Lock()
+
+def create_connection_pool(app, size=None):
+    """Builds a connection pool from the app's DB_* settings (size defaults to DB_POOL_SIZE)."""
+    return SQLiteConnectionPool(
+        app.config['DATABASE_PATH'],
+        size=size if size is not None else app.config.get('DB_POOL_SIZE', 8),
+        timeout=app.config.get('DB_POOL_TIMEOUT', 10.0),
+        busy_timeout_ms=app.config.get('DB_BUSY_TIMEOUT_MS', 5000),
+        journal_mode=app.config.get('DB_JOURNAL_MODE', 'WAL'),
+        synchronous=app.config.get('DB_SYNCHRONOUS', 'NORMAL'),
+        mmap_size=app.config.get('DB_MMAP_SIZE', 0),
+        cache_size=app.config.get('DB_CACHE_SIZE', -2000),
+        health_check_interval=app.config.get('DB_POOL_HEALTH_CHECK_INTERVAL', 30.0),
+        connection_factory=ProfilingConnection if uses_profiling_connections(app) else sqlite3.Connection,
+        logger=app.logger
+    )
+
+def get_db_pool(app=None):
+    """
+    Returns the connection pool for the given (or current) app, creating it on first use.
+    A pool is rebuilt when the worker process changes (e.g. after a gunicorn fork),
+    since SQLite connections must never be shared across processes.
+    """
+    if app is None:
+        app = current_app._get_current_object()
+    pool = app.extensions.get('db_pool')
+    if pool is None or pool.pid != os.getpid():
+        with _pool_lock:
+            pool = app.extensions.get('db_pool')
+            if pool is None or pool.pid != os.getpid():
+                pool = create_connection_pool(app)
+                app.extensions['db_pool'] = pool
+                app.logger.info(f"Database connection pool created for {pool.db_path} (size {pool.size}, pid {pool.pid})")
+    return pool
+
 def get_db_connection():
     """
-    Establishes a new database connection or returns the existing one
-    for the current application context.
-    Stores the connection in Flask's 'g' object.
+    Checks out a pooled database connection for the current application context,
+    or returns the one already checked out.
+    Stores the connection in Flask's 'g' object; it is returned to the pool at teardown.
     """
     if 'db_conn' not in g or g.db_conn is None:
         try:
-            db_path = current_app.config['DATABASE_PATH']
-            # Ensure the database directory exists
-            os.makedirs(os.path.dirname(db_path), exist_ok=True)
-            g.db_conn = sqlite3.connect(
-                db_path,
-                detect_types=sqlite3.PARSE_DECLTYPES
-            )
-            g.db_conn.row_factory = sqlite3.Row  # Access columns by name
-            g.db_conn.execute("PRAGMA foreign_keys = ON;") # Enforce foreign key constraints
-            current_app.logger.info(f"Database connection established to {db_path}")
+            g.db_conn = get_db_pool().acquire()
         except sqlite3.Error as e:
             current_app.logger.error(f"Database connection error: {e}")
             raise
@@ -34,58 +67,79 @@ def get_db_connection():
             raise
     return g.db_conn
 
+def stream_from_pool(generate, *args, **kwargs):
+    """
+    Yields from generate(db_conn, *args, **kwargs) on a connection checked out for the stream's
+    own lifetime. Wrap streamed response bodies with it (inside stream_with_context): the
+    request's connection goes back to the pool at teardown, before the body is generated.
+    """
+    pool = get_db_pool()
+    db_conn = pool.acquire()
+    try:
+        yield from generate(db_conn, *args, **kwargs)
+    finally:
+        pool.release(db_conn)
+
 def close_db_connection(e=None):
     """
-    Closes the database connection at the end of the request.
+    Returns the database connection to the pool at the end of the request.
     This function is typically registered with Flask's app.teardown_appcontext.
     """
     db_conn = g.pop('db_conn', None)
     if db_conn is not None:
         try:
-            db_conn.close()
-            current_app.logger.info("Database connection closed.")
+            get_db_pool().release(db_conn)
         except Exception as e:
-            current_app.logger.error(f"Error closing database connection: {e}")
+            current_app.logger.error(f"Error returning database connection to the pool: {e}")
 
 def init_db_schema(db_conn=None):
     """
-    Initializes the database schema by executing SQL commands from 'schema.sql'.
+    Brings the database schema up to date by applying pending migrations
+    from backend/migrations (see migrations.apply_migrations).
     If db_conn is not provided, it will attempt to get one using the app context.
+    Returns the list of migration versions applied.
     """
-    connection_managed_internally = False
     if db_conn is None:
         if not current_app:
             raise RuntimeError("Application context is required to get a database connection.")
         db_conn = get_db_connection()
-        connection_managed_internally = True
 
     try:
-        schema_path = os.path.join(os.path.dirname(__file__), 'schema.sql')
-        if not os.path.exists(schema_path):
-            current_app.logger.error(f"Schema file not found at {schema_path}")
-            raise FileNotFoundError(f"Schema file not found: {schema_path}")
-
-        with open(schema_path, 'r') as f:
-            sql_script = f.read()
-        
-        cursor = db_conn.cursor()
-        cursor.executescript(sql_script)
-        db_conn.commit()
-        current_app.logger.info("Database schema initialized successfully from schema.sql.")
-    except sqlite3.Error as e:
+        applied = apply_migrations(db_conn, logger=current_app.logger)
+        if applied:
+            current_app.logger.info(f"Database schema migrated to version {applied[-1]}.")
+        return applied
+    except MigrationError as e:
         current_app.logger.error(f"Error initializing database schema: {e}")
-        if db_conn:
-            db_conn.rollback()
-        raise
-    except FileNotFoundError as e:
-        current_app.logger.error(f"Schema file error: {e}")
-        raise
-    except Exception as e:
-        current_app.logger.error(f"Unexpected error during schema initialization: {e}")
-        if db_conn and hasattr(db_conn, 'rollback'):
-            db_conn.rollback()
         raise
 
+def ensure_schema_current(db_conn=None):
+    """
+    Startup fast path: compares the recorded schema version with the latest migration.
+    When the database is current this is a single read; otherwise pending migrations are
+    applied (if DB_AUTO_MIGRATE is enabled) followed by populate_initial_data().
+    """
+    if db_conn is None:
+        db_conn = get_db_connection()
+
+    current_version = get_current_version(db_conn)
+    target_version = latest_version()
+    if current_version >= target_version:
+        current_app.logger.debug(f"Database schema is current (version {current_version}).")
+        return []
+
+    if not current_app.config.get('DB_AUTO_MIGRATE', True):
+        current_app.logger.warning(
+            f"Database schema is at version {current_version} but version {target_version} is available. "
+            "Run 'flask db upgrade' to apply pending migrations."
+        )
+        return []
+
+    applied = init_db_schema(db_conn)
+    if applied:
+        populate_initial_data(db_conn)
+    return applied
+
 def populate_initial_data(db_conn=None):
     """
     Populates the database with initial data, like an admin user and sample products.
@@ -145,18 +199,61 @@ def populate_initial_data(db_conn=None):
 @click.command('init-db') # Renamed from init-db-schema for broader scope
 @with_appcontext
 def init_db_command():
-    """Clear existing data (if any, by re-running schema) and create new tables, then populate initial data."""
+    """Apply all pending schema migrations, then populate initial data."""
     db_conn = get_db_connection() # Connection is managed by app context
     
     # Initialize schema first
-    init_db_schema(db_conn) # Pass the connection
-    click.echo('Initialized the database schema from schema.sql.')
+    applied = init_db_schema(db_conn) # Pass the connection
+    click.echo(f'Database schema is at version {get_current_version(db_conn)} ({len(applied)} migration(s) applied).')
     
     # Then populate initial data
     populate_initial_data(db_conn)
     click.echo('Populated initial data (if applicable).')
 
 
+@click.group('db')
+def db_cli():
+    """Database schema migration commands."""
+
+
+@db_cli.command('upgrade')
+@click.option('--to', 'target_version', type=int, default=None, help='Stop at this version instead of the latest.')
+@with_appcontext
+def db_upgrade_command(target_version):
+    """Apply pending schema migrations."""
+    db_conn = get_db_connection()
+    before = get_current_version(db_conn)
+    try:
+        applied = apply_migrations(db_conn, logger=current_app.logger, target_version=target_version)
+    except MigrationError as e:
+        raise click.ClickException(str(e))
+    if not applied:
+        click.echo(f'Database schema already current (version {before}).')
+        return
+    if before == 0:
+        populate_initial_data(db_conn)
+    click.echo(f'Migrated database schema from version {before} to {applied[-1]}.')
+
+
+@db_cli.command('current')
+@with_appcontext
+def db_current_command():
+    """Show the current and latest schema versions."""
+    db_conn = get_db_connection()
+    click.echo(f'Current schema version: {get_current_version(db_conn)} (latest available: {latest_version()})')
+
+
+@db_cli.command('history')
+@with_appcontext
+def db_history_command():
+    """List applied schema migrations."""
+    history = get_migration_history(get_db_connection())
+    if not history:
+        click.echo('No migrations applied.')
+    for entry in history:
+        click.echo(f"{entry['version']:04d}  {entry['name']:<40} {entry['applied_at']}")
+
+
 # --- Utility Functions (can be expanded) ---
 
 def query_db(query, args=(), one=False, commit=False, db_conn=None):
@@ -202,6 +299,7 @@ def query_db(query, args=(), one=False, commit=False, db_conn=None):
 def register_db_commands(app):
     """Registers database CLI commands with the Flask application."""
     app.cli.add_command(init_db_command) # Use the consolidated command
+    app.cli.add_command(db_cli) # flask db upgrade / current / history
     app.teardown_appcontext(close_db_connection)
     app.logger.info("Database commands registered and teardown context set.")
 
@@ -233,7 +331,7 @@ def record_stock_movement(db_conn, product_id, movement_type, quantity_change=No
     try:
         cursor = db_conn.cursor()
         cursor.execute(sql, args)
-        current_app.logger.info(f"Stock movement prepared for recording (pending commit): {movement_type} for product {product_id}")
+        current_app.logger.debug(f"Stock movement prepared for recording (pending commit): {movement_type} for product {product_id}")
         return cursor.lastrowid
     except sqlite3.Error as e:
         current_app.logger.error(f"Failed to prepare stock movement record: {e}. Query: {sql}, Args: {args}")
@@ -241,3 +339,111 @@ def record_stock_movement(db_conn, product_id, movement_type, quantity_change=No
     except Exception as e:
         current_app.logger.error(f"Unexpected error preparing stock movement record: {e}")
         raise
+
+
+# --- Bulk Writes ---
+# Receiving a large batch of serialized items used to cost two round trips (and an INFO log
+# line) per item. These helpers take iterables and use executemany on the caller's
+# connection; as with record_stock_movement, the caller owns the transaction.
+
+SQLITE_IN_CHUNK_SIZE = 500 # Stay well below SQLITE_MAX_VARIABLE_NUMBER on older builds
+
+STOCK_MOVEMENT_FIELDS = (
+    'product_id', 'variant_id', 'serialized_item_id', 'movement_type',
+    'quantity_change', 'weight_change_grams', 'reason',
+    'related_order_id', 'related_user_id', 'notes'
+)
+
+SERIALIZED_ITEM_FIELDS = (
+    'item_uid', 'product_id', 'variant_id', 'batch_number', 'production_date', 'expiry_date',
+    'cost_price', 'notes', 'status', 'qr_code_url', 'passport_url', 'label_url'
+)
+
+def record_stock_movements_bulk(db_conn, movements):
+    """
+    Records many stock movements with a single executemany.
+    :param movements: Iterable of dicts using record_stock_movement's keyword names
+                      (product_id and movement_type are required, the rest default to NULL).
+    :return: Number of movements recorded.
+    """
+    if db_conn is None:
+        raise ValueError("A database connection (db_conn) is required for record_stock_movements_bulk.")
+
+    sql = f"""
+        INSERT INTO stock_movements ({', '.join(STOCK_MOVEMENT_FIELDS)}, movement_date)
+        VALUES ({', '.join('?' for _ in STOCK_MOVEMENT_FIELDS)}, CURRENT_TIMESTAMP)
+    """
+    rows = [tuple(map(movement.get, STOCK_MOVEMENT_FIELDS)) for movement in movements]
+    if not rows:
+        return 0
+    try:
+        db_conn.executemany(sql, rows)
+    except sqlite3.Error as e:
+        current_app.logger.error(f"Failed to prepare {len(rows)} stock movement records: {e}")
+        raise
+    current_app.logger.info(f"{len(rows)} stock movements prepared for recording (pending commit).")
+    return len(rows)
+
+def insert_serialized_items_bulk(db_conn, items):
+    """
+    Inserts many serialized inventory items with a single executemany.
+    :param items: Iterable of dicts keyed by SERIALIZED_ITEM_FIELDS (status defaults to 'available').
+    :return: Dict mapping item_uid to the new row id, looked up in chunks afterwards
+             (executemany does not expose per-row lastrowid).
+    """
+    if db_conn is None:
+        raise ValueError("A database connection (db_conn) is required for insert_serialized_items_bulk.")
+
+    sql = f"""
+        INSERT INTO serialized_inventory_items ({', '.join(SERIALIZED_ITEM_FIELDS)})
+        VALUES ({', '.join("COALESCE(?, 'available')" if f == 'status' else '?' for f in SERIALIZED_ITEM_FIELDS)})
+    """
+    rows = [tuple(map(item.get, SERIALIZED_ITEM_FIELDS)) for item in items]
+    if not rows:
+        return {}
+    try:
+        db_conn.executemany(sql, rows)
+    except sqlite3.Error as e:
+        current_app.logger.error(f"Failed to insert {len(rows)} serialized items: {e}")
+        raise
+
+    item_uids = [row[0] for row in rows]
+    ids_by_uid = {}
+    for start in range(0, len(item_uids), SQLITE_IN_CHUNK_SIZE):
+        chunk = item_uids[start:start + SQLITE_IN_CHUNK_SIZE]
+        placeholders = ', '.join('?' for _ in chunk)
+        for row in db_conn.execute(
+            f"SELECT id, item_uid FROM serialized_inventory_items WHERE item_uid IN ({placeholders})", chunk
+        ):
+            ids_by_uid[row[1]] = row[0]
+    return ids_by_uid
+
+# --- Batched Child Loading ---
+# Listing pages used to fetch each parent's children (weight options, images, order lines)
+# with one query per parent: 20k orders meant 20k extra queries. load_child_rows collects
+# the parent ids and fetches all their children with one IN (...) query per
+# SQLITE_IN_CHUNK_SIZE ids, grouping the rows in Python.
+
+def load_child_rows(db_conn, sql, parent_ids, parent_key, params=()):
+    """
+    Fetches the child rows of many parents in as few queries as possible.
+    :param sql: Query containing an `IN ({placeholders})` clause on the parent column, e.g.
+                "SELECT * FROM product_images WHERE product_id IN ({placeholders}) ORDER BY product_id, id".
+                Rows keep the query's ORDER BY within each parent.
+    :param parent_ids: Iterable of parent ids (duplicates and None are ignored).
+    :param parent_key: Name of the result column holding the parent id.
+    :param params: Extra parameters bound after the ids (for conditions following the IN clause).
+    :return: Dict mapping every requested parent id to a (possibly empty) list of row dicts.
+    """
+    if db_conn is None:
+        raise ValueError("A database connection (db_conn) is required for load_child_rows.")
+
+    unique_ids = list(dict.fromkeys(parent_id for parent_id in parent_ids if parent_id is not None))
+    children = {parent_id: [] for parent_id in unique_ids}
+    for start in range(0, len(unique_ids), SQLITE_IN_CHUNK_SIZE):
+        chunk = unique_ids[start:start + SQLITE_IN_CHUNK_SIZE]
+        rows = query_db(sql.format(placeholders=', '.join('?' for _ in chunk)), chunk + list(params), db_conn=db_conn)
+        for row in rows or []:
+            row = dict(row)
+            children.setdefault(row[parent_key], []).append(row)
+    return children
@@ -0,0 +1,227 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+# --- SQLite Connection Pool ---
+# Opening a SQLite connection, applying PRAGMAs and tearing it down again on every
+# app context dominated short storefront requests. The pool keeps a bounded set of
+# tuned connections per worker process and hands one out per app context.
+
+ALLOWED_JOURNAL_MODES = {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'}
+ALLOWED_SYNCHRONOUS_MODES = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+
+
+class PoolExhaustedError(sqlite3.OperationalError):
+    """Raised when no pooled connection becomes available within the checkout timeout."""
+
+
+class SQLiteConnectionPool:
+    """
+    A bounded pool of SQLite connections for one worker process.
+    Connections are created lazily up to `size`, checked out once per app context
+    (see database.get_db_connection) and returned at teardown.
+    """
+
+    def __init__(self, db_path, size=8, timeout=10.0, busy_timeout_ms=5000,
+                 journal_mode='WAL', synchronous='NORMAL', mmap_size=0, cache_size=-2000,
+                 health_check_interval=30.0, connection_factory=sqlite3.Connection, logger=None):
+        self.db_path = db_path
+        # Every connection to ':memory:' is a separate database, so sharing is impossible.
+        self.size = 1 if db_path == ':memory:' else max(1, int(size))
+        self.timeout = float(timeout)
+        self.busy_timeout_ms = int(busy_timeout_ms)
+        self.journal_mode = str(journal_mode).upper()
+        self.synchronous = str(synchronous).upper()
+        self.mmap_size = int(mmap_size)
+        self.cache_size = int(cache_size)
+        self.health_check_interval = float(health_check_interval)
+        self.connection_factory = connection_factory # e.g. db_profiler.ProfilingConnection
+        self.logger = logger
+        self.pid = os.getpid() # Pools must not be shared across forked workers
+        self.closed = False
+
+        if self.journal_mode not in ALLOWED_JOURNAL_MODES:
+            raise ValueError(f"Unsupported SQLite journal mode: {journal_mode}")
+        if self.synchronous not in ALLOWED_SYNCHRONOUS_MODES:
+            raise ValueError(f"Unsupported SQLite synchronous mode: {synchronous}")
+
+        self._idle = queue.LifoQueue() # LIFO keeps the hottest connections (and their page cache) in use
+        self._lock = threading.Lock()
+        self._last_used = {} # id(conn) -> monotonic timestamp of last release
+        self._created = 0
+        self._in_use = 0
+        self._stats = {
+            'connections_created': 0,
+            'connections_closed': 0,
+            'checkouts': 0,
+            'checkout_waits': 0,
+            'checkout_wait_seconds': 0.0,
+            'checkout_timeouts': 0,
+            'health_check_failures': 0,
+            'rollbacks_on_release': 0,
+        }
+
+    def _log(self, level, message):
+        if self.logger:
+            getattr(self.logger, level)(message)
+
+    def _connect(self):
+        """Opens and tunes a new connection. Called with a free slot already reserved."""
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        conn = sqlite3.connect(
+            self.db_path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            timeout=self.busy_timeout_ms / 1000.0,
+            check_same_thread=False, # Connections move between request threads over their lifetime
+            factory=self.connection_factory
+        )
+        conn.row_factory = sqlite3.Row # Access columns by name
+        conn.execute("PRAGMA foreign_keys = ON;") # Enforce foreign key constraints
+        conn.execute(f"PRAGMA busy_timeout = {self.busy_timeout_ms};")
+        conn.execute(f"PRAGMA journal_mode = {self.journal_mode};")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous};")
+        conn.execute(f"PRAGMA cache_size = {self.cache_size};")
+        if self.mmap_size > 0:
+            conn.execute(f"PRAGMA mmap_size = {self.mmap_size};")
+        with self._lock:
+            self._stats['connections_created'] += 1
+        self._log('debug', f"DB pool: opened new connection to {self.db_path}")
+        return conn
+
+    def _close(self, conn):
+        self._last_used.pop(id(conn), None)
+        try:
+            conn.close()
+        except sqlite3.Error as e:
+            self._log('warning', f"DB pool: error closing connection: {e}")
+        with self._lock:
+            self._created -= 1
+            self._stats['connections_closed'] += 1
+
+    def _is_healthy(self, conn):
+        """Pings connections that sat idle longer than the health check interval."""
+        last_used = self._last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error as e:
+            with self._lock:
+                self._stats['health_check_failures'] += 1
+            self._log('warning', f"DB pool: discarding unhealthy connection: {e}")
+            return False
+
+    def acquire(self):
+        """
+        Checks out a connection, creating one if the pool is below its size.
+        Blocks up to `timeout` seconds when every connection is in use.
+        """
+        if self.closed:
+            raise sqlite3.ProgrammingError("Cannot acquire a connection from a closed pool.")
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        wait_started = time.monotonic()
+        while True:
+            conn = None
+            create = False
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    if self._created < self.size:
+                        self._created += 1
+                        create = True
+            if conn is None and not create:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    with self._lock:
+                        self._stats['checkout_timeouts'] += 1
+                    raise PoolExhaustedError(
+                        f"No database connection available after {self.timeout}s (pool size {self.size})."
+                    )
+                waited = True
+                try:
+                    # Wake up periodically: a discarded connection frees a slot without
+                    # putting anything back on the idle queue.
+                    conn = self._idle.get(timeout=min(remaining, 0.1))
+                except queue.Empty:
+                    continue
+
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            elif not self._is_healthy(conn):
+                self._close(conn)
+                continue
+
+            with self._lock:
+                self._in_use += 1
+                self._stats['checkouts'] += 1
+                if waited:
+                    self._stats['checkout_waits'] += 1
+                    self._stats['checkout_wait_seconds'] += time.monotonic() - wait_started
+            return conn
+
+    def release(self, conn, discard=False):
+        """
+        Returns a connection to the pool. Any transaction left open by the caller
+        is rolled back, matching the old behaviour of closing the connection.
+        """
+        with self._lock:
+            self._in_use -= 1
+        if self.closed:
+            discard = True
+        if not discard:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+                    with self._lock:
+                        self._stats['rollbacks_on_release'] += 1
+            except sqlite3.Error as e:
+                # Typically a connection closed by application code.
+                self._log('warning', f"DB pool: connection unusable on release, discarding: {e}")
+                discard = True
+        if discard:
+            self._close(conn)
+            return
+        self._last_used[id(conn)] = time.monotonic()
+        self._idle.put(conn)
+
+    def close_all(self):
+        """Closes idle connections. Connections still checked out are closed on release."""
+        self.closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close(conn)
+
+    def stats(self):
+        """Returns a snapshot of pool metrics."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot.update({
+                'db_path': self.db_path,
+                'pid': self.pid,
+                'size': self.size,
+                'open_connections': self._created,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+                'journal_mode': self.journal_mode,
+                'synchronous': self.synchronous,
+                'busy_timeout_ms': self.busy_timeout_ms,
+                'mmap_size': self.mmap_size,
+                'cache_size': self.cache_size,
+            })
+        snapshot['checkout_wait_seconds'] = round(snapshot['checkout_wait_seconds'], 6)
+        return snapshot
@@ -0,0 +1,398 @@
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from datetime import datetime, timezone
+from flask import current_app, g, has_app_context, has_request_context, request
+
+# --- Per-request Query Profiler ---
+# Opt-in (DB_PROFILING_ENABLED). When enabled (or when the slow-query log is on), pooled
+# connections are created with ProfilingConnection, so query_db and raw cursor.execute
+# calls are both timed.
+# Each request gets X-DB-Queries / X-DB-Time headers, repeated statement fingerprints
+# above DB_N_PLUS_ONE_THRESHOLD are flagged as N+1, and a rolling report is kept in
+# memory for the admin endpoint (per worker process).
+
+_STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_LINE_COMMENT_RE = re.compile(r"--[^\n]*")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def fingerprint_sql(sql):
+    """
+    Normalizes a statement so that executions differing only in literals share a fingerprint:
+    comments dropped, literals replaced with '?', IN lists collapsed, whitespace and case folded.
+    """
+    normalized = _LINE_COMMENT_RE.sub(' ', sql)
+    normalized = _STRING_LITERAL_RE.sub('?', normalized)
+    normalized = _NUMBER_RE.sub('?', normalized)
+    normalized = _IN_LIST_RE.sub('(?+)', normalized)
+    normalized = _WHITESPACE_RE.sub(' ', normalized).strip().rstrip(';').strip()
+    return normalized.lower()
+
+
+def _record_query(conn, sql, parameters, elapsed):
+    """
+    Attributes one executed statement to the current request (if it is being profiled)
+    and hands statements over the slow-query threshold to the slow-query log.
+    """
+    if not has_app_context():
+        return
+    if has_request_context():
+        profile = g.get('_db_profile')
+        if profile is not None:
+            profile.append((sql, elapsed))
+    slow_query_log = current_app.extensions.get('slow_query_log')
+    if slow_query_log is not None and elapsed * 1000.0 >= slow_query_log.threshold_ms:
+        slow_query_log.record(conn, sql, parameters, elapsed)
+
+
+class ProfilingCursor(sqlite3.Cursor):
+    """Cursor that times execute/executemany and reports them to the request profile."""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record_query(self.connection, sql, parameters, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record_query(self.connection, sql, None, time.perf_counter() - start)
+
+
+class ProfilingConnection(sqlite3.Connection):
+    """Connection whose cursors (including the implicit one behind execute()) are profiled."""
+
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class QueryProfiler:
+    """Rolling, in-memory aggregate of profiled requests for one worker process."""
+
+    def __init__(self, n_plus_one_threshold=5, history_size=200, max_fingerprints=500):
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.max_fingerprints = max_fingerprints
+        self._lock = threading.Lock()
+        self._recent_requests = deque(maxlen=history_size)
+        self._fingerprints = {} # fingerprint -> {'count', 'total_ms', 'max_ms'}
+        self._endpoints = {} # endpoint -> {'requests', 'queries', 'total_ms', 'n_plus_one_requests'}
+
+    def record_request(self, endpoint, method, path, queries):
+        """
+        Aggregates the queries of one request and returns (query_count, total_ms, n_plus_one),
+        where n_plus_one lists the fingerprints repeated at or above the threshold.
+        """
+        fingerprints = [(fingerprint_sql(sql), elapsed * 1000.0) for sql, elapsed in queries]
+        total_ms = sum(ms for _, ms in fingerprints)
+        repeated = Counter(fp for fp, _ in fingerprints)
+        n_plus_one = [
+            {'fingerprint': fp, 'count': count}
+            for fp, count in repeated.most_common() if count >= self.n_plus_one_threshold
+        ]
+
+        with self._lock:
+            for fp, ms in fingerprints:
+                stats = self._fingerprints.get(fp)
+                if stats is None:
+                    if len(self._fingerprints) >= self.max_fingerprints:
+                        continue # Bounded memory: new fingerprints are dropped once the table is full
+                    stats = self._fingerprints[fp] = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+                stats['count'] += 1
+                stats['total_ms'] += ms
+                stats['max_ms'] = max(stats['max_ms'], ms)
+
+            endpoint_stats = self._endpoints.setdefault(endpoint or path, {
+                'requests': 0, 'queries': 0, 'total_ms': 0.0, 'n_plus_one_requests': 0
+            })
+            endpoint_stats['requests'] += 1
+            endpoint_stats['queries'] += len(fingerprints)
+            endpoint_stats['total_ms'] += total_ms
+            if n_plus_one:
+                endpoint_stats['n_plus_one_requests'] += 1
+
+            self._recent_requests.append({
+                'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'endpoint': endpoint,
+                'method': method,
+                'path': path,
+                'query_count': len(fingerprints),
+                'total_ms': round(total_ms, 3),
+                'n_plus_one': n_plus_one,
+            })
+        return len(fingerprints), total_ms, n_plus_one
+
+    def report(self, top=25):
+        """Snapshot for the admin report endpoint."""
+        with self._lock:
+            fingerprints = sorted(self._fingerprints.items(), key=lambda item: item[1]['total_ms'], reverse=True)[:top]
+            endpoints = {
+                name: dict(stats,
+                           avg_queries=round(stats['queries'] / stats['requests'], 2),
+                           avg_ms=round(stats['total_ms'] / stats['requests'], 3),
+                           total_ms=round(stats['total_ms'], 3))
+                for name, stats in self._endpoints.items()
+            }
+            recent = list(self._recent_requests)
+        return {
+            'n_plus_one_threshold': self.n_plus_one_threshold,
+            'endpoints': endpoints,
+            'top_fingerprints': [
+                {'fingerprint': fp, 'count': stats['count'], 'total_ms': round(stats['total_ms'], 3),
+                 'avg_ms': round(stats['total_ms'] / stats['count'], 3), 'max_ms': round(stats['max_ms'], 3)}
+                for fp, stats in fingerprints
+            ],
+            'recent_requests': recent,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._recent_requests.clear()
+            self._fingerprints.clear()
+            self._endpoints.clear()
+
+
+# --- Slow-Query Log ---
+# Statements at or above DB_SLOW_QUERY_MS are kept in a per-worker ring buffer together
+# with the route that issued them and the *types* of their bound parameters (values are
+# never recorded: they may contain emails, tokens or password hashes). The query plan is
+# captured once per fingerprint so full table scans stand out in the admin report.
+# With DB_SLOW_QUERY_PERSIST, entries are also written to the slow_queries table by a
+# background thread with its own connection, off the request path.
+
+_EXPLAINABLE_PREFIXES = ('select', 'insert', 'update', 'delete', 'with', 'replace')
+
+
+def _parameter_shape(parameters):
+    """Describes bound parameters by type only, e.g. ['int', 'str'] or {'email': 'str'}."""
+    if parameters is None:
+        return None
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    return [type(value).__name__ for value in parameters]
+
+
+def _plan_has_table_scan(plan):
+    """A 'SCAN <table>' step without an index (covering or not) means every row is read."""
+    for detail in plan:
+        if detail.startswith('SCAN ') and 'USING' not in detail:
+            return True
+    return False
+
+
+class SlowQueryLog:
+    """Ring buffer of slow statements for one worker process, optionally persisted."""
+
+    def __init__(self, threshold_ms=200, buffer_size=200, max_plans=500,
+                 persist_db_path=None, persist_queue_size=1000, logger=None):
+        self.threshold_ms = float(threshold_ms)
+        self.max_plans = max_plans
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._entries = deque(maxlen=buffer_size)
+        self._plans = OrderedDict() # fingerprint -> list of plan detail lines (LRU-bounded)
+        self._recorded = 0
+        self._persist_dropped = 0
+        self._persist_db_path = persist_db_path
+        self._persist_queue = queue.Queue(maxsize=persist_queue_size) if persist_db_path else None
+        self._persist_pid = None # Writer thread owner; threads do not survive a fork
+
+    def _explain(self, conn, sql, fingerprint, parameters):
+        with self._lock:
+            if fingerprint in self._plans:
+                self._plans.move_to_end(fingerprint)
+                return self._plans[fingerprint]
+        if not fingerprint.startswith(_EXPLAINABLE_PREFIXES) or parameters is None:
+            return None
+        try:
+            # A plain cursor, so the EXPLAIN itself is not profiled (and cannot recurse).
+            cursor = sqlite3.Cursor(conn)
+            plan = [row[-1] for row in cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()]
+        except (sqlite3.Error, ValueError) as e:
+            if self.logger:
+                self.logger.debug(f"Slow-query log: could not explain statement: {e}")
+            return None
+        with self._lock:
+            self._plans[fingerprint] = plan
+            while len(self._plans) > self.max_plans:
+                self._plans.popitem(last=False)
+        return plan
+
+    def record(self, conn, sql, parameters, elapsed):
+        fingerprint = fingerprint_sql(sql)
+        plan = self._explain(conn, sql, fingerprint, parameters)
+        if has_request_context():
+            route, method, path = request.endpoint, request.method, request.path
+        else:
+            route, method, path = 'cli', None, None
+        entry = {
+            'recorded_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'duration_ms': round(elapsed * 1000.0, 3),
+            'fingerprint': fingerprint,
+            'sql': sql.strip(),
+            'param_shape': _parameter_shape(parameters),
+            'route': route,
+            'method': method,
+            'path': path,
+            'query_plan': plan,
+            'has_table_scan': _plan_has_table_scan(plan) if plan else False,
+        }
+        with self._lock:
+            self._entries.append(entry)
+            self._recorded += 1
+        if self.logger:
+            self.logger.warning(
+                f"Slow query ({entry['duration_ms']:.1f}ms) on {method or ''} {path or route}: {fingerprint[:200]}"
+                + (" [full table scan]" if entry['has_table_scan'] else "")
+            )
+        if self._persist_queue is not None:
+            self._enqueue_for_persistence(entry)
+
+    def _enqueue_for_persistence(self, entry):
+        if self._persist_pid != os.getpid(): # (Re)start the writer in this worker process
+            with self._lock:
+                if self._persist_pid != os.getpid():
+                    self._persist_pid = os.getpid()
+                    threading.Thread(target=self._persist_worker, name='slow-query-writer', daemon=True).start()
+        try:
+            self._persist_queue.put_nowait(entry)
+        except queue.Full: # Never block a request on the diagnostics writer
+            with self._lock:
+                self._persist_dropped += 1
+
+    def _persist_worker(self):
+        conn = sqlite3.connect(self._persist_db_path, timeout=30.0)
+        try:
+            while True:
+                batch = [self._persist_queue.get()]
+                while len(batch) < 100:
+                    try:
+                        batch.append(self._persist_queue.get_nowait())
+                    except queue.Empty:
+                        break
+                try:
+                    with conn:
+                        conn.executemany(
+                            """INSERT INTO slow_queries (fingerprint, sql_text, param_shape, duration_ms, route,
+                                   http_method, path, query_plan, has_table_scan)
+                               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                            [(e['fingerprint'], e['sql'], json.dumps(e['param_shape']), e['duration_ms'], e['route'],
+                              e['method'], e['path'], json.dumps(e['query_plan']), e['has_table_scan'])
+                             for e in batch]
+                        )
+                except sqlite3.Error as e:
+                    with self._lock:
+                        self._persist_dropped += len(batch)
+                    if self.logger:
+                        self.logger.error(f"Slow-query log: failed to persist {len(batch)} entries: {e}")
+        finally:
+            conn.close()
+
+    def entries(self, limit=100, full_scans_only=False):
+        with self._lock:
+            entries = list(self._entries)
+        entries.reverse() # Most recent first
+        if full_scans_only:
+            entries = [e for e in entries if e['has_table_scan']]
+        return entries[:limit]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'threshold_ms': self.threshold_ms,
+                'buffered': len(self._entries),
+                'buffer_size': self._entries.maxlen,
+                'recorded_total': self._recorded,
+                'plans_cached': len(self._plans),
+                'persist_enabled': self._persist_queue is not None,
+                'persist_pending': self._persist_queue.qsize() if self._persist_queue is not None else 0,
+                'persist_dropped': self._persist_dropped,
+            }
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+            self._plans.clear()
+            self._recorded = 0
+
+
+def get_slow_query_log(app=None):
+    """Returns the app's SlowQueryLog, or None when DB_SLOW_QUERY_MS is 0."""
+    app = app or current_app
+    return app.extensions.get('slow_query_log')
+
+
+def init_slow_query_log(app):
+    """Enables the slow-query log when DB_SLOW_QUERY_MS is positive."""
+    threshold_ms = app.config.get('DB_SLOW_QUERY_MS', 0)
+    if not threshold_ms or threshold_ms <= 0:
+        return
+    app.extensions['slow_query_log'] = SlowQueryLog(
+        threshold_ms=threshold_ms,
+        buffer_size=app.config.get('DB_SLOW_QUERY_BUFFER_SIZE', 200),
+        persist_db_path=app.config['DATABASE_PATH'] if app.config.get('DB_SLOW_QUERY_PERSIST') else None,
+        logger=app.logger
+    )
+    app.logger.info(f"Slow-query log enabled (threshold {threshold_ms}ms).")
+
+
+def uses_profiling_connections(app):
+    """Pooled connections need ProfilingConnection when profiling or the slow-query log is on."""
+    return bool(app.config.get('DB_PROFILING_ENABLED')) or app.config.get('DB_SLOW_QUERY_MS', 0) > 0
+
+
+def get_query_profiler(app=None):
+    """Returns the app's QueryProfiler, or None when profiling is disabled."""
+    app = app or current_app
+    return app.extensions.get('db_profiler')
+
+
+def init_query_profiler(app):
+    """Registers the profiling request hooks when DB_PROFILING_ENABLED is set."""
+    if not app.config.get('DB_PROFILING_ENABLED', False):
+        return
+    profiler = QueryProfiler(
+        n_plus_one_threshold=app.config.get('DB_N_PLUS_ONE_THRESHOLD', 5),
+        history_size=app.config.get('DB_PROFILER_HISTORY_SIZE', 200)
+    )
+    app.extensions['db_profiler'] = profiler
+
+    @app.before_request
+    def start_query_profile():
+        g._db_profile = []
+
+    @app.after_request
+    def finish_query_profile(response):
+        queries = g.pop('_db_profile', None)
+        if queries is None:
+            return response
+        query_count, total_ms, n_plus_one = profiler.record_request(
+            request.endpoint, request.method, request.path, queries
+        )
+        response.headers['X-DB-Queries'] = str(query_count)
+        response.headers['X-DB-Time'] = f"{total_ms:.2f}ms"
+        if n_plus_one:
+            app.logger.warning(
+                f"Possible N+1 on {request.method} {request.path}: "
+                + "; ".join(f"{item['count']}x {item['fingerprint'][:120]}" for item in n_plus_one)
+            )
+        return response
+
+    app.logger.info("Database query profiling enabled.")
@@ -0,0 +1,183 @@
+import threading
+from collections import OrderedDict
+from flask import current_app
+from .database import query_db
+from .http_cache import get_catalog_version
+
+# --- Catalog Facets ---
+# Filter counts for the storefront (category, brand, type, in stock, price band) from a single
+# grouped query: the products matching the search and category filters are counted per
+# combination of facet values (a few hundred groups at most), and each facet's counts are
+# summed from those groups in Python. Facets are disjunctive: a facet's counts honour every
+# selected filter except its own, so picking a brand still shows the counts of the others.
+# Grouping sorts every matching product, so the grouped rows are also cached per process,
+# keyed by the query and validated against the catalog version (see http_cache.py).
+
+# Effective price and availability, maintained on the products row by triggers (migration 0010):
+# the cheapest active weight option for variable-weight products, the base price otherwise.
+PRODUCT_PRICE_SQL = "p.min_price"
+PRODUCT_IN_STOCK_SQL = "p.in_stock"
+
+# (label, lower bound inclusive, upper bound exclusive or None)
+PRICE_BANDS = (
+    ('0-25', 0, 25),
+    ('25-50', 25, 50),
+    ('50-100', 50, 100),
+    ('100-200', 100, 200),
+    ('200+', 200, None),
+)
+
+def _price_band_sql(price_sql):
+    cases = ' '.join(f"WHEN {price_sql} < {upper} THEN '{label}'" for label, _, upper in PRICE_BANDS if upper is not None)
+    return f"CASE WHEN {price_sql} IS NULL THEN NULL {cases} ELSE '{PRICE_BANDS[-1][0]}' END"
+
+# Facet name -> SQL expression over the products row `p`, used to filter the product list.
+FACET_EXPRESSIONS = {
+    'brand': 'p.brand',
+    'type': 'p.type',
+    'in_stock': PRODUCT_IN_STOCK_SQL,
+    'price_band': _price_band_sql(PRODUCT_PRICE_SQL),
+}
+
+
+def facet_filters(args):
+    """
+    Reads the selected facet values from request args (?brand=, ?type=, ?price_band= may be
+    repeated; ?in_stock=true|false). Returns {facet: (condition template, params)}, where the
+    template has a {column} placeholder for the facet's expression or CTE column.
+    """
+    filters = {}
+    for facet in ('brand', 'type', 'price_band'):
+        values = [value for value in args.getlist(facet) if value]
+        if values:
+            filters[facet] = (f"{{column}} IN ({', '.join('?' for _ in values)})", values)
+    in_stock = args.get('in_stock')
+    if in_stock is not None and in_stock.lower() in ('true', 'false'):
+        filters['in_stock'] = ("{column} = ?", [1 if in_stock.lower() == 'true' else 0])
+    return filters
+
+
+# Sort and range-filter key for prices; the same expression as idx_products_min_price_id.
+PRODUCT_PRICE_SORT_SQL = "COALESCE(p.min_price, 0)"
+
+
+def price_range_conditions(args):
+    """
+    ?min_price= / ?max_price= (inclusive, on the effective "from" price) as (conditions, params).
+    Bounds that are missing or not numbers are ignored; products without a price never match.
+    """
+    conditions, params = [], []
+    for param, operator in (('min_price', '>='), ('max_price', '<=')):
+        value = args.get(param, type=float)
+        if value is not None:
+            conditions.append(f"{PRODUCT_PRICE_SORT_SQL} {operator} ?")
+            params.append(value)
+    if conditions:
+        conditions.append("p.min_price IS NOT NULL")
+    return conditions, params
+
+
+def product_filter_conditions(filters):
+    """The facet filters as (conditions, params) over the products row `p`, for the product list query."""
+    conditions, params = [], []
+    for facet, (template, values) in filters.items():
+        conditions.append(template.format(column=FACET_EXPRESSIONS[facet]))
+        params.extend(values)
+    return conditions, params
+
+
+FACETS = ('category', 'brand', 'type', 'in_stock', 'price_band')
+
+
+def build_facet_query(products_source, base_conditions, base_params):
+    """
+    Returns (sql, params) for one statement counting the matching products per combination
+    of facet values; rows carry the FACETS columns, category_name and count.
+    :param products_source: FROM clause providing `p` (plain products or the FTS join).
+    :param base_conditions: Conditions every facet honours (search, category), over `p` and `c`.
+    """
+    where = ' AND '.join(['p.is_active = TRUE'] + list(base_conditions))
+    sql = f"""
+        SELECT MIN(c.slug) AS category, MIN(c.name) AS category_name,
+               {', '.join(f'{expression} AS {facet}' for facet, expression in FACET_EXPRESSIONS.items())},
+               COUNT(*) AS count
+        FROM {products_source}
+        LEFT JOIN categories c ON p.category_id = c.id
+        WHERE {where}
+        GROUP BY p.category_id, {', '.join(FACETS[1:])}
+    """
+    return sql, list(base_params)
+
+
+def shape_facets(rows, filters):
+    """
+    Sums the grouped rows into per-facet counts, most frequent values first.
+    :param filters: Selected facet filters from facet_filters(); applied to every facet but its own.
+    """
+    selected = {facet: set(values) for facet, (_, values) in filters.items()}
+    counts = {facet: {} for facet in FACETS}
+    category_names = {}
+    for row in rows or []:
+        row = dict(row)
+        category_names[row['category']] = row['category_name']
+        failing = [facet for facet, values in selected.items() if row[facet] not in values]
+        if len(failing) > 1:
+            continue # Excluded from every facet
+        for facet in FACETS:
+            if not failing or failing == [facet]:
+                counts[facet][row[facet]] = counts[facet].get(row[facet], 0) + row['count']
+
+    def ranked(facet):
+        return sorted(({'value': value, 'count': count} for value, count in counts[facet].items() if value is not None),
+                      key=lambda entry: (-entry['count'], str(entry['value'])))
+
+    band_order = {label: index for index, (label, _, _) in enumerate(PRICE_BANDS)}
+    return {
+        'category': [dict(entry, name=category_names.get(entry['value'])) for entry in ranked('category')],
+        'brand': ranked('brand'),
+        'type': ranked('type'),
+        'in_stock': {'true': counts['in_stock'].get(1, 0), 'false': counts['in_stock'].get(0, 0)},
+        'price_band': sorted(ranked('price_band'), key=lambda entry: band_order.get(entry['value'], len(band_order))),
+    }
+
+
+class FacetCountCache:
+    """Small thread-safe LRU of grouped facet rows, keyed by (sql, params) and catalog version."""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max(1, int(max_entries))
+        self._entries = OrderedDict() # (sql, params) -> (catalog_version, rows)
+        self._lock = threading.Lock()
+
+    def get(self, key, catalog_version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != catalog_version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, catalog_version, rows):
+        with self._lock:
+            self._entries[key] = (catalog_version, rows)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def fetch_facet_rows(db_conn, sql, params):
+    """Runs a facet query through the per-process cache (disabled with FACET_CACHE_MAX_ENTRIES = 0)."""
+    app = current_app._get_current_object()
+    max_entries = app.config.get('FACET_CACHE_MAX_ENTRIES', 256)
+    if not max_entries:
+        return [dict(row) for row in query_db(sql, params, db_conn=db_conn) or []]
+    cache = app.extensions.get('facet_count_cache')
+    if cache is None:
+        cache = app.extensions.setdefault('facet_count_cache', FacetCountCache(max_entries))
+    key = (sql, tuple(params))
+    version, _ = get_catalog_version(db_conn)
+    rows = cache.get(key, version)
+    if rows is None:
+        rows = [dict(row) for row in query_db(sql, params, db_conn=db_conn) or []]
+        cache.put(key, version, rows)
+    return rows
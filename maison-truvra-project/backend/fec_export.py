@@ -0,0 +1,354 @@
+import os
+import re
+from datetime import date, timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from .database import get_db_connection
+
+# --- FEC (Fichier des Écritures Comptables) ---
+# The FEC that a French company hands over in a tax audit (art. A47 A-1 LPF): every
+# accounting entry of the fiscal year, one line per entry line, in the 18 legal columns,
+# pipe-separated, with dates as YYYYMMDD and amounts with a decimal comma.
+# Sales are booked in the VE journal, one entry per issued invoice (web orders' invoices from
+# the order event worker, B2B invoices from the professional back office):
+#   debit  411000  customer (auxiliary account C<user id>)   invoice total incl. VAT
+#   credit 707000  sales of goods, excl. VAT                 invoice lines (invoice_items)
+#   credit 708500  shipping and other charges, excl. VAT     total minus lines, if positive
+#   debit  709700  discounts, excl. VAT                      total minus lines, if negative
+#   credit 445710  VAT collected                             the rest, so the entry balances
+# Sale prices include VAT at FEC_VAT_RATE. All amounts are integer cents: each net amount is
+# rounded once and the VAT line takes the remainder, so every entry balances exactly.
+# Invoices are read in issue order with fetchmany (their lines summed in SQL), one entry is
+# formatted at a time and written out in chunks, so a fiscal year of any size streams in
+# bounded memory. Draft and cancelled invoices are not accounting documents and are skipped.
+# The FEC is kept in euros and no exchange rate is recorded with invoices, so a period holding
+# a non-EUR invoice is refused (FecExportError) rather than booked with unconverted amounts.
+
+FEC_COLUMNS = (
+    'JournalCode', 'JournalLib', 'EcritureNum', 'EcritureDate', 'CompteNum', 'CompteLib', 'CompAuxNum', 'CompAuxLib',
+    'PieceRef', 'PieceDate', 'EcritureLib', 'Debit', 'Credit', 'EcritureLet', 'DateLet', 'ValidDate',
+    'Montantdevise', 'Idevise',
+)
+FEC_SEPARATOR = '|'
+FEC_LINE_END = '\r\n'
+FEC_ENCODING = 'iso-8859-15' # One of the encodings the administration accepts; covers French accents
+FEC_CHUNK_BYTES = 64 * 1024
+
+SALES_JOURNAL = ('VE', 'Journal des ventes')
+CUSTOMER_ACCOUNT = ('411000', 'Clients')
+SALES_ACCOUNT = ('707000', 'Ventes de marchandises')
+CHARGES_ACCOUNT = ('708500', 'Ports et frais accessoires facturés')
+DISCOUNTS_ACCOUNT = ('709700', 'Rabais, remises et ristournes accordés sur ventes de marchandises')
+VAT_ACCOUNT = ('445710', 'TVA collectée')
+ACCOUNTED_INVOICE_STATUSES = ('issued', 'paid', 'overdue')
+
+_FIELD_UNSAFE = re.compile(r'[|\r\n\t]+')
+
+
+class FecValidationError(ValueError):
+    """The FEC is malformed or does not balance."""
+
+
+class FecExportError(ValueError):
+    """The FEC cannot be produced from the recorded invoices."""
+
+
+def fiscal_year_bounds(year):
+    """Calendar fiscal year -> (first day, day after the last) as dates."""
+    return date(year, 1, 1), date(year + 1, 1, 1)
+
+
+def fec_filename(closing_date, siren=None):
+    """<SIREN>FEC<closing date YYYYMMDD>.txt, the name the administration expects."""
+    return f"{siren or company_siren()}FEC{closing_date.strftime('%Y%m%d')}.txt"
+
+
+def company_siren():
+    """FEC_SIREN, or the SIREN inside the French VAT number of DEFAULT_COMPANY_INFO (FRkk + 9 digits)."""
+    siren = current_app.config.get('FEC_SIREN')
+    if siren:
+        return siren
+    vat_number = (current_app.config.get('DEFAULT_COMPANY_INFO') or {}).get('vat_number') or ''
+    digits = re.sub(r'\D', '', vat_number[4:]) if vat_number.upper().startswith('FR') else ''
+    return digits if len(digits) == 9 else '000000000'
+
+
+def _amount(cents):
+    """Integer cents -> '1234,56' (empty for zero, as the other side of the line)."""
+    if not cents:
+        return ''
+    return f"{cents // 100},{cents % 100:02d}"
+
+
+def _parse_amount(value):
+    """'1234,56', '12,5', '12' or '-3,10' -> integer cents; '' -> 0. Raises ValueError otherwise."""
+    value = value.strip()
+    if not value:
+        return 0
+    sign = -1 if value.startswith('-') else 1
+    whole, comma, fraction = value.lstrip('+-').partition(',')
+    if not whole.isdigit() or (comma and not (fraction.isdigit() and len(fraction) <= 2)):
+        raise ValueError(f"Invalid amount: {value!r}")
+    return sign * (int(whole) * 100 + int(fraction.ljust(2, '0')))
+
+
+def _field(value):
+    return ' '.join(_FIELD_UNSAFE.sub(' ', str(value)).split()) if value is not None else ''
+
+
+def _net_of_vat(gross_cents, vat_rate_basis_points):
+    """Amount excluding VAT, rounded half away from zero to the cent."""
+    denominator = 10000 + vat_rate_basis_points
+    sign = -1 if gross_cents < 0 else 1
+    return sign * ((abs(gross_cents) * 20000 + denominator) // (2 * denominator))
+
+
+def invoice_entry_lines(invoice, vat_rate_basis_points):
+    """
+    The VE entry lines of one invoice as ((account, label), debit_cents, credit_cents, with_customer).
+    :param invoice: Row with total_cents, lines_cents and line_count.
+    """
+    total = invoice['total_cents']
+    goods = invoice['lines_cents'] if invoice['line_count'] else total
+    charges = total - goods
+    lines = [(CUSTOMER_ACCOUNT, total, 0, True)] if total >= 0 else [(CUSTOMER_ACCOUNT, 0, -total, True)]
+    net_credits = 0
+    for account, gross in ((SALES_ACCOUNT, goods), (CHARGES_ACCOUNT if charges > 0 else DISCOUNTS_ACCOUNT, charges)):
+        net = _net_of_vat(gross, vat_rate_basis_points)
+        if net > 0:
+            lines.append((account, 0, net, False))
+        elif net < 0:
+            lines.append((account, -net, 0, False))
+        net_credits += net
+    vat = total - net_credits
+    if vat > 0:
+        lines.append((VAT_ACCOUNT, 0, vat, False))
+    elif vat < 0:
+        lines.append((VAT_ACCOUNT, -vat, 0, False))
+    return lines
+
+
+def iter_fec_invoices(db_conn, start_date, end_date, batch_size=None):
+    """
+    Yields the accounted invoices issued in [start_date, end_date), oldest first, each with its
+    amounts in cents and its customer, reading them in batches.
+    """
+    batch_size = batch_size or current_app.config.get('FEC_BATCH_SIZE', 2000)
+    # issue_date is compared as text on its date prefix: rows hold either CURRENT_TIMESTAMP
+    # ('YYYY-MM-DD HH:MM:SS') or ISO strings ('YYYY-MM-DDTHH:MM:SS') from the B2B back office.
+    cursor = db_conn.execute(
+        f"""SELECT i.id, i.invoice_number, replace(substr(+i.issue_date, 1, 10), '-', '') AS issue_day,
+                   CAST(ROUND(i.total_amount * 100) AS INTEGER) AS total_cents,
+                   COALESCE(i.currency, 'EUR') AS currency,
+                   (SELECT COUNT(*) FROM invoice_items ii WHERE ii.invoice_id = i.id) AS line_count,
+                   (SELECT COALESCE(SUM(CAST(ROUND(ii.total_price * 100) AS INTEGER)), 0)
+                    FROM invoice_items ii WHERE ii.invoice_id = i.id) AS lines_cents,
+                   u.id AS customer_id,
+                   COALESCE(NULLIF(u.company_name, ''), TRIM(COALESCE(u.first_name, '') || ' ' || COALESCE(u.last_name, '')), u.email) AS customer_name
+            FROM invoices i
+            LEFT JOIN orders o ON o.id = i.order_id
+            LEFT JOIN users u ON u.id = COALESCE(i.b2b_user_id, o.user_id)
+            WHERE i.issue_date >= ? AND i.issue_date < ?
+              AND i.status IN ({', '.join('?' for _ in ACCOUNTED_INVOICE_STATUSES)})
+            ORDER BY i.issue_date, i.id""",
+        [start_date.isoformat(), end_date.isoformat(), *ACCOUNTED_INVOICE_STATUSES]
+    )
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
+
+
+def foreign_currency_invoices(db_conn, start_date, end_date, limit=20):
+    """Numbers of the accounted invoices issued in [start_date, end_date) in another currency than EUR."""
+    return [row['invoice_number'] for row in db_conn.execute(
+        f"""SELECT invoice_number FROM invoices
+            WHERE issue_date >= ? AND issue_date < ? AND COALESCE(currency, 'EUR') != 'EUR'
+              AND status IN ({', '.join('?' for _ in ACCOUNTED_INVOICE_STATUSES)})
+            ORDER BY issue_date, id LIMIT ?""",
+        [start_date.isoformat(), end_date.isoformat(), *ACCOUNTED_INVOICE_STATUSES, limit]
+    )]
+
+
+def check_fec_exportable(db_conn, start_date, end_date):
+    """Raises FecExportError if the period holds invoices the FEC cannot book (non-EUR amounts)."""
+    foreign = foreign_currency_invoices(db_conn, start_date, end_date)
+    if foreign:
+        raise FecExportError(
+            f"Factures en devise étrangère sans taux de change enregistré : {', '.join(foreign)}"
+            f"{' ...' if len(foreign) >= 20 else ''}. Le FEC doit être tenu en euros."
+        )
+
+
+def generate_fec_lines(invoices, vat_rate, totals=None):
+    """
+    Yields the FEC as text lines (header first), numbering entries VE000001, VE000002, ...
+    :param totals: Optional dict updated with entries, lines, debit_cents and credit_cents.
+    """
+    vat_rate_basis_points = int(round(vat_rate * 100))
+    journal_code, journal_label = SALES_JOURNAL
+    if totals is None:
+        totals = {}
+    totals.update(entries=0, lines=0, debit_cents=0, credit_cents=0)
+    yield FEC_SEPARATOR.join(FEC_COLUMNS) + FEC_LINE_END
+    for invoice in invoices:
+        totals['entries'] += 1
+        entry_number = f"{journal_code}{totals['entries']:06d}"
+        day = invoice['issue_day']
+        customer_account = f"C{invoice['customer_id']:06d}" if invoice['customer_id'] is not None else ''
+        customer_name = _field(invoice['customer_name'])
+        piece = _field(invoice['invoice_number'])
+        label = _field(f"Facture {invoice['invoice_number']} {invoice['customer_name'] or ''}")
+        if invoice['currency'] != 'EUR':
+            raise FecExportError(f"Facture {invoice['invoice_number']} en {invoice['currency']} : le FEC doit être tenu en euros.")
+        parts = []
+        for (account, account_label), debit, credit, with_customer in invoice_entry_lines(invoice, vat_rate_basis_points):
+            totals['debit_cents'] += debit
+            totals['credit_cents'] += credit
+            parts.append(FEC_SEPARATOR.join((
+                journal_code, journal_label, entry_number, day, account, account_label,
+                customer_account if with_customer else '', customer_name if with_customer else '',
+                piece, day, label, _amount(debit) or '0,00', _amount(credit) or '0,00', '', '', day, '', '',
+            )))
+        totals['lines'] += len(parts)
+        yield FEC_LINE_END.join(parts) + FEC_LINE_END
+
+
+def _encoded_chunks(lines, chunk_bytes=FEC_CHUNK_BYTES):
+    pending, size = [], 0
+    for line in lines:
+        pending.append(line)
+        size += len(line)
+        if size >= chunk_bytes:
+            yield ''.join(pending).encode(FEC_ENCODING, errors='replace')
+            pending, size = [], 0
+    if pending:
+        yield ''.join(pending).encode(FEC_ENCODING, errors='replace')
+
+
+def generate_fec(db_conn, start_date, end_date, totals=None, batch_size=None):
+    """Byte chunks of the FEC for invoices issued in [start_date, end_date)."""
+    invoices = iter_fec_invoices(db_conn, start_date, end_date, batch_size=batch_size)
+    return _encoded_chunks(generate_fec_lines(invoices, current_app.config.get('FEC_VAT_RATE', 5.5), totals=totals))
+
+
+def validate_fec(lines, start_date=None, end_date=None):
+    """
+    Re-reads a FEC (iterable of text lines) and checks its structure and balances:
+    18 columns per line, consecutive entry numbers, dates within the period, and
+    debits equal to credits for every entry and overall, in integer cents.
+    Returns the totals; raises FecValidationError on the first problem.
+    """
+    lines = iter(lines)
+    header = next(lines, '').rstrip('\r\n').lstrip('﻿')
+    if header.split(FEC_SEPARATOR) != list(FEC_COLUMNS):
+        raise FecValidationError("Ligne d'en-tête FEC invalide.")
+    low = start_date.strftime('%Y%m%d') if start_date else None
+    high = (end_date - timedelta(days=1)).strftime('%Y%m%d') if end_date else None
+    totals = {'entries': 0, 'lines': 0, 'debit_cents': 0, 'credit_cents': 0}
+    current_entry, entry_balance, previous_number = None, 0, 0
+
+    def close_entry():
+        if current_entry is not None and entry_balance:
+            raise FecValidationError(f"Écriture {current_entry} déséquilibrée de {_amount(abs(entry_balance))}.")
+
+    for line_number, line in enumerate(lines, start=2):
+        line = line.rstrip('\r\n')
+        if not line:
+            continue
+        fields = line.split(FEC_SEPARATOR)
+        if len(fields) != len(FEC_COLUMNS):
+            raise FecValidationError(f"Ligne {line_number} : {len(fields)} colonnes au lieu de {len(FEC_COLUMNS)}.")
+        entry, day = fields[2], fields[3]
+        try:
+            debit, credit = _parse_amount(fields[11]), _parse_amount(fields[12])
+        except ValueError:
+            raise FecValidationError(f"Ligne {line_number} : montant invalide.")
+        if low and not (low <= day <= high):
+            raise FecValidationError(f"Ligne {line_number} : date {day} hors de l'exercice.")
+        if entry != current_entry:
+            close_entry()
+            number = int(re.sub(r'\D', '', entry) or 0)
+            if number != previous_number + 1:
+                raise FecValidationError(f"Ligne {line_number} : numérotation discontinue ({entry}).")
+            current_entry, entry_balance, previous_number = entry, 0, number
+            totals['entries'] += 1
+        entry_balance += debit - credit
+        totals['lines'] += 1
+        totals['debit_cents'] += debit
+        totals['credit_cents'] += credit
+    close_entry()
+    if totals['debit_cents'] != totals['credit_cents']:
+        raise FecValidationError(
+            f"Total débit {_amount(totals['debit_cents'])} ≠ total crédit {_amount(totals['credit_cents'])}."
+        )
+    return totals
+
+
+def _period_options(year, date_from, date_to):
+    if year:
+        return fiscal_year_bounds(year)
+    if not date_from or not date_to:
+        raise click.UsageError("Pass --year, or both --from and --to.")
+    return date.fromisoformat(date_from), date.fromisoformat(date_to)
+
+
+@click.group('fec')
+def fec_cli():
+    """FEC accounting export (Fichier des Écritures Comptables)."""
+
+
+@fec_cli.command('export')
+@click.option('--year', type=int, default=None, help='Calendar fiscal year.')
+@click.option('--from', 'date_from', default=None, help='First day of the fiscal year (YYYY-MM-DD).')
+@click.option('--to', 'date_to', default=None, help='Day after its last day (YYYY-MM-DD), exclusive.')
+@click.option('--output', '-o', type=click.Path(writable=True), default=None,
+              help='File or directory to write (default: <SIREN>FEC<closing date>.txt in the current directory).')
+@with_appcontext
+def fec_export_command(year, date_from, date_to, output):
+    """Write the FEC of a fiscal year, then validate the written file."""
+    start_date, end_date = _period_options(year, date_from, date_to)
+    filename = fec_filename(end_date - timedelta(days=1))
+    output = os.path.join(output, filename) if output and os.path.isdir(output) else (output or filename)
+    db_conn = get_db_connection()
+    try:
+        check_fec_exportable(db_conn, start_date, end_date)
+    except FecExportError as e:
+        raise click.ClickException(str(e))
+    totals = {}
+    temporary_path = f"{output}.tmp"
+    with open(temporary_path, 'wb') as fec_file:
+        for chunk in generate_fec(db_conn, start_date, end_date, totals=totals):
+            fec_file.write(chunk)
+    with open(temporary_path, encoding=FEC_ENCODING, newline='') as fec_file:
+        try:
+            validate_fec(fec_file, start_date, end_date)
+        except FecValidationError as e:
+            raise click.ClickException(f"FEC invalide, fichier conservé dans {temporary_path} : {e}")
+    os.replace(temporary_path, output)
+    click.echo(f"Wrote {output}: {totals['entries']} entries, {totals['lines']} lines, "
+               f"debit = credit = {_amount(totals['debit_cents']) or '0,00'}", err=True)
+
+
+@fec_cli.command('validate')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--year', type=int, default=None, help='Also check that every date falls within this fiscal year.')
+def fec_validate_command(path, year):
+    """Check the structure and balances of a FEC file."""
+    start_date, end_date = fiscal_year_bounds(year) if year else (None, None)
+    with open(path, encoding=FEC_ENCODING, newline='') as fec_file:
+        try:
+            totals = validate_fec(fec_file, start_date, end_date)
+        except FecValidationError as e:
+            raise click.ClickException(str(e))
+    click.echo(f"OK: {totals['entries']} entries, {totals['lines']} lines, debit = credit = {_amount(totals['debit_cents']) or '0,00'}")
+
+
+def register_fec_commands(app):
+    """Registers the `flask fec` command group."""
+    app.cli.add_command(fec_cli)
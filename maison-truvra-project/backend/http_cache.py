@@ -0,0 +1,84 @@
+import time
+from datetime import timezone
+from functools import wraps
+from flask import current_app, make_response, request
+from .database import get_db_connection, query_db
+
+# --- HTTP Caching for the Public Catalog ---
+# The catalog changes a few times a day but is read on every page view. The catalog_version
+# row (migration 0005) is bumped by triggers whenever anything the catalog endpoints render
+# changes, so one version number is a valid validator for all of them:
+#   ETag: "catalog-<version>"        Last-Modified: catalog_version.changed_at
+# Conditional requests are answered with 304 before the view runs. The version itself is a
+# primary-key read, cached in-process for CATALOG_VERSION_CACHE_SECONDS.
+
+
+def get_catalog_version(db_conn=None):
+    """Returns (version, changed_at) of the public catalog; changed_at is a naive UTC datetime or None."""
+    app = current_app._get_current_object()
+    ttl = app.config.get('CATALOG_VERSION_CACHE_SECONDS', 1.0)
+    cached = app.extensions.get('catalog_version')
+    now = time.monotonic()
+    if cached is not None and now - cached[0] < ttl:
+        return cached[1], cached[2]
+
+    row = query_db("SELECT version, changed_at FROM catalog_version WHERE id = 1",
+                   db_conn=db_conn or get_db_connection(), one=True)
+    version, changed_at = (row['version'], row['changed_at']) if row else (0, None)
+    app.extensions['catalog_version'] = (now, version, changed_at)
+    return version, changed_at
+
+
+def forget_catalog_version(app=None):
+    """Drops this process's cached catalog version, so the next request reads it again."""
+    (app or current_app._get_current_object()).extensions.pop('catalog_version', None)
+
+
+def _is_not_modified(etag, last_modified):
+    # RFC 9110: If-None-Match takes precedence; If-Modified-Since is only used without it.
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified is not None:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def catalog_cache(max_age, stale_while_revalidate=None):
+    """
+    Decorator for public catalog GET views: adds ETag, Last-Modified and
+    "Cache-Control: public, max-age=..." to 200 responses and answers matching
+    If-None-Match / If-Modified-Since requests with an empty 304 without running the view.
+    max_age=0 sends "no-cache" as well: clients keep the response but revalidate it every time.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                version, changed_at = get_catalog_version()
+            except Exception as e:
+                # Never fail a catalog request because of the validator; serve it uncached.
+                current_app.logger.warning(f"Catalog version unavailable, skipping HTTP caching: {e}")
+                return view(*args, **kwargs)
+
+            etag = f"catalog-{version}"
+            last_modified = changed_at.replace(tzinfo=timezone.utc) if changed_at is not None else None
+
+            if _is_not_modified(etag, last_modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response # Errors and 404s are not cached
+
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.cache_control.public = True
+            response.cache_control.max_age = max_age
+            if not max_age:
+                response.cache_control.no_cache = True
+            if stale_while_revalidate:
+                response.cache_control.stale_while_revalidate = stale_while_revalidate
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,235 @@
+import hashlib
+import json
+import threading
+import time
+from functools import wraps
+from flask import Response, current_app, g, jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from .database import get_db_connection, query_db
+from .write_queue import WriteQueueFullError, run_write
+
+# --- Idempotency Keys ---
+# Mobile clients retry POSTs on timeouts; without this a retried checkout is a second order.
+# A client sends the same `Idempotency-Key` header with every attempt of one operation:
+#   - the first attempt claims the key (an 'in_progress' row in idempotency_keys, migration
+#     0013), runs the view and stores its response for IDEMPOTENCY_KEY_TTL_SECONDS;
+#   - later attempts get that stored response replayed (`Idempotent-Replayed: true`);
+#   - an attempt arriving while the first still runs waits for it instead of running again:
+#     on a threading.Event within the same worker process, by polling the row across
+#     processes, for up to IDEMPOTENCY_WAIT_SECONDS, then 409 with Retry-After.
+# A key reused with a different request (body, path or caller) is rejected with 422.
+# Keys are scoped to the caller's JWT identity: an anonymous request (e.g. a checkout naming
+# its user in the payload) runs without idempotency, since anyone could replay its response.
+# 5xx and 429 responses are not stored, so the client's retry runs the operation again.
+# Requests without the header are not affected.
+# A view whose operation is one transaction stores its response in that same transaction
+# (store_idempotent_response with idempotency_claim()): a worker dying between the commit and
+# the decorator's own write would otherwise leave the key in_progress, and once
+# IDEMPOTENCY_LOCK_SECONDS expired a retry would take it over and run the operation again.
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+REPLAYED_HEADERS = ('Content-Type', 'Location', 'Content-Disposition')
+EXPIRED_KEYS_PURGED_PER_CLAIM = 100
+
+_in_flight_lock = threading.Lock()
+
+
+class IdempotencyClaim:
+    """The Idempotency-Key claimed by the current request (see idempotency_claim)."""
+
+    def __init__(self, scope, key):
+        self.scope = scope
+        self.key = key
+        self.stored = False # Set once the view stored its response itself
+
+
+def idempotency_claim():
+    """The current request's IdempotencyClaim, or None (no Idempotency-Key, or not an @idempotent view)."""
+    return g.get('idempotency_claim')
+
+
+def store_idempotent_response(db, claim, response):
+    """
+    Records `response` as the outcome of `claim` inside the caller's write job, so the operation
+    and its idempotency record commit together. No-op when claim is None.
+    """
+    if claim is None:
+        return
+    _store_response(db, claim.scope, claim.key, response.status_code, _replayed_headers(response), response.get_data())
+    claim.stored = True
+
+
+def _request_owner():
+    """The caller's JWT identity (as text), or None for anonymous requests."""
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except Exception:
+        return None
+    return str(identity) if identity is not None else None
+
+
+def _request_hash():
+    digest = hashlib.sha256()
+    for part in (request.method, request.path, request.query_string.decode('latin-1')):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    digest.update(request.get_data(cache=True)) # Cached: the view still reads the body
+    return digest.hexdigest()
+
+
+def _claim_key(db, scope, key, owner, request_hash, ttl_seconds, lock_seconds):
+    """
+    Write job: claims (scope, key) for this request. Returns None if claimed, else the existing row.
+    Expired rows and abandoned in_progress claims are taken over.
+    """
+    db.execute(
+        """DELETE FROM idempotency_keys WHERE rowid IN (
+               SELECT rowid FROM idempotency_keys WHERE expires_at <= CURRENT_TIMESTAMP LIMIT ?)
+           OR (scope = ? AND idempotency_key = ? AND expires_at <= CURRENT_TIMESTAMP)""",
+        (EXPIRED_KEYS_PURGED_PER_CLAIM, scope, key)
+    )
+    cursor = db.execute(
+        """INSERT INTO idempotency_keys (scope, idempotency_key, owner, request_hash, locked_until, expires_at)
+           VALUES (?, ?, ?, ?, datetime('now', ?), datetime('now', ?))
+           ON CONFLICT (scope, idempotency_key) DO UPDATE SET
+               owner = excluded.owner, request_hash = excluded.request_hash, status = 'in_progress',
+               response_status = NULL, response_headers = NULL, response_body = NULL,
+               created_at = CURRENT_TIMESTAMP, locked_until = excluded.locked_until, expires_at = excluded.expires_at
+           WHERE idempotency_keys.status = 'in_progress' AND idempotency_keys.locked_until <= CURRENT_TIMESTAMP""",
+        (scope, key, owner, request_hash, f"+{int(lock_seconds)} seconds", f"+{int(ttl_seconds)} seconds")
+    )
+    if cursor.rowcount:
+        return None
+    return _load_key(db, scope, key)
+
+
+def _load_key(db, scope, key):
+    return query_db(
+        """SELECT owner, request_hash, status, response_status, response_headers, response_body
+           FROM idempotency_keys WHERE scope = ? AND idempotency_key = ?""",
+        [scope, key], db_conn=db, one=True
+    )
+
+
+def _store_response(db, scope, key, status_code, headers, body):
+    db.execute(
+        """UPDATE idempotency_keys SET status = 'completed', response_status = ?, response_headers = ?, response_body = ?
+           WHERE scope = ? AND idempotency_key = ?""",
+        (status_code, json.dumps(headers), body, scope, key)
+    )
+
+
+def _replayed_headers(response):
+    return {name: response.headers[name] for name in REPLAYED_HEADERS if name in response.headers}
+
+
+def _release_key(db, scope, key):
+    db.execute("DELETE FROM idempotency_keys WHERE scope = ? AND idempotency_key = ? AND status = 'in_progress'", (scope, key))
+
+
+def _in_progress_response():
+    response = jsonify(message=f"A request with this {IDEMPOTENCY_HEADER} is still being processed.")
+    response.status_code = 409
+    response.headers['Retry-After'] = '1'
+    return response
+
+
+def _replay(row):
+    response = Response(row['response_body'], status=row['response_status'], headers=json.loads(row['response_headers'] or '{}'))
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _wait_for_completion(scope, key, wait_seconds):
+    """Polls a key claimed by another worker process until it completes; returns its row or None on timeout."""
+    deadline = time.monotonic() + wait_seconds
+    db = get_db_connection()
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        row = _load_key(db, scope, key)
+        if row is None or row['status'] == 'completed':
+            return row
+    return None
+
+
+def _in_flight_events():
+    return current_app.extensions.setdefault('idempotency_in_flight', {})
+
+
+def idempotent():
+    """
+    Decorator for POST views (place it under the route and auth decorators): requests carrying
+    an Idempotency-Key header run at most once per key; duplicates get the stored response.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER, '').strip()
+            if not key:
+                return view(*args, **kwargs)
+            if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+                return jsonify(message=f"{IDEMPOTENCY_HEADER} must be at most {IDEMPOTENCY_KEY_MAX_LENGTH} characters."), 400
+
+            owner = _request_owner()
+            if owner is None:
+                current_app.logger.info(f"{IDEMPOTENCY_HEADER} ignored on {request.endpoint}: anonymous request.")
+                return view(*args, **kwargs)
+
+            config = current_app.config
+            wait_seconds = config.get('IDEMPOTENCY_WAIT_SECONDS', 10.0)
+            scope, request_hash = request.endpoint, _request_hash()
+
+            # Coalesce duplicates within this process: followers wait for the leader's result.
+            in_flight = _in_flight_events()
+            with _in_flight_lock:
+                event = in_flight.get((scope, key))
+                is_leader = event is None
+                if is_leader:
+                    event = in_flight[(scope, key)] = threading.Event()
+            if not is_leader and not event.wait(wait_seconds):
+                return _in_progress_response()
+
+            try:
+                try:
+                    existing = run_write(_claim_key, scope, key, owner, request_hash,
+                                         config.get('IDEMPOTENCY_KEY_TTL_SECONDS', 86400), config.get('IDEMPOTENCY_LOCK_SECONDS', 60))
+                except WriteQueueFullError:
+                    return jsonify(message="Service temporarily overloaded, please retry."), 503
+
+                if existing is not None:
+                    if existing['request_hash'] != request_hash or existing['owner'] != owner:
+                        current_app.logger.warning(f"{IDEMPOTENCY_HEADER} {key!r} reused with a different request on {scope}.")
+                        return jsonify(message=f"This {IDEMPOTENCY_HEADER} was already used for a different request."), 422
+                    if existing['status'] != 'completed':
+                        existing = _wait_for_completion(scope, key, wait_seconds) # Running in another worker process
+                    if existing is None or existing['status'] != 'completed':
+                        return _in_progress_response()
+                    current_app.logger.info(f"{IDEMPOTENCY_HEADER} {key!r}: replaying the stored {existing['response_status']} response of {scope}.")
+                    return _replay(existing)
+
+                claim = g.idempotency_claim = IdempotencyClaim(scope, key)
+                try:
+                    response = make_response(view(*args, **kwargs))
+                except Exception:
+                    run_write(_release_key, scope, key)
+                    raise
+                finally:
+                    g.pop('idempotency_claim', None)
+                try:
+                    if response.status_code >= 500 or response.status_code == 429 or response.is_streamed:
+                        run_write(_release_key, scope, key) # Not a final outcome (or not storable): let a retry run again
+                    elif not claim.stored:
+                        run_write(_store_response, scope, key, response.status_code, _replayed_headers(response), response.get_data())
+                except Exception as e:
+                    # The operation itself succeeded; its key stays claimed until IDEMPOTENCY_LOCK_SECONDS.
+                    current_app.logger.error(f"Could not record the outcome of {IDEMPOTENCY_HEADER} {key!r} on {scope}: {e}")
+                return response
+            finally:
+                if is_leader:
+                    with _in_flight_lock:
+                        in_flight.pop((scope, key), None)
+                    event.set()
+        return wrapper
+    return decorator
@@ -3,9 +3,15 @@ import uuid
 import sqlite3 # For explicit error handling
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from ..database import get_db_connection, query_db, record_stock_movement # record_stock_movement now requires db_conn
+from ..database import ( # record_stock_movement now requires db_conn
+    get_db_connection, insert_serialized_items_bulk, query_db, record_stock_movement, record_stock_movements_bulk
+)
+from ..idempotency import idempotency_claim, idempotent, store_idempotent_response
 from ..services.asset_service import generate_qr_code_for_item, generate_item_passport, generate_product_label
 from ..utils import format_datetime_for_storage # If needed for dates, or use isoformat()
+from ..pagination import InvalidCursorError, Keyset, get_page_size, list_response
+from ..product_cache import invalidate_product_detail
+from ..write_queue import WriteQueueFullError, run_write
 
 inventory_bp = Blueprint('inventory', __name__, url_prefix='/api/inventory')
 
@@ -27,6 +33,7 @@ def admin_required_inventory(fn):
 
 @inventory_bp.route('/serialized/receive', methods=['POST'])
 @admin_required_inventory # Protect this critical endpoint
+@idempotent()
 def receive_serialized_stock():
     data = request.json
     product_id = data.get('product_id')
@@ -57,7 +64,6 @@ def receive_serialized_stock():
         return jsonify(message=f"Invalid data type: {ve}"), 400
 
     db = get_db_connection()
-    cursor = db.cursor()
     
     # Get product SKU prefix for generating item UIDs and asset names
     product_info = query_db("SELECT sku_prefix, name FROM products WHERE id = ?", [product_id], db_conn=db, one=True)
@@ -77,6 +83,7 @@ def receive_serialized_stock():
     generated_assets_metadata = [] # To store paths for potential cleanup on error
 
     try:
+        items_to_insert = []
         for i in range(quantity_received):
             item_uid = f"{product_sku_prefix}-{uuid.uuid4().hex[:12].upper()}"
             
@@ -95,54 +102,26 @@ def receive_serialized_stock():
                 # 'label': label_relative_path
             })
 
-            # 2. Insert into serialized_inventory_items
-            cursor.execute(
-                """INSERT INTO serialized_inventory_items 
-                   (item_uid, product_id, variant_id, batch_number, production_date, expiry_date, cost_price, notes, status, qr_code_url, passport_url, label_url)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                (item_uid, product_id, variant_id, batch_number, production_date_db, expiry_date_db, cost_price, notes, 'available', 
-                 qr_code_relative_path, passport_relative_path, label_relative_path)
-            )
-            serialized_item_id = cursor.lastrowid
-
-            # 3. Record stock movement for this specific item
-            record_stock_movement(
-                db_conn=db, # Pass the connection
-                product_id=product_id,
-                variant_id=variant_id,
-                serialized_item_id=serialized_item_id,
-                movement_type='receive_serialized',
-                quantity_change=1, # Each serialized item is one unit
-                reason="Initial stock receipt of serialized item",
-                related_user_id=current_admin_id
-            )
+            items_to_insert.append({
+                'item_uid': item_uid, 'product_id': product_id, 'variant_id': variant_id,
+                'batch_number': batch_number, 'production_date': production_date_db, 'expiry_date': expiry_date_db,
+                'cost_price': cost_price, 'notes': notes, 'status': 'available',
+                'qr_code_url': qr_code_relative_path, 'passport_url': passport_relative_path, 'label_url': label_relative_path
+            })
             generated_item_uids.append(item_uid)
 
-        # 4. Update aggregate stock on product/variant (optional, if also tracking aggregate)
+        # 2. Insert the items and their stock movements in bulk, in one transaction,
+        # committed only if all items were processed and assets generated successfully.
+        # 3. Update aggregate stock on product/variant (optional, if also tracking aggregate)
         # This depends on your exact stock management strategy.
         # If serialized is the ONLY source of truth for these items, aggregate might not need +qty here.
-        # If you do update aggregate, ensure it's done carefully.
-        # Example:
-        # if variant_id:
-        #    cursor.execute("UPDATE product_weight_options SET aggregate_stock_quantity = aggregate_stock_quantity + ? WHERE id = ?", [quantity_received, variant_id])
-        # else:
-        #    cursor.execute("UPDATE products SET aggregate_stock_quantity = aggregate_stock_quantity + ? WHERE id = ?", [quantity_received, product_id])
-
-
-        db.commit() # Commit only if all items processed and assets generated successfully
-        
-        audit_logger.log_action(
-            user_id=current_admin_id,
-            action='receive_serialized_stock_success',
-            target_type='product',
-            target_id=product_id,
-            details=f"Received {quantity_received} serialized items. UIDs: {', '.join(generated_item_uids)}",
-            status='success'
-        )
-        return jsonify(message=f"{quantity_received} serialized items received successfully.", item_uids=generated_item_uids), 201
+        response = jsonify(message=f"{quantity_received} serialized items received successfully.", item_uids=generated_item_uids)
+        response.status_code = 201
+        run_write(_insert_received_items, product_id, items_to_insert, current_admin_id, idempotency_claim(), response)
+        invalidate_product_detail(product_id)
+        return response
 
     except Exception as e:
-        db.rollback()
         current_app.logger.error(f"Error receiving serialized stock for product {product_id}: {e}")
         
         # Attempt to clean up any partially generated assets if an error occurred mid-batch
@@ -170,6 +149,37 @@ def receive_serialized_stock():
         return jsonify(message=f"Failed to receive serialized stock: {str(e)}"), 500
 
 
+def _insert_received_items(db, product_id, items_to_insert, current_admin_id, claim=None, response=None):
+    """
+    Write job: bulk-inserts received serialized items, one 'receive_serialized' movement
+    per item, the audit entry and the response stored for the request's Idempotency-Key.
+    """
+    ids_by_uid = insert_serialized_items_bulk(db, items_to_insert)
+    record_stock_movements_bulk(db, (
+        {
+            'product_id': item['product_id'],
+            'variant_id': item['variant_id'],
+            'serialized_item_id': ids_by_uid[item['item_uid']],
+            'movement_type': 'receive_serialized',
+            'quantity_change': 1, # Each serialized item is one unit
+            'reason': "Initial stock receipt of serialized item",
+            'related_user_id': current_admin_id
+        }
+        for item in items_to_insert
+    ))
+    current_app.audit_log_service.log_action(
+        user_id=current_admin_id,
+        action='receive_serialized_stock_success',
+        target_type='product',
+        target_id=product_id,
+        details=f"Received {len(items_to_insert)} serialized items. UIDs: {', '.join(item['item_uid'] for item in items_to_insert)}",
+        status='success',
+        db_conn=db
+    )
+    store_idempotent_response(db, claim, response)
+    return len(items_to_insert)
+
+
 @inventory_bp.route('/stock/adjust', methods=['POST'])
 @admin_required_inventory
 def adjust_stock():
@@ -190,83 +200,93 @@ def adjust_stock():
         audit_logger.log_action(user_id=current_admin_id, action='adjust_stock_fail', target_type='product', target_id=product_id, details="Adjustment quantity or weight must be provided.", status='failure')
         return jsonify(message="Adjustment quantity or weight must be provided"), 400
 
-    db = get_db_connection()
     try:
         product_id = int(product_id)
         if variant_id: variant_id = int(variant_id)
         if adjustment_quantity is not None: adjustment_quantity = int(adjustment_quantity)
         if adjustment_weight_grams is not None: adjustment_weight_grams = float(adjustment_weight_grams)
-
-        # Determine movement type based on adjustment sign
-        movement_type_qty = None
-        if adjustment_quantity is not None:
-            movement_type_qty = 'adjustment_in' if adjustment_quantity > 0 else 'adjustment_out'
-        
-        movement_type_weight = None
-        if adjustment_weight_grams is not None:
-            movement_type_weight = 'adjustment_in_weight' if adjustment_weight_grams > 0 else 'adjustment_out_weight'
-
-        # This route is primarily for aggregate stock. Serialized items have their own status changes.
-        # Update aggregate stock
-        if variant_id:
-            if adjustment_quantity is not None:
-                query_db("UPDATE product_weight_options SET aggregate_stock_quantity = aggregate_stock_quantity + ? WHERE id = ?", 
-                         [adjustment_quantity, variant_id], db_conn=db, commit=False) # Commit handled below
-            # Weight adjustments on variants might be more complex if they also have quantity
-        else: # Product-level adjustment
-            if adjustment_quantity is not None:
-                query_db("UPDATE products SET aggregate_stock_quantity = aggregate_stock_quantity + ? WHERE id = ?",
-                         [adjustment_quantity, product_id], db_conn=db, commit=False)
-            if adjustment_weight_grams is not None:
-                query_db("UPDATE products SET aggregate_stock_weight_grams = COALESCE(aggregate_stock_weight_grams, 0) + ? WHERE id = ?",
-                         [adjustment_weight_grams, product_id], db_conn=db, commit=False)
-
-        # Record stock movement
-        # For quantity based
-        if adjustment_quantity is not None:
-            record_stock_movement(
-                db_conn=db, # Pass the connection
-                product_id=product_id,
-                variant_id=variant_id,
-                movement_type=movement_type_qty,
-                quantity_change=adjustment_quantity,
-                reason=reason,
-                related_user_id=current_admin_id
-            )
-        # For weight based
-        if adjustment_weight_grams is not None:
-             record_stock_movement(
-                db_conn=db,
-                product_id=product_id,
-                variant_id=variant_id, # May or may not apply depending on how weight is tracked
-                movement_type=movement_type_weight,
-                weight_change_grams=adjustment_weight_grams,
-                reason=reason,
-                related_user_id=current_admin_id
-            )
-        
-        db.commit()
-        audit_logger.log_action(
-            user_id=current_admin_id,
-            action='adjust_stock_success',
-            target_type='product',
-            target_id=product_id,
-            details=f"Stock adjusted for product {product_id} (variant {variant_id}): Qty by {adjustment_quantity}, Weight by {adjustment_weight_grams}. Reason: {reason}",
-            status='success'
-        )
-        return jsonify(message="Stock adjusted successfully"), 200
-
     except ValueError as ve:
-        db.rollback() # Rollback if type conversion fails
         audit_logger.log_action(user_id=current_admin_id, action='adjust_stock_fail', target_type='product', target_id=product_id, details=f"Invalid data type: {ve}", status='failure')
         return jsonify(message=f"Invalid data type: {ve}"), 400
+
+    try:
+        run_write(_apply_stock_adjustment, product_id, variant_id, adjustment_quantity,
+                  adjustment_weight_grams, reason, current_admin_id)
+        invalidate_product_detail(product_id)
+        return jsonify(message="Stock adjusted successfully"), 200
+    except WriteQueueFullError:
+        current_app.logger.warning(f"Stock adjustment for product {product_id} rejected: write queue full.")
+        return jsonify(message="The database is busy, please retry the adjustment."), 503
     except Exception as e:
-        db.rollback()
         current_app.logger.error(f"Error adjusting stock for product {product_id}: {e}")
         audit_logger.log_action(user_id=current_admin_id, action='adjust_stock_fail', target_type='product', target_id=product_id, details=str(e), status='failure')
         return jsonify(message="Failed to adjust stock"), 500
 
 
+def _apply_stock_adjustment(db, product_id, variant_id, adjustment_quantity, adjustment_weight_grams, reason, current_admin_id):
+    """
+    Write job (see write_queue.run_write): updates aggregate stock, records the movements
+    and the audit entry in one transaction.
+    """
+    # Determine movement type based on adjustment sign
+    movement_type_qty = None
+    if adjustment_quantity is not None:
+        movement_type_qty = 'adjustment_in' if adjustment_quantity > 0 else 'adjustment_out'
+
+    movement_type_weight = None
+    if adjustment_weight_grams is not None:
+        movement_type_weight = 'adjustment_in_weight' if adjustment_weight_grams > 0 else 'adjustment_out_weight'
+
+    # This route is primarily for aggregate stock. Serialized items have their own status changes.
+    # Update aggregate stock
+    if variant_id:
+        if adjustment_quantity is not None:
+            query_db("UPDATE product_weight_options SET aggregate_stock_quantity = aggregate_stock_quantity + ? WHERE id = ?",
+                     [adjustment_quantity, variant_id], db_conn=db, commit=False) # Committed by the write queue
+        # Weight adjustments on variants might be more complex if they also have quantity
+    else: # Product-level adjustment
+        if adjustment_quantity is not None:
+            query_db("UPDATE products SET aggregate_stock_quantity = aggregate_stock_quantity + ? WHERE id = ?",
+                     [adjustment_quantity, product_id], db_conn=db, commit=False)
+        if adjustment_weight_grams is not None:
+            query_db("UPDATE products SET aggregate_stock_weight_grams = COALESCE(aggregate_stock_weight_grams, 0) + ? WHERE id = ?",
+                     [adjustment_weight_grams, product_id], db_conn=db, commit=False)
+
+    # Record stock movement
+    # For quantity based
+    if adjustment_quantity is not None:
+        record_stock_movement(
+            db_conn=db, # Pass the connection
+            product_id=product_id,
+            variant_id=variant_id,
+            movement_type=movement_type_qty,
+            quantity_change=adjustment_quantity,
+            reason=reason,
+            related_user_id=current_admin_id
+        )
+    # For weight based
+    if adjustment_weight_grams is not None:
+        record_stock_movement(
+            db_conn=db,
+            product_id=product_id,
+            variant_id=variant_id, # May or may not apply depending on how weight is tracked
+            movement_type=movement_type_weight,
+            weight_change_grams=adjustment_weight_grams,
+            reason=reason,
+            related_user_id=current_admin_id
+        )
+
+    current_app.audit_log_service.log_action(
+        user_id=current_admin_id,
+        action='adjust_stock_success',
+        target_type='product',
+        target_id=product_id,
+        details=f"Stock adjusted for product {product_id} (variant {variant_id}): Qty by {adjustment_quantity}, Weight by {adjustment_weight_grams}. Reason: {reason}",
+        status='success',
+        db_conn=db
+    )
+
+
 @inventory_bp.route('/serialized/items', methods=['GET'])
 @admin_required_inventory
 def get_serialized_items():
@@ -275,8 +295,9 @@ def get_serialized_items():
     product_id_filter = request.args.get('product_id', type=int)
     status_filter = request.args.get('status')
 
-    query = """
-        SELECT si.*, p.name as product_name, p.sku_prefix, pwo.sku_suffix as variant_sku_suffix
+    keyset = Keyset(('si.received_at', 'si.id'), descending=True)
+    query = f"""
+        SELECT si.*, p.name as product_name, p.sku_prefix, pwo.sku_suffix as variant_sku_suffix {keyset.select_columns()}
         FROM serialized_inventory_items si
         JOIN products p ON si.product_id = p.id
         LEFT JOIN product_weight_options pwo ON si.variant_id = pwo.id
@@ -290,16 +311,18 @@ def get_serialized_items():
     if status_filter:
         conditions.append("si.status = ?")
         params.append(status_filter)
-    
-    if conditions:
-        query += " WHERE " + " AND ".join(conditions)
-    
-    query += " ORDER BY si.received_at DESC, si.id DESC"
-    # Add pagination
 
     try:
-        items_data = query_db(query, params, db_conn=db)
-        items = [dict(row) for row in items_data] if items_data else []
+        # Keyset pagination: ?limit=, ?cursor= taken from the previous page's X-Next-Cursor header
+        cursor_condition, cursor_params = keyset.condition(request.args.get('cursor'))
+        if cursor_condition:
+            conditions.append(cursor_condition)
+            params.extend(cursor_params)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += f" {keyset.order_by()} LIMIT ?"
+        limit = get_page_size(request.args)
+        items, next_cursor = keyset.paginate(query_db(query, params + [limit + 1], db_conn=db), limit)
         for item in items: # Format dates
             item['production_date'] = format_datetime_for_display(item['production_date'])
             item['expiry_date'] = format_datetime_for_display(item['expiry_date'])
@@ -312,7 +335,9 @@ def get_serialized_items():
                 item['passport_full_url'] = f"{request.host_url.rstrip('/')}{admin_api_bp.url_prefix}/assets/{item['passport_url']}"
 
 
-        return jsonify(items), 200
+        return list_response(items, next_cursor)
+    except InvalidCursorError as e:
+        return jsonify(message=str(e)), 400
     except Exception as e:
         current_app.logger.error(f"Error fetching serialized items: {e}")
         return jsonify(message="Failed to fetch serialized items"), 500
@@ -383,6 +408,7 @@ def update_serialized_item_status(item_uid):
             pass # Decide if aggregate stock movement recording is needed here.
 
         db.commit()
+        invalidate_product_detail(item_info['product_id'])
         audit_logger.log_action(
             user_id=current_admin_id,
             action='update_item_status_success',
@@ -0,0 +1,21 @@
+-- Slow-query log persistence (optional, see DB_SLOW_QUERY_PERSIST) and indexes for token lookups.
+
+CREATE TABLE IF NOT EXISTS slow_queries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fingerprint TEXT NOT NULL, -- Normalized SQL (literals replaced by '?')
+    sql_text TEXT NOT NULL,
+    param_shape TEXT, -- JSON list of bound parameter types, never the values
+    duration_ms REAL NOT NULL,
+    route TEXT, -- Flask endpoint or 'cli'
+    http_method TEXT,
+    path TEXT,
+    query_plan TEXT, -- JSON list of EXPLAIN QUERY PLAN detail lines (captured once per fingerprint)
+    has_table_scan BOOLEAN DEFAULT FALSE,
+    recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_slow_queries_recorded_at ON slow_queries(recorded_at DESC);
+CREATE INDEX IF NOT EXISTS idx_slow_queries_fingerprint ON slow_queries(fingerprint);
+
+-- Password reset and email verification look users up by token; without these they scan users.
+CREATE INDEX IF NOT EXISTS idx_users_reset_token ON users(reset_token);
+CREATE INDEX IF NOT EXISTS idx_users_verification_token ON users(verification_token);
@@ -0,0 +1,47 @@
+-- Full-text product search (FTS5).
+-- One row per product, rowid = products.id. unicode61 with remove_diacritics 2 folds accents
+-- at index time ("Périgord" is indexed as "perigord"); prefix indexes make "truf*" cheap.
+-- The œ ligature is not decomposed by the tokenizer, so it is spelled out as "oe" on the way in
+-- ("Œufs" is indexed as "oeufs"), matching the unidecode-folded search terms.
+-- Kept in sync by the triggers below; the query side is built by backend/search.py.
+
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+    name,
+    description,
+    brand,
+    category_name,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+
+INSERT INTO products_fts (rowid, name, description, brand, category_name)
+SELECT p.id, replace(replace(p.name, 'œ', 'oe'), 'Œ', 'Oe'), replace(replace(p.description, 'œ', 'oe'), 'Œ', 'Oe'), replace(replace(p.brand, 'œ', 'oe'), 'Œ', 'Oe'), replace(replace(c.name, 'œ', 'oe'), 'Œ', 'Oe')
+FROM products p
+LEFT JOIN categories c ON p.category_id = c.id;
+
+CREATE TRIGGER IF NOT EXISTS trg_products_fts_insert AFTER INSERT ON products
+BEGIN
+    INSERT INTO products_fts (rowid, name, description, brand, category_name)
+    VALUES (NEW.id, replace(replace(NEW.name, 'œ', 'oe'), 'Œ', 'Oe'), replace(replace(NEW.description, 'œ', 'oe'), 'Œ', 'Oe'), replace(replace(NEW.brand, 'œ', 'oe'), 'Œ', 'Oe'),
+            (SELECT replace(replace(name, 'œ', 'oe'), 'Œ', 'Oe') FROM categories WHERE id = NEW.category_id));
+END;
+
+-- Also fires for the ON DELETE SET NULL action when a category is deleted.
+CREATE TRIGGER IF NOT EXISTS trg_products_fts_update AFTER UPDATE OF name, description, brand, category_id ON products
+BEGIN
+    DELETE FROM products_fts WHERE rowid = OLD.id;
+    INSERT INTO products_fts (rowid, name, description, brand, category_name)
+    VALUES (NEW.id, replace(replace(NEW.name, 'œ', 'oe'), 'Œ', 'Oe'), replace(replace(NEW.description, 'œ', 'oe'), 'Œ', 'Oe'), replace(replace(NEW.brand, 'œ', 'oe'), 'Œ', 'Oe'),
+            (SELECT replace(replace(name, 'œ', 'oe'), 'Œ', 'Oe') FROM categories WHERE id = NEW.category_id));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_products_fts_delete AFTER DELETE ON products
+BEGIN
+    DELETE FROM products_fts WHERE rowid = OLD.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_categories_fts_rename AFTER UPDATE OF name ON categories
+BEGIN
+    UPDATE products_fts SET category_name = replace(replace(NEW.name, 'œ', 'oe'), 'Œ', 'Oe')
+    WHERE rowid IN (SELECT id FROM products WHERE category_id = NEW.id);
+END;
@@ -0,0 +1,21 @@
+-- Keyset pagination (see backend/pagination.py) walks listings with row-value comparisons on
+-- (sort column, id). A composite index on exactly those columns turns each page into one seek
+-- plus LIMIT rows, and also serves ORDER BY ... DESC by scanning backwards.
+
+CREATE INDEX IF NOT EXISTS idx_audit_log_timestamp_id ON audit_log(timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_users_created_at_id ON users(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_orders_order_date_id ON orders(order_date, id);
+CREATE INDEX IF NOT EXISTS idx_serialized_inventory_items_received_at_id ON serialized_inventory_items(received_at, id);
+CREATE INDEX IF NOT EXISTS idx_serialized_inventory_items_product_received ON serialized_inventory_items(product_id, received_at, id);
+CREATE INDEX IF NOT EXISTS idx_newsletter_subscriptions_subscribed_at_id ON newsletter_subscriptions(subscribed_at, id);
+
+-- Public catalog sorts (name, newest, price). The price sort key is COALESCE(base_price, 0),
+-- so the index is on the same expression.
+CREATE INDEX IF NOT EXISTS idx_products_name_id ON products(name, id);
+CREATE INDEX IF NOT EXISTS idx_products_created_at_id ON products(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_products_price_id ON products(COALESCE(base_price, 0), id);
+
+-- Superseded by the composite indexes above (same leading column).
+DROP INDEX IF EXISTS idx_audit_log_timestamp;
+DROP INDEX IF EXISTS idx_orders_order_date;
+DROP INDEX IF EXISTS idx_products_created_at;
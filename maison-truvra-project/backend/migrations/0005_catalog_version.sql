@@ -0,0 +1,89 @@
+-- Catalog version for conditional GETs on the public catalog (see backend/http_cache.py).
+-- A single row whose version is bumped by triggers on every table the public catalog
+-- endpoints render: products, categories, images, weight options and approved reviews.
+-- ETags are derived from the version and Last-Modified from changed_at, so answering
+-- If-None-Match / If-Modified-Since costs one primary-key read (cached briefly in-process).
+
+CREATE TABLE IF NOT EXISTS catalog_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL DEFAULT 1,
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT OR IGNORE INTO catalog_version (id, version, changed_at) VALUES (1, 1, CURRENT_TIMESTAMP);
+
+CREATE TRIGGER IF NOT EXISTS trg_products_catalog_version_insert AFTER INSERT ON products
+BEGIN
+    UPDATE catalog_version SET version = version + 1, changed_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_products_catalog_version_update AFTER UPDATE ON products
+BEGIN
+    UPDATE catalog_version SET version = version + 1, changed_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_products_catalog_version_delete AFTER DELETE ON products
+BEGIN
+    UPDATE catalog_version SET version = version + 1, changed_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_categories_catalog_version_insert AFTER INSERT ON categories
+BEGIN
+    UPDATE catalog_version SET version = version + 1, changed_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_categories_catalog_version_update AFTER UPDATE ON categories
+BEGIN
+    UPDATE catalog_version SET version = version + 1, changed_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_categories_catalog_version_delete AFTER DELETE ON categories
+BEGIN
+    UPDATE catalog_version SET version = version + 1, changed_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_product_images_catalog_version_insert AFTER INSERT ON product_images
+BEGIN
+    UPDATE catalog_version SET version = version + 1, changed_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_product_images_catalog_version_update AFTER UPDATE ON product_images
+BEGIN
+    UPDATE catalog_version SET version = version + 1, changed_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_product_images_catalog_version_delete AFTER DELETE ON product_images
+BEGIN
+    UPDATE catalog_version SET version = version + 1, changed_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_product_weight_options_catalog_version_insert AFTER INSERT ON product_weight_options
+BEGIN
+    UPDATE catalog_version SET version = version + 1, changed_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_product_weight_options_catalog_version_update AFTER UPDATE ON product_weight_options
+BEGIN
+    UPDATE catalog_version SET version = version + 1, changed_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_product_weight_options_catalog_version_delete AFTER DELETE ON product_weight_options
+BEGIN
+    UPDATE catalog_version SET version = version + 1, changed_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
+
+-- Reviews only show on the catalog once approved.
+CREATE TRIGGER IF NOT EXISTS trg_reviews_catalog_version_insert AFTER INSERT ON reviews WHEN NEW.is_approved
+BEGIN
+    UPDATE catalog_version SET version = version + 1, changed_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_reviews_catalog_version_update AFTER UPDATE ON reviews WHEN NEW.is_approved OR OLD.is_approved
+BEGIN
+    UPDATE catalog_version SET version = version + 1, changed_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_reviews_catalog_version_delete AFTER DELETE ON reviews WHEN OLD.is_approved
+BEGIN
+    UPDATE catalog_version SET version = version + 1, changed_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
@@ -0,0 +1,57 @@
+-- Category closure table: one row per (ancestor, descendant) pair, including each category
+-- paired with itself at depth 0. "Products in this category and all its subcategories"
+-- becomes an indexed join instead of a recursive walk, and the tree endpoint gets subtree
+-- product counts in one query. Maintained by the triggers below, so every writer keeps it
+-- in sync; cycles are refused both here and, with a friendlier error, in update_category.
+
+CREATE TABLE IF NOT EXISTS category_closure (
+    ancestor_id INTEGER NOT NULL,
+    descendant_id INTEGER NOT NULL,
+    depth INTEGER NOT NULL, -- 0 for the category itself, 1 for direct children, ...
+    PRIMARY KEY (ancestor_id, descendant_id),
+    FOREIGN KEY (ancestor_id) REFERENCES categories(id) ON DELETE CASCADE,
+    FOREIGN KEY (descendant_id) REFERENCES categories(id) ON DELETE CASCADE
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_category_closure_descendant ON category_closure(descendant_id, depth);
+
+-- Backfill from parent_id. The depth bound stops the recursion on any pre-existing cycle.
+INSERT OR IGNORE INTO category_closure (ancestor_id, descendant_id, depth)
+WITH RECURSIVE tree(ancestor_id, descendant_id, depth) AS (
+    SELECT id, id, 0 FROM categories
+    UNION ALL
+    SELECT tree.ancestor_id, c.id, tree.depth + 1
+    FROM tree
+    JOIN categories c ON c.parent_id = tree.descendant_id
+    WHERE tree.depth < 64
+)
+SELECT ancestor_id, descendant_id, MIN(depth) FROM tree GROUP BY ancestor_id, descendant_id;
+
+CREATE TRIGGER IF NOT EXISTS trg_categories_closure_insert AFTER INSERT ON categories
+BEGIN
+    INSERT INTO category_closure (ancestor_id, descendant_id, depth) VALUES (NEW.id, NEW.id, 0);
+    INSERT INTO category_closure (ancestor_id, descendant_id, depth)
+    SELECT ancestor_id, NEW.id, depth + 1 FROM category_closure WHERE descendant_id = NEW.parent_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_categories_closure_no_cycle BEFORE UPDATE OF parent_id ON categories
+WHEN NEW.parent_id IS NOT NULL
+     AND EXISTS (SELECT 1 FROM category_closure WHERE ancestor_id = NEW.id AND descendant_id = NEW.parent_id)
+BEGIN
+    SELECT RAISE(ABORT, 'A category cannot be moved under itself or one of its subcategories');
+END;
+
+-- Moving a category moves its whole subtree: unlink the subtree from its old ancestors,
+-- then link it under every ancestor of the new parent. Also fires for the
+-- ON DELETE SET NULL action on the children of a deleted category.
+CREATE TRIGGER IF NOT EXISTS trg_categories_closure_move AFTER UPDATE OF parent_id ON categories
+WHEN OLD.parent_id IS NOT NEW.parent_id
+BEGIN
+    DELETE FROM category_closure
+    WHERE descendant_id IN (SELECT descendant_id FROM category_closure WHERE ancestor_id = NEW.id)
+      AND ancestor_id NOT IN (SELECT descendant_id FROM category_closure WHERE ancestor_id = NEW.id);
+    INSERT INTO category_closure (ancestor_id, descendant_id, depth)
+    SELECT above.ancestor_id, below.descendant_id, above.depth + below.depth + 1
+    FROM category_closure above
+    CROSS JOIN category_closure below
+    WHERE above.descendant_id = NEW.parent_id AND below.ancestor_id = NEW.id;
+END;
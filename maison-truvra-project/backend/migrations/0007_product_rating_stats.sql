@@ -0,0 +1,94 @@
+-- Review aggregates per product (approved reviews only), so lists can show and sort by
+-- rating without aggregating reviews per product. Kept current by the triggers below on
+-- review insert, approval changes, rating edits and deletes.
+
+CREATE TABLE IF NOT EXISTS product_rating_stats (
+    product_id INTEGER PRIMARY KEY,
+    review_count INTEGER NOT NULL DEFAULT 0,
+    rating_sum INTEGER NOT NULL DEFAULT 0,
+    average_rating REAL, -- NULL while there are no approved reviews
+    rating_1_count INTEGER NOT NULL DEFAULT 0,
+    rating_2_count INTEGER NOT NULL DEFAULT 0,
+    rating_3_count INTEGER NOT NULL DEFAULT 0,
+    rating_4_count INTEGER NOT NULL DEFAULT 0,
+    rating_5_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+);
+
+INSERT OR REPLACE INTO product_rating_stats (product_id, review_count, rating_sum, average_rating,
+                                             rating_1_count, rating_2_count, rating_3_count, rating_4_count, rating_5_count)
+SELECT product_id, COUNT(*), SUM(rating), AVG(rating),
+       SUM(rating = 1), SUM(rating = 2), SUM(rating = 3), SUM(rating = 4), SUM(rating = 5)
+FROM reviews
+WHERE is_approved = TRUE
+GROUP BY product_id;
+
+-- Approved reviews of a product, newest first (keyset pagination on review_date, id).
+CREATE INDEX IF NOT EXISTS idx_reviews_product_approved_date ON reviews(product_id, is_approved, review_date, id);
+
+CREATE TRIGGER IF NOT EXISTS trg_reviews_rating_stats_insert AFTER INSERT ON reviews WHEN NEW.is_approved
+BEGIN
+    INSERT INTO product_rating_stats (product_id, review_count, rating_sum, average_rating,
+                                      rating_1_count, rating_2_count, rating_3_count, rating_4_count, rating_5_count)
+    VALUES (NEW.product_id, 1, NEW.rating, NEW.rating,
+            NEW.rating = 1, NEW.rating = 2, NEW.rating = 3, NEW.rating = 4, NEW.rating = 5)
+    ON CONFLICT (product_id) DO UPDATE SET
+        review_count = review_count + 1,
+        rating_sum = rating_sum + excluded.rating_sum,
+        average_rating = (rating_sum + excluded.rating_sum) * 1.0 / (review_count + 1),
+        rating_1_count = rating_1_count + excluded.rating_1_count,
+        rating_2_count = rating_2_count + excluded.rating_2_count,
+        rating_3_count = rating_3_count + excluded.rating_3_count,
+        rating_4_count = rating_4_count + excluded.rating_4_count,
+        rating_5_count = rating_5_count + excluded.rating_5_count,
+        updated_at = CURRENT_TIMESTAMP;
+END;
+
+-- Approve / unapprove / rating edit / move: take the old row out, then put the new one in.
+CREATE TRIGGER IF NOT EXISTS trg_reviews_rating_stats_update AFTER UPDATE OF is_approved, rating, product_id ON reviews
+WHEN OLD.is_approved OR NEW.is_approved
+BEGIN
+    UPDATE product_rating_stats SET
+        review_count = review_count - 1,
+        rating_sum = rating_sum - OLD.rating,
+        average_rating = CASE WHEN review_count > 1 THEN (rating_sum - OLD.rating) * 1.0 / (review_count - 1) END,
+        rating_1_count = rating_1_count - (OLD.rating = 1),
+        rating_2_count = rating_2_count - (OLD.rating = 2),
+        rating_3_count = rating_3_count - (OLD.rating = 3),
+        rating_4_count = rating_4_count - (OLD.rating = 4),
+        rating_5_count = rating_5_count - (OLD.rating = 5),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE product_id = OLD.product_id AND OLD.is_approved;
+
+    INSERT INTO product_rating_stats (product_id, review_count, rating_sum, average_rating,
+                                      rating_1_count, rating_2_count, rating_3_count, rating_4_count, rating_5_count)
+    SELECT NEW.product_id, 1, NEW.rating, NEW.rating,
+           NEW.rating = 1, NEW.rating = 2, NEW.rating = 3, NEW.rating = 4, NEW.rating = 5
+    WHERE NEW.is_approved
+    ON CONFLICT (product_id) DO UPDATE SET
+        review_count = review_count + 1,
+        rating_sum = rating_sum + excluded.rating_sum,
+        average_rating = (rating_sum + excluded.rating_sum) * 1.0 / (review_count + 1),
+        rating_1_count = rating_1_count + excluded.rating_1_count,
+        rating_2_count = rating_2_count + excluded.rating_2_count,
+        rating_3_count = rating_3_count + excluded.rating_3_count,
+        rating_4_count = rating_4_count + excluded.rating_4_count,
+        rating_5_count = rating_5_count + excluded.rating_5_count,
+        updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_reviews_rating_stats_delete AFTER DELETE ON reviews WHEN OLD.is_approved
+BEGIN
+    UPDATE product_rating_stats SET
+        review_count = review_count - 1,
+        rating_sum = rating_sum - OLD.rating,
+        average_rating = CASE WHEN review_count > 1 THEN (rating_sum - OLD.rating) * 1.0 / (review_count - 1) END,
+        rating_1_count = rating_1_count - (OLD.rating = 1),
+        rating_2_count = rating_2_count - (OLD.rating = 2),
+        rating_3_count = rating_3_count - (OLD.rating = 3),
+        rating_4_count = rating_4_count - (OLD.rating = 4),
+        rating_5_count = rating_5_count - (OLD.rating = 5),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE product_id = OLD.product_id;
+END;
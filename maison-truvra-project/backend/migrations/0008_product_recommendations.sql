@@ -0,0 +1,37 @@
+-- "Frequently bought together" recommendations (see backend/recommendations.py).
+-- product_pair_counts holds, for every ordered pair of distinct products, the number of
+-- orders containing both (stored in both directions). It is accumulated incrementally from
+-- orders above the watermark in recommendation_state. product_recommendations keeps the
+-- top N neighbours of each product, ranked, so the storefront reads one primary-key range.
+-- Products whose counts changed are queued in recommendation_dirty_products, in the same
+-- transaction as the counts, and their top N is rebuilt once at the end of a refresh.
+
+CREATE TABLE IF NOT EXISTS product_pair_counts (
+    product_id INTEGER NOT NULL,
+    related_product_id INTEGER NOT NULL,
+    order_count INTEGER NOT NULL,
+    PRIMARY KEY (product_id, related_product_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS product_recommendations (
+    product_id INTEGER NOT NULL,
+    rank INTEGER NOT NULL, -- 1 = most frequently bought together
+    related_product_id INTEGER NOT NULL,
+    order_count INTEGER NOT NULL, -- Orders containing both products
+    PRIMARY KEY (product_id, rank)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS recommendation_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    last_order_id INTEGER NOT NULL DEFAULT 0, -- Orders up to this id have been counted
+    refreshed_at TIMESTAMP
+);
+INSERT OR IGNORE INTO recommendation_state (id, last_order_id) VALUES (1, 0);
+
+CREATE TABLE IF NOT EXISTS recommendation_dirty_products (
+    product_id INTEGER PRIMARY KEY
+);
+
+-- Distinct products per order, read in order-id ranges without touching the table rows.
+CREATE INDEX IF NOT EXISTS idx_order_items_order_id_product_id ON order_items(order_id, product_id);
+DROP INDEX IF EXISTS idx_order_items_order_id;
@@ -0,0 +1,44 @@
+-- Incremental marketplace feeds (backend/product_feed.py) select products by updated_at, so
+-- it has to move whenever anything the feed renders changes: the product's own columns
+-- (including stock, which inventory writes without touching updated_at), its weight options
+-- and its images. The triggers below stamp it; writers that already set it are left alone.
+
+CREATE INDEX IF NOT EXISTS idx_products_updated_at_id ON products(updated_at, id);
+
+CREATE TRIGGER IF NOT EXISTS trg_products_touch_updated_at
+AFTER UPDATE OF name, description, category_id, brand, type, base_price, currency, main_image_url,
+                aggregate_stock_quantity, aggregate_stock_weight_grams, unit_of_measure, is_active, slug ON products
+WHEN NEW.updated_at IS OLD.updated_at
+BEGIN
+    UPDATE products SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_product_weight_options_touch_product_insert AFTER INSERT ON product_weight_options
+BEGIN
+    UPDATE products SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.product_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_product_weight_options_touch_product_update AFTER UPDATE ON product_weight_options
+BEGIN
+    UPDATE products SET updated_at = CURRENT_TIMESTAMP WHERE id IN (OLD.product_id, NEW.product_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_product_weight_options_touch_product_delete AFTER DELETE ON product_weight_options
+BEGIN
+    UPDATE products SET updated_at = CURRENT_TIMESTAMP WHERE id = OLD.product_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_product_images_touch_product_insert AFTER INSERT ON product_images
+BEGIN
+    UPDATE products SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.product_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_product_images_touch_product_update AFTER UPDATE ON product_images
+BEGIN
+    UPDATE products SET updated_at = CURRENT_TIMESTAMP WHERE id IN (OLD.product_id, NEW.product_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_product_images_touch_product_delete AFTER DELETE ON product_images
+BEGIN
+    UPDATE products SET updated_at = CURRENT_TIMESTAMP WHERE id = OLD.product_id;
+END;
@@ -0,0 +1,90 @@
+-- Effective price range and availability per product, so the catalog can sort and filter on
+-- them with an index instead of a correlated subquery over weight options per row.
+--   min_price / max_price: the cheapest / dearest active weight option for variable-weight
+--                          products that have one, base_price otherwise
+--   in_stock:              product-level stock, or any active weight option in stock
+-- Kept current by the triggers below, so admin product and weight-option edits and stock
+-- movements all update them without each write path having to.
+
+ALTER TABLE products ADD COLUMN min_price REAL;
+ALTER TABLE products ADD COLUMN max_price REAL;
+ALTER TABLE products ADD COLUMN in_stock BOOLEAN NOT NULL DEFAULT FALSE;
+
+UPDATE products SET
+    min_price = COALESCE((SELECT MIN(wo.price) FROM product_weight_options wo
+                          WHERE wo.product_id = products.id AND wo.is_active = TRUE AND products.type = 'variable_weight'), base_price),
+    max_price = COALESCE((SELECT MAX(wo.price) FROM product_weight_options wo
+                          WHERE wo.product_id = products.id AND wo.is_active = TRUE AND products.type = 'variable_weight'), base_price),
+    in_stock = (COALESCE(aggregate_stock_quantity, 0) > 0 OR COALESCE(aggregate_stock_weight_grams, 0) > 0
+                OR EXISTS (SELECT 1 FROM product_weight_options wo
+                           WHERE wo.product_id = products.id AND wo.is_active = TRUE AND wo.aggregate_stock_quantity > 0));
+
+-- Price sorts (COALESCE(min_price, 0), id) and price-range filters on the same expression.
+CREATE INDEX IF NOT EXISTS idx_products_min_price_id ON products(COALESCE(min_price, 0), id);
+DROP INDEX IF EXISTS idx_products_price_id;
+
+CREATE TRIGGER IF NOT EXISTS trg_products_effective_price_insert AFTER INSERT ON products
+BEGIN
+    UPDATE products SET
+        min_price = COALESCE((SELECT MIN(wo.price) FROM product_weight_options wo
+                              WHERE wo.product_id = NEW.id AND wo.is_active = TRUE AND NEW.type = 'variable_weight'), NEW.base_price),
+        max_price = COALESCE((SELECT MAX(wo.price) FROM product_weight_options wo
+                              WHERE wo.product_id = NEW.id AND wo.is_active = TRUE AND NEW.type = 'variable_weight'), NEW.base_price),
+        in_stock = (COALESCE(NEW.aggregate_stock_quantity, 0) > 0 OR COALESCE(NEW.aggregate_stock_weight_grams, 0) > 0)
+    WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_products_effective_price_update
+AFTER UPDATE OF type, base_price, aggregate_stock_quantity, aggregate_stock_weight_grams ON products
+BEGIN
+    UPDATE products SET
+        min_price = COALESCE((SELECT MIN(wo.price) FROM product_weight_options wo
+                              WHERE wo.product_id = NEW.id AND wo.is_active = TRUE AND NEW.type = 'variable_weight'), NEW.base_price),
+        max_price = COALESCE((SELECT MAX(wo.price) FROM product_weight_options wo
+                              WHERE wo.product_id = NEW.id AND wo.is_active = TRUE AND NEW.type = 'variable_weight'), NEW.base_price),
+        in_stock = (COALESCE(NEW.aggregate_stock_quantity, 0) > 0 OR COALESCE(NEW.aggregate_stock_weight_grams, 0) > 0
+                    OR EXISTS (SELECT 1 FROM product_weight_options wo
+                               WHERE wo.product_id = NEW.id AND wo.is_active = TRUE AND wo.aggregate_stock_quantity > 0))
+    WHERE id = NEW.id;
+END;
+
+-- Weight option changes: recompute the owning product(s) from scratch.
+CREATE TRIGGER IF NOT EXISTS trg_product_weight_options_effective_price_insert AFTER INSERT ON product_weight_options
+BEGIN
+    UPDATE products SET
+        min_price = COALESCE((SELECT MIN(wo.price) FROM product_weight_options wo
+                              WHERE wo.product_id = products.id AND wo.is_active = TRUE AND products.type = 'variable_weight'), base_price),
+        max_price = COALESCE((SELECT MAX(wo.price) FROM product_weight_options wo
+                              WHERE wo.product_id = products.id AND wo.is_active = TRUE AND products.type = 'variable_weight'), base_price),
+        in_stock = (COALESCE(aggregate_stock_quantity, 0) > 0 OR COALESCE(aggregate_stock_weight_grams, 0) > 0
+                    OR EXISTS (SELECT 1 FROM product_weight_options wo
+                               WHERE wo.product_id = products.id AND wo.is_active = TRUE AND wo.aggregate_stock_quantity > 0))
+    WHERE id = NEW.product_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_product_weight_options_effective_price_update
+AFTER UPDATE OF price, is_active, aggregate_stock_quantity, product_id ON product_weight_options
+BEGIN
+    UPDATE products SET
+        min_price = COALESCE((SELECT MIN(wo.price) FROM product_weight_options wo
+                              WHERE wo.product_id = products.id AND wo.is_active = TRUE AND products.type = 'variable_weight'), base_price),
+        max_price = COALESCE((SELECT MAX(wo.price) FROM product_weight_options wo
+                              WHERE wo.product_id = products.id AND wo.is_active = TRUE AND products.type = 'variable_weight'), base_price),
+        in_stock = (COALESCE(aggregate_stock_quantity, 0) > 0 OR COALESCE(aggregate_stock_weight_grams, 0) > 0
+                    OR EXISTS (SELECT 1 FROM product_weight_options wo
+                               WHERE wo.product_id = products.id AND wo.is_active = TRUE AND wo.aggregate_stock_quantity > 0))
+    WHERE id IN (OLD.product_id, NEW.product_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_product_weight_options_effective_price_delete AFTER DELETE ON product_weight_options
+BEGIN
+    UPDATE products SET
+        min_price = COALESCE((SELECT MIN(wo.price) FROM product_weight_options wo
+                              WHERE wo.product_id = products.id AND wo.is_active = TRUE AND products.type = 'variable_weight'), base_price),
+        max_price = COALESCE((SELECT MAX(wo.price) FROM product_weight_options wo
+                              WHERE wo.product_id = products.id AND wo.is_active = TRUE AND products.type = 'variable_weight'), base_price),
+        in_stock = (COALESCE(aggregate_stock_quantity, 0) > 0 OR COALESCE(aggregate_stock_weight_grams, 0) > 0
+                    OR EXISTS (SELECT 1 FROM product_weight_options wo
+                               WHERE wo.product_id = products.id AND wo.is_active = TRUE AND wo.aggregate_stock_quantity > 0))
+    WHERE id = OLD.product_id;
+END;
@@ -0,0 +1,73 @@
+-- Checkout decrements stock on every ordered product and weight option. With the triggers of
+-- 0009 and 0010 each decrement also rewrote the product row twice (updated_at, then the
+-- effective price columns), each rewrite bumping catalog_version again. Stock only matters
+-- to those columns when availability flips, so stock updates now recompute in_stock only when
+-- a quantity crosses zero, and updated_at follows in_stock rather than raw quantities.
+
+DROP TRIGGER IF EXISTS trg_products_effective_price_update;
+CREATE TRIGGER IF NOT EXISTS trg_products_effective_price_update AFTER UPDATE OF type, base_price ON products
+BEGIN
+    UPDATE products SET
+        min_price = COALESCE((SELECT MIN(wo.price) FROM product_weight_options wo
+                              WHERE wo.product_id = NEW.id AND wo.is_active = TRUE AND NEW.type = 'variable_weight'), NEW.base_price),
+        max_price = COALESCE((SELECT MAX(wo.price) FROM product_weight_options wo
+                              WHERE wo.product_id = NEW.id AND wo.is_active = TRUE AND NEW.type = 'variable_weight'), NEW.base_price)
+    WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_products_in_stock_update
+AFTER UPDATE OF aggregate_stock_quantity, aggregate_stock_weight_grams ON products
+WHEN (COALESCE(OLD.aggregate_stock_quantity, 0) > 0) IS NOT (COALESCE(NEW.aggregate_stock_quantity, 0) > 0)
+  OR (COALESCE(OLD.aggregate_stock_weight_grams, 0) > 0) IS NOT (COALESCE(NEW.aggregate_stock_weight_grams, 0) > 0)
+BEGIN
+    UPDATE products SET
+        in_stock = (COALESCE(NEW.aggregate_stock_quantity, 0) > 0 OR COALESCE(NEW.aggregate_stock_weight_grams, 0) > 0
+                    OR EXISTS (SELECT 1 FROM product_weight_options wo
+                               WHERE wo.product_id = NEW.id AND wo.is_active = TRUE AND wo.aggregate_stock_quantity > 0))
+    WHERE id = NEW.id;
+END;
+
+DROP TRIGGER IF EXISTS trg_product_weight_options_effective_price_update;
+CREATE TRIGGER IF NOT EXISTS trg_product_weight_options_effective_price_update
+AFTER UPDATE OF price, is_active, product_id ON product_weight_options
+BEGIN
+    UPDATE products SET
+        min_price = COALESCE((SELECT MIN(wo.price) FROM product_weight_options wo
+                              WHERE wo.product_id = products.id AND wo.is_active = TRUE AND products.type = 'variable_weight'), base_price),
+        max_price = COALESCE((SELECT MAX(wo.price) FROM product_weight_options wo
+                              WHERE wo.product_id = products.id AND wo.is_active = TRUE AND products.type = 'variable_weight'), base_price),
+        in_stock = (COALESCE(aggregate_stock_quantity, 0) > 0 OR COALESCE(aggregate_stock_weight_grams, 0) > 0
+                    OR EXISTS (SELECT 1 FROM product_weight_options wo
+                               WHERE wo.product_id = products.id AND wo.is_active = TRUE AND wo.aggregate_stock_quantity > 0))
+    WHERE id IN (OLD.product_id, NEW.product_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_product_weight_options_in_stock_update
+AFTER UPDATE OF aggregate_stock_quantity ON product_weight_options
+WHEN (COALESCE(OLD.aggregate_stock_quantity, 0) > 0) IS NOT (COALESCE(NEW.aggregate_stock_quantity, 0) > 0)
+BEGIN
+    UPDATE products SET
+        in_stock = (COALESCE(aggregate_stock_quantity, 0) > 0 OR COALESCE(aggregate_stock_weight_grams, 0) > 0
+                    OR EXISTS (SELECT 1 FROM product_weight_options wo
+                               WHERE wo.product_id = products.id AND wo.is_active = TRUE AND wo.aggregate_stock_quantity > 0))
+    WHERE id = NEW.product_id;
+END;
+
+-- updated_at (marketplace feeds): stock counts only through in_stock and per-option availability.
+DROP TRIGGER IF EXISTS trg_products_touch_updated_at;
+CREATE TRIGGER IF NOT EXISTS trg_products_touch_updated_at
+AFTER UPDATE OF name, description, category_id, brand, type, base_price, currency, main_image_url,
+                unit_of_measure, is_active, slug, min_price, max_price, in_stock ON products
+WHEN NEW.updated_at IS OLD.updated_at
+BEGIN
+    UPDATE products SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+END;
+
+DROP TRIGGER IF EXISTS trg_product_weight_options_touch_product_update;
+CREATE TRIGGER IF NOT EXISTS trg_product_weight_options_touch_product_update AFTER UPDATE ON product_weight_options
+WHEN OLD.price IS NOT NEW.price OR OLD.weight_grams IS NOT NEW.weight_grams OR OLD.sku_suffix IS NOT NEW.sku_suffix
+  OR OLD.is_active IS NOT NEW.is_active OR OLD.product_id IS NOT NEW.product_id
+  OR (COALESCE(OLD.aggregate_stock_quantity, 0) > 0) IS NOT (COALESCE(NEW.aggregate_stock_quantity, 0) > 0)
+BEGIN
+    UPDATE products SET updated_at = CURRENT_TIMESTAMP WHERE id IN (OLD.product_id, NEW.product_id);
+END;
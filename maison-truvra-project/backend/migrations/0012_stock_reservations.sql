@@ -0,0 +1,31 @@
+-- Checkout stock holds (backend/stock_reservations.py). A hold is the set of rows sharing a
+-- hold_token: their quantities have already been taken out of aggregate stock by a
+-- conditional decrement, and go back if the hold is released or expires instead of
+-- becoming an order.
+
+CREATE TABLE IF NOT EXISTS stock_reservations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hold_token TEXT NOT NULL, -- Shared by the lines of one hold; returned to the client
+    user_id INTEGER,
+    product_id INTEGER NOT NULL,
+    variant_id INTEGER, -- References product_weight_options.id when the line is a weight option
+    quantity INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'held', -- held, converted (order placed), released, expired
+    expires_at TIMESTAMP NOT NULL, -- UTC, same format as CURRENT_TIMESTAMP
+    order_id INTEGER, -- Set when the hold is converted
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    closed_at TIMESTAMP, -- When it stopped being 'held'
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL,
+    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE,
+    FOREIGN KEY (variant_id) REFERENCES product_weight_options(id) ON DELETE CASCADE,
+    FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE SET NULL
+);
+CREATE INDEX IF NOT EXISTS idx_stock_reservations_hold_token ON stock_reservations(hold_token);
+-- The sweeper only ever looks at live holds, oldest expiry first.
+CREATE INDEX IF NOT EXISTS idx_stock_reservations_held_expires_at ON stock_reservations(expires_at) WHERE status = 'held';
+
+-- Serialized items allocated to a hold (status 'allocated') point back at its line.
+ALTER TABLE serialized_inventory_items ADD COLUMN reservation_id INTEGER REFERENCES stock_reservations(id) ON DELETE SET NULL;
+CREATE INDEX IF NOT EXISTS idx_serialized_inventory_items_reservation_id ON serialized_inventory_items(reservation_id) WHERE reservation_id IS NOT NULL;
+-- Claiming picks available items of a product, first expiring first.
+CREATE INDEX IF NOT EXISTS idx_serialized_inventory_items_claim ON serialized_inventory_items(product_id, status, expiry_date);
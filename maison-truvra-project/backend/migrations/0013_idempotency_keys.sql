@@ -0,0 +1,19 @@
+-- Responses of POST endpoints decorated with @idempotent (backend/idempotency.py), keyed by
+-- the client's Idempotency-Key header, so a retried request is answered from here instead of
+-- running again (a second order, a second invoice).
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    scope TEXT NOT NULL, -- Flask endpoint the key was used on
+    idempotency_key TEXT NOT NULL,
+    owner TEXT, -- JWT identity of the first request, if any; another caller cannot replay its response
+    request_hash TEXT NOT NULL, -- SHA-256 of method, path, query string and body
+    status TEXT NOT NULL DEFAULT 'in_progress', -- in_progress, completed
+    response_status INTEGER,
+    response_headers TEXT, -- JSON object (Content-Type, Location, ...)
+    response_body BLOB,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    locked_until TIMESTAMP NOT NULL, -- An in_progress claim older than this was abandoned (crashed worker)
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (scope, idempotency_key)
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys(expires_at);
@@ -0,0 +1,21 @@
+-- Follow-up work of a placed order (backend/order_events.py): checkout inserts the event in
+-- its own transaction, so an order never exists without it, and a background worker
+-- generates the invoice, links serialized items and sends the confirmation e-mail.
+
+CREATE TABLE IF NOT EXISTS order_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id INTEGER NOT NULL,
+    event_type TEXT NOT NULL, -- order_created
+    payload TEXT, -- JSON (customer e-mail and name, ...)
+    status TEXT NOT NULL DEFAULT 'pending', -- pending, processing, done, dead (retries exhausted)
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, -- Next attempt; while processing, the end of the worker's lease
+    steps_done TEXT NOT NULL DEFAULT '', -- Comma-separated handler steps already completed (not repeated on retry)
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    processed_at TIMESTAMP, -- When it became done or dead
+    FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_order_events_order_id ON order_events(order_id);
+-- The worker only claims due events; a processing event whose lease ran out is due again.
+CREATE INDEX IF NOT EXISTS idx_order_events_due ON order_events(available_at) WHERE status IN ('pending', 'processing');
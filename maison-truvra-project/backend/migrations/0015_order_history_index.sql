@@ -0,0 +1,7 @@
+-- Customer order history (GET /api/orders/history) pages through one user's orders newest
+-- first with a keyset on (order_date, id). This index answers it with a single seek and,
+-- carrying the summary columns, without reading the orders table at all.
+CREATE INDEX IF NOT EXISTS idx_orders_user_history ON orders(user_id, order_date, id, status, total_amount, currency);
+-- Superseded by the index above (same leading column).
+DROP INDEX IF EXISTS idx_orders_user_id;
+
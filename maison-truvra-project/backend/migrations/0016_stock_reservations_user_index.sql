@@ -0,0 +1,3 @@
+-- Every new hold counts its owner's live holds (STOCK_RESERVATION_MAX_HOLDS_PER_USER and
+-- STOCK_RESERVATION_MAX_UNITS_PER_USER, see stock_reservations.create_hold).
+CREATE INDEX IF NOT EXISTS idx_stock_reservations_held_user ON stock_reservations(user_id, expires_at) WHERE status = 'held';
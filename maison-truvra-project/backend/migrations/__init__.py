@@ -0,0 +1,122 @@
+# backend/migrations/__init__.py
+# Versioned schema migrations.
+# Each migration is a NNNN_description.sql file in this directory, applied in order exactly once.
+# The applied versions are recorded in the schema_version table, so checking whether a
+# database is current is a single cheap read instead of re-running the whole schema.
+import os
+import re
+import sqlite3
+
+MIGRATIONS_DIR = os.path.dirname(os.path.abspath(__file__))
+MIGRATION_FILENAME_RE = re.compile(r'^(\d{4})_([a-z0-9_]+)\.sql$')
+
+
+class MigrationError(Exception):
+    """Raised when the migration files are inconsistent or a migration fails to apply."""
+
+
+def discover_migrations(migrations_dir=MIGRATIONS_DIR):
+    """
+    Returns the available migrations as a list of (version, name, path) tuples, ordered by version.
+    Versions must be unique and contiguous starting at 1.
+    """
+    migrations = []
+    for filename in os.listdir(migrations_dir):
+        match = MIGRATION_FILENAME_RE.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(migrations_dir, filename)))
+    migrations.sort()
+    for expected_version, (version, name, _) in enumerate(migrations, start=1):
+        if version != expected_version:
+            raise MigrationError(f"Migration versions must be contiguous: expected {expected_version:04d}, found {version:04d}_{name}.")
+    return migrations
+
+
+def latest_version(migrations_dir=MIGRATIONS_DIR):
+    migrations = discover_migrations(migrations_dir)
+    return migrations[-1][0] if migrations else 0
+
+
+def get_current_version(db_conn):
+    """Returns the schema version of the database (0 for a database never migrated)."""
+    try:
+        row = db_conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    except sqlite3.OperationalError: # schema_version does not exist yet
+        return 0
+    return row[0] or 0
+
+
+def split_sql_statements(sql_script):
+    """
+    Splits a SQL script into complete statements (trigger bodies included), so a migration
+    can run statement by statement inside one transaction. executescript() would commit
+    before running and release the write lock.
+    """
+    statements = []
+    buffer = ''
+    for line in sql_script.splitlines(keepends=True):
+        buffer += line
+        if sqlite3.complete_statement(buffer):
+            statement = buffer.strip()
+            if statement and not all(l.strip().startswith('--') or not l.strip() for l in statement.splitlines()):
+                statements.append(statement)
+            buffer = ''
+    if buffer.strip() and not all(l.strip().startswith('--') or not l.strip() for l in buffer.splitlines()):
+        raise MigrationError(f"Incomplete SQL statement at end of migration: {buffer.strip()[:80]}")
+    return statements
+
+
+def apply_migrations(db_conn, logger=None, target_version=None, migrations_dir=MIGRATIONS_DIR):
+    """
+    Applies pending migrations up to target_version (default: latest).
+    Runs under BEGIN IMMEDIATE so that concurrently starting workers serialize on the
+    write lock and re-check the version; only the first one applies anything.
+    Each migration is committed together with its schema_version row.
+    Returns the list of versions applied.
+    """
+    migrations = discover_migrations(migrations_dir)
+    if target_version is None:
+        target_version = migrations[-1][0] if migrations else 0
+
+    if db_conn.in_transaction:
+        db_conn.commit()
+    db_conn.execute(
+        """CREATE TABLE IF NOT EXISTS schema_version (
+               version INTEGER PRIMARY KEY,
+               name TEXT NOT NULL,
+               applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           )"""
+    )
+    db_conn.commit()
+
+    applied = []
+    for version, name, path in migrations:
+        if version > target_version:
+            break
+        db_conn.execute("BEGIN IMMEDIATE")
+        try:
+            if get_current_version(db_conn) >= version: # Already applied (possibly by another worker)
+                db_conn.rollback()
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                statements = split_sql_statements(f.read())
+            for statement in statements:
+                db_conn.execute(statement)
+            db_conn.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+            db_conn.commit()
+        except Exception as e:
+            db_conn.rollback()
+            raise MigrationError(f"Migration {version:04d}_{name} failed: {e}") from e
+        applied.append(version)
+        if logger:
+            logger.info(f"Applied database migration {version:04d}_{name}.")
+    return applied
+
+
+def get_migration_history(db_conn):
+    """Returns the applied migrations as a list of dicts (empty for a database never migrated)."""
+    try:
+        rows = db_conn.execute("SELECT version, name, applied_at FROM schema_version ORDER BY version").fetchall()
+    except sqlite3.OperationalError:
+        return []
+    return [{'version': row[0], 'name': row[1], 'applied_at': row[2]} for row in rows]
@@ -3,6 +3,8 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt # For admin route
 from ..database import get_db_connection, query_db # Use standardized DB access
 from ..utils import format_datetime_for_display
+from ..pagination import InvalidCursorError, Keyset, get_page_size, list_response
+from ..write_queue import WriteQueueFullError, run_write
 
 newsletter_bp = Blueprint('newsletter', __name__, url_prefix='/api/newsletter')
 
@@ -41,72 +43,82 @@ def subscribe_newsletter():
         audit_logger.log_action(action='newsletter_subscribe_fail', email=email, details="Invalid email format.", status='failure', ip_address=request.remote_addr)
         return jsonify(message="Invalid email format"), 400
 
-    db = get_db_connection()
     try:
-        # Check if already subscribed and active
-        existing_subscription = query_db(
-            "SELECT id, is_active FROM newsletter_subscriptions WHERE email = ?", 
-            [email], 
-            db_conn=db, 
-            one=True
-        )
-
-        if existing_subscription and existing_subscription['is_active']:
-            audit_logger.log_action(action='newsletter_subscribe_already_active', email=email, details="Email already subscribed and active.", status='info', ip_address=request.remote_addr)
-            return jsonify(message="You are already subscribed to our newsletter."), 200 # Or 208 Already Reported
-        
-        if existing_subscription and not existing_subscription['is_active']:
-            # Re-subscribe: update is_active to TRUE and update subscribed_at and source
-            cursor = db.cursor()
-            cursor.execute(
-                "UPDATE newsletter_subscriptions SET is_active = TRUE, subscribed_at = CURRENT_TIMESTAMP, source = ? WHERE email = ?",
-                (source, email)
-            )
-            db.commit()
-            subscription_id = existing_subscription['id']
-            audit_logger.log_action(
-                action='newsletter_resubscribe_success', 
-                target_type='newsletter_subscription',
-                target_id=subscription_id, # Log with existing ID
-                email=email, 
-                details=f"Email re-subscribed from source: {source}.", 
-                status='success',
-                ip_address=request.remote_addr
-            )
-            return jsonify(message="Successfully re-subscribed to the newsletter!"), 200
-        else:
-            # New subscription
-            cursor = db.cursor()
-            cursor.execute(
-                "INSERT INTO newsletter_subscriptions (email, source, is_active) VALUES (?, ?, TRUE)",
-                (email, source)
-            )
-            subscription_id = cursor.lastrowid
-            db.commit()
-            audit_logger.log_action(
-                action='newsletter_subscribe_success', 
-                target_type='newsletter_subscription',
-                target_id=subscription_id,
-                email=email, 
-                details=f"New email subscribed from source: {source}.", 
-                status='success',
-                ip_address=request.remote_addr
-            )
-            return jsonify(message="Successfully subscribed to the newsletter!"), 201
-
-    except sqlite3.IntegrityError: # Should be caught by the check above, but as a safeguard for email UNIQUE constraint
-        db.rollback()
-        # This means the email exists, but the logic above might have missed it (e.g., race condition)
-        # Or it was inactive and we tried to insert again instead of update.
-        # The current logic should handle re-subscription by updating.
+        outcome = run_write(_subscribe_email, email, source, request.remote_addr)
+    except sqlite3.IntegrityError: # Should be caught by the check in the job, but as a safeguard for email UNIQUE constraint
+        # This means the email exists, but the job's check might have missed it (e.g., race condition)
         audit_logger.log_action(action='newsletter_subscribe_fail_integrity', email=email, details="Integrity error, email likely exists.", status='failure', ip_address=request.remote_addr)
         return jsonify(message="This email is already registered or an error occurred."), 409
+    except WriteQueueFullError:
+        current_app.logger.warning(f"Newsletter subscription for {email} rejected: write queue full.")
+        return jsonify(message="The service is busy, please try again in a moment."), 503
     except Exception as e:
-        db.rollback()
         current_app.logger.error(f"Error subscribing to newsletter for {email}: {e}")
         audit_logger.log_action(action='newsletter_subscribe_fail_server_error', email=email, details=str(e), status='failure', ip_address=request.remote_addr)
         return jsonify(message="Could not subscribe to the newsletter due to a server error."), 500
 
+    if outcome == 'already_active':
+        return jsonify(message="You are already subscribed to our newsletter."), 200 # Or 208 Already Reported
+    if outcome == 'resubscribed':
+        return jsonify(message="Successfully re-subscribed to the newsletter!"), 200
+    return jsonify(message="Successfully subscribed to the newsletter!"), 201
+
+
+def _subscribe_email(db, email, source, ip_address):
+    """
+    Write job (see write_queue.run_write): subscribes or re-subscribes an email.
+    The audit entry is written on the same connection so it commits with the subscription.
+    Returns 'already_active', 'resubscribed' or 'subscribed'.
+    """
+    audit_logger = current_app.audit_log_service
+    # Check if already subscribed and active
+    existing_subscription = query_db(
+        "SELECT id, is_active FROM newsletter_subscriptions WHERE email = ?",
+        [email],
+        db_conn=db,
+        one=True
+    )
+
+    if existing_subscription and existing_subscription['is_active']:
+        audit_logger.log_action(action='newsletter_subscribe_already_active', email=email, details="Email already subscribed and active.", status='info', ip_address=ip_address, db_conn=db)
+        return 'already_active'
+
+    cursor = db.cursor()
+    if existing_subscription:
+        # Re-subscribe: update is_active to TRUE and update subscribed_at and source
+        cursor.execute(
+            "UPDATE newsletter_subscriptions SET is_active = TRUE, subscribed_at = CURRENT_TIMESTAMP, source = ? WHERE email = ?",
+            (source, email)
+        )
+        audit_logger.log_action(
+            action='newsletter_resubscribe_success',
+            target_type='newsletter_subscription',
+            target_id=existing_subscription['id'], # Log with existing ID
+            email=email,
+            details=f"Email re-subscribed from source: {source}.",
+            status='success',
+            ip_address=ip_address,
+            db_conn=db
+        )
+        return 'resubscribed'
+
+    # New subscription
+    cursor.execute(
+        "INSERT INTO newsletter_subscriptions (email, source, is_active) VALUES (?, ?, TRUE)",
+        (email, source)
+    )
+    audit_logger.log_action(
+        action='newsletter_subscribe_success',
+        target_type='newsletter_subscription',
+        target_id=cursor.lastrowid,
+        email=email,
+        details=f"New email subscribed from source: {source}.",
+        status='success',
+        ip_address=ip_address,
+        db_conn=db
+    )
+    return 'subscribed'
+
 
 @newsletter_bp.route('/unsubscribe/<string:email>', methods=['POST']) # Changed to POST for consistency or could be GET with token
 def unsubscribe_newsletter(email):
@@ -155,16 +167,25 @@ def get_subscribers():
     # Optional: filter by is_active
     is_active_filter = request.args.get('is_active') # 'true', 'false', or None for all
 
-    query = "SELECT id, email, subscribed_at, is_active, source, updated_at FROM newsletter_subscriptions"
+    keyset = Keyset(('subscribed_at', 'id'), descending=True)
+    query = f"SELECT id, email, subscribed_at, is_active, source, updated_at {keyset.select_columns()} FROM newsletter_subscriptions"
+    conditions = []
     params = []
     if is_active_filter is not None:
-        query += " WHERE is_active = ?"
+        conditions.append("is_active = ?")
         params.append(is_active_filter.lower() == 'true')
-    query += " ORDER BY subscribed_at DESC"
 
     try:
-        subscribers_data = query_db(query, params, db_conn=db)
-        subscribers = [dict(row) for row in subscribers_data] if subscribers_data else []
+        # Keyset pagination: ?limit=, ?cursor= taken from the previous page's X-Next-Cursor header
+        cursor_condition, cursor_params = keyset.condition(request.args.get('cursor'))
+        if cursor_condition:
+            conditions.append(cursor_condition)
+            params.extend(cursor_params)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += f" {keyset.order_by()} LIMIT ?"
+        limit = get_page_size(request.args)
+        subscribers, next_cursor = keyset.paginate(query_db(query, params + [limit + 1], db_conn=db), limit)
         for sub in subscribers:
             sub['subscribed_at'] = format_datetime_for_display(sub['subscribed_at'])
             sub['updated_at'] = format_datetime_for_display(sub['updated_at'])
@@ -174,7 +195,9 @@ def get_subscribers():
             action='get_newsletter_subscribers',
             status='success'
         )
-        return jsonify(subscribers), 200
+        return list_response(subscribers, next_cursor)
+    except InvalidCursorError as e:
+        return jsonify(message=str(e)), 400
     except Exception as e:
         current_app.logger.error(f"Error fetching newsletter subscribers by admin {current_admin_id}: {e}")
         audit_logger.log_action(
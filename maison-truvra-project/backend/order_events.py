@@ -0,0 +1,524 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from .database import get_db_connection, query_db
+from .services.invoice_service import generate_invoice_pdf
+from .utils import send_email_alert
+from .write_queue import run_write
+
+# --- Order Events ---
+# Checkout used to stop at the order row: no invoice, no confirmation e-mail. Doing that work
+# in the request would tie checkout latency to the PDF renderer and the SMTP server, so
+# place_order only inserts an 'order_created' row into order_events (migration 0014) in its
+# own transaction, and a background worker does the rest after the commit:
+#   - serialized_items: links the serialized items sold with the order (marked 'sold' by the
+#     checkout transaction itself, where they are claimed) to single-unit order lines;
+#   - invoice: creates the invoice (number derived from the order, so a retry finds it
+#     again), generates its PDF with services.invoice_service and links it to the order;
+#   - confirmation_email: sends the order confirmation with utils.send_email_alert.
+# Completed steps are recorded on the event and not repeated when a later step fails.
+# A failed event is retried with exponential backoff (ORDER_EVENTS_RETRY_BASE_SECONDS,
+# doubling) and moved to 'dead' after ORDER_EVENTS_MAX_ATTEMPTS; `flask order-events requeue`
+# puts dead events back. Claims are leases (ORDER_EVENTS_LEASE_SECONDS): an event whose
+# worker died is picked up again once its lease runs out, whatever process claimed it.
+#
+# With ORDER_EVENTS_WORKER_ENABLED each worker process runs one worker thread, woken right
+# after a checkout commits; otherwise run `flask order-events run` as a separate process.
+
+ORDER_EVENT_STATUSES = ('pending', 'processing', 'done', 'dead')
+RETRY_MAX_DELAY_SECONDS = 3600
+LAST_ERROR_MAX_LENGTH = 1000
+
+
+class OrderEventStepError(RuntimeError):
+    """A handler step could not complete; the event is retried later."""
+
+
+def enqueue_order_event(db, order_id, event_type, payload=None):
+    """Inserts an event for the worker. Call it inside the transaction that writes the order."""
+    return db.execute(
+        "INSERT INTO order_events (order_id, event_type, payload) VALUES (?, ?, ?)",
+        (order_id, event_type, json.dumps(payload or {}))
+    ).lastrowid
+
+
+def claim_order_events(db, limit, lease_seconds):
+    """
+    Write job: claims up to `limit` due events (oldest first) for lease_seconds.
+    Returns the claimed rows, each with its lag (seconds since the event was created).
+    """
+    return sorted(db.execute(
+        """UPDATE order_events SET status = 'processing', attempts = attempts + 1, available_at = datetime('now', ?)
+           WHERE id IN (SELECT id FROM order_events
+                        WHERE status IN ('pending', 'processing') AND available_at <= CURRENT_TIMESTAMP
+                        ORDER BY available_at, id LIMIT ?)
+           RETURNING id, order_id, event_type, payload, attempts, steps_done,
+                     (julianday('now') - julianday(created_at)) * 86400.0 AS lag_seconds""",
+        (f"+{int(lease_seconds)} seconds", limit)
+    ).fetchall(), key=lambda row: row['id'])
+
+
+def _record_step(db, event_id, steps_done):
+    db.execute("UPDATE order_events SET steps_done = ? WHERE id = ?", (','.join(steps_done), event_id))
+
+
+def _complete_event(db, event_id):
+    db.execute(
+        """UPDATE order_events SET status = 'done', last_error = NULL, processed_at = CURRENT_TIMESTAMP
+           WHERE id = ? AND status = 'processing'""",
+        (event_id,)
+    )
+
+
+def _fail_event(db, event_id, attempts, error, max_attempts, retry_base_seconds):
+    """Write job: schedules the next attempt, or moves the event to 'dead'. Returns True if dead."""
+    if attempts >= max_attempts:
+        db.execute(
+            """UPDATE order_events SET status = 'dead', last_error = ?, processed_at = CURRENT_TIMESTAMP
+               WHERE id = ? AND status = 'processing'""",
+            (error[:LAST_ERROR_MAX_LENGTH], event_id)
+        )
+        return True
+    delay = min(retry_base_seconds * 2 ** (attempts - 1), RETRY_MAX_DELAY_SECONDS)
+    db.execute(
+        """UPDATE order_events SET status = 'pending', last_error = ?, available_at = datetime('now', ?)
+           WHERE id = ? AND status = 'processing'""",
+        (error[:LAST_ERROR_MAX_LENGTH], f"+{int(delay)} seconds", event_id)
+    )
+    return False
+
+
+def requeue_dead_events(db, event_ids=None):
+    """Write job: makes dead events (all, or the given ids) due again with a fresh attempt count."""
+    query = "UPDATE order_events SET status = 'pending', attempts = 0, available_at = CURRENT_TIMESTAMP, processed_at = NULL WHERE status = 'dead'"
+    params = []
+    if event_ids:
+        query += f" AND id IN ({', '.join('?' for _ in event_ids)})"
+        params.extend(event_ids)
+    return db.execute(query, params).rowcount
+
+
+def _load_order(db, order_id):
+    order = query_db(
+        """SELECT id, user_id, order_date, total_amount, currency, invoice_id,
+                  billing_address_line1, billing_address_line2, billing_city, billing_postal_code, billing_country
+           FROM orders WHERE id = ?""",
+        [order_id], db_conn=db, one=True
+    )
+    if order is None:
+        raise OrderEventStepError(f"Commande #{order_id} introuvable.")
+    return order
+
+
+def _order_items(db, order_id):
+    return query_db(
+        """SELECT id, product_id, serialized_item_id, quantity, unit_price, total_price, product_name, variant_description
+           FROM order_items WHERE order_id = ? ORDER BY id""",
+        [order_id], db_conn=db
+    )
+
+
+# --- Step: serialized items ---
+
+def _link_serialized_items(db, order_id):
+    """Write job: sets order_items.serialized_item_id for single-unit lines sold as one serialized item."""
+    return db.execute(
+        """UPDATE order_items SET serialized_item_id = (
+               SELECT MIN(s.id) FROM serialized_inventory_items s WHERE s.order_item_id = order_items.id AND s.status = 'sold')
+           WHERE order_id = ? AND quantity = 1 AND serialized_item_id IS NULL
+             AND EXISTS (SELECT 1 FROM serialized_inventory_items s WHERE s.order_item_id = order_items.id AND s.status = 'sold')""",
+        (order_id,)
+    ).rowcount
+
+
+def step_serialized_items(event, payload):
+    linked = run_write(_link_serialized_items, event['order_id'])
+    if linked:
+        current_app.logger.info(f"Commande #{event['order_id']} : {linked} article(s) sérialisé(s) lié(s) aux lignes de commande.")
+
+
+# --- Step: invoice ---
+
+def _order_invoice_number(order_id):
+    return f"{current_app.config.get('ORDER_INVOICE_PREFIX', 'FAC')}-{order_id:06d}"
+
+
+def _create_order_invoice(db, order_id, invoice_number):
+    """Write job: the order's invoice row and lines, created on first call. Returns the invoice row."""
+    invoice = query_db("SELECT * FROM invoices WHERE order_id = ?", [order_id], db_conn=db, one=True)
+    if invoice is not None:
+        return invoice
+    order = _load_order(db, order_id)
+    invoice_id = db.execute(
+        """INSERT INTO invoices (order_id, invoice_number, issue_date, due_date, total_amount, currency, status)
+           VALUES (?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, ?, ?, 'draft')""",
+        (order_id, invoice_number, order['total_amount'], order['currency'] or 'EUR')
+    ).lastrowid
+    db.executemany(
+        """INSERT INTO invoice_items (invoice_id, description, quantity, unit_price, total_price, product_id, serialized_item_id)
+           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+        [(invoice_id, ' - '.join(filter(None, (item['product_name'], item['variant_description']))) or f"Produit #{item['product_id']}",
+          item['quantity'], item['unit_price'], item['total_price'], item['product_id'], item['serialized_item_id'])
+         for item in _order_items(db, order_id)]
+    )
+    return query_db("SELECT * FROM invoices WHERE id = ?", [invoice_id], db_conn=db, one=True)
+
+
+def _issue_order_invoice(db, order_id, invoice_id, pdf_path):
+    db.execute(
+        "UPDATE invoices SET status = 'issued', pdf_path = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ? AND status = 'draft'",
+        (pdf_path, invoice_id)
+    )
+    db.execute("UPDATE orders SET invoice_id = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?", (invoice_id, order_id))
+
+
+def step_invoice(event, payload):
+    order_id = event['order_id']
+    invoice = run_write(_create_order_invoice, order_id, _order_invoice_number(order_id))
+    if invoice['status'] != 'draft' and invoice['pdf_path']:
+        return # Issued by an earlier attempt whose step record was lost
+
+    db = get_db_connection()
+    order = _load_order(db, order_id)
+    items = query_db(
+        "SELECT description, quantity, unit_price, total_price FROM invoice_items WHERE invoice_id = ? ORDER BY id",
+        [invoice['id']], db_conn=db
+    )
+    issue_date = invoice['issue_date'] if isinstance(invoice['issue_date'], datetime) else datetime.now()
+    customer_info = {
+        'name': payload.get('customer_name'),
+        'email': payload.get('customer_email'),
+        'address_line1': order['billing_address_line1'],
+        'address_line2': order['billing_address_line2'],
+        'city_postal_country': ' '.join(filter(None, (order['billing_postal_code'], order['billing_city'], order['billing_country']))),
+    }
+    pdf_path = generate_invoice_pdf(
+        invoice['id'], invoice['invoice_number'], issue_date,
+        issue_date + timedelta(days=current_app.config.get('ORDER_INVOICE_DUE_DAYS', 0)),
+        customer_info, [dict(item) for item in items], invoice['total_amount'], currency=invoice['currency'] or 'EUR'
+    )
+    if not pdf_path:
+        raise OrderEventStepError(f"La génération du PDF de la facture {invoice['invoice_number']} a échoué.")
+    run_write(_issue_order_invoice, order_id, invoice['id'], pdf_path)
+    current_app.logger.info(f"Facture {invoice['invoice_number']} émise pour la commande #{order_id} ({pdf_path}).")
+
+
+# --- Step: confirmation e-mail ---
+
+def _confirmation_email_body(db, order, payload):
+    name = payload.get('customer_name')
+    lines = [f"Bonjour {name}," if name else "Bonjour,", "",
+             f"Nous avons bien reçu votre commande TRUVRA{order['id']:05d}.", ""]
+    for item in _order_items(db, order['id']):
+        label = ' - '.join(filter(None, (item['product_name'], item['variant_description'])))
+        lines.append(f"  {item['quantity']} x {label} : {item['total_price']:.2f} {order['currency'] or 'EUR'}")
+    lines += ["", f"Total : {order['total_amount']:.2f} {order['currency'] or 'EUR'}"]
+
+    passports = query_db(
+        """SELECT s.item_uid, s.passport_url FROM serialized_inventory_items s
+           JOIN order_items oi ON oi.id = s.order_item_id
+           WHERE oi.order_id = ? AND s.passport_url IS NOT NULL ORDER BY s.id""",
+        [order['id']], db_conn=db
+    )
+    if passports:
+        lines += ["", "Passeports de vos produits :"] + [f"  {row['item_uid']} : {row['passport_url']}" for row in passports]
+    if order['invoice_id']:
+        invoice = query_db("SELECT invoice_number FROM invoices WHERE id = ?", [order['invoice_id']], db_conn=db, one=True)
+        if invoice:
+            lines += ["", f"Votre facture {invoice['invoice_number']} est disponible dans votre espace client."]
+    lines += ["", "Merci pour votre confiance,", "Maison Trüvra"]
+    return "\n".join(lines)
+
+
+def step_confirmation_email(event, payload):
+    config = current_app.config
+    recipient = payload.get('customer_email')
+    if not recipient:
+        current_app.logger.warning(f"Commande #{event['order_id']} : pas d'adresse e-mail, confirmation non envoyée.")
+        return
+    if not config.get('MAIL_SERVER') or not config.get('MAIL_USERNAME') or not config.get('MAIL_PASSWORD'):
+        # Retrying cannot help until the mail settings change; not worth a dead event.
+        current_app.logger.warning(f"Commande #{event['order_id']} : messagerie non configurée, confirmation non envoyée.")
+        return
+    db = get_db_connection()
+    order = _load_order(db, event['order_id'])
+    subject = f"Confirmation de votre commande TRUVRA{order['id']:05d}"
+    if not send_email_alert(subject, _confirmation_email_body(db, order, payload), recipient_email=recipient):
+        raise OrderEventStepError(f"L'envoi de la confirmation de la commande #{order['id']} à {recipient} a échoué.")
+
+
+ORDER_EVENT_HANDLERS = {
+    # Steps run in order; serialized items first so the invoice lines can reference them.
+    'order_created': (
+        ('serialized_items', step_serialized_items),
+        ('invoice', step_invoice),
+        ('confirmation_email', step_confirmation_email),
+    ),
+}
+
+
+def process_order_event(event):
+    """
+    Runs the event's remaining steps, recording each one as it completes.
+    Raises on the first failing step (the completed ones are kept).
+    """
+    steps = ORDER_EVENT_HANDLERS.get(event['event_type'])
+    if steps is None:
+        raise OrderEventStepError(f"Type d'événement inconnu : {event['event_type']}.")
+    payload = json.loads(event['payload'] or '{}')
+    steps_done = [step for step in (event['steps_done'] or '').split(',') if step]
+    for name, step in steps:
+        if name in steps_done:
+            continue
+        step(event, payload)
+        steps_done.append(name)
+        run_write(_record_step, event['id'], steps_done)
+    run_write(_complete_event, event['id'])
+
+
+class OrderEventWorker:
+    """Background thread draining order_events, with retry/dead-letter handling and lag metrics."""
+
+    def __init__(self, app, batch_size=20, poll_interval=5.0, lease_seconds=300, max_attempts=8, retry_base_seconds=30):
+        self.app = app
+        self.batch_size = max(1, int(batch_size))
+        self.poll_interval = float(poll_interval)
+        self.lease_seconds = int(lease_seconds)
+        self.max_attempts = max(1, int(max_attempts))
+        self.retry_base_seconds = int(retry_base_seconds)
+        self.pid = os.getpid()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._thread = None
+        self._stats = {
+            'claimed': 0,
+            'completed': 0,
+            'retried': 0,
+            'dead': 0,
+            'poll_errors': 0,
+            'last_lag_seconds': None,
+            'max_lag_seconds': 0.0,
+            'total_lag_seconds': 0.0,
+            'total_processing_seconds': 0.0,
+        }
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='order-events', daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        """Processes due events now instead of at the next poll (called after a checkout commits)."""
+        self._wake.set()
+
+    def stop(self, timeout=5.0):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopping:
+            try:
+                with self.app.app_context():
+                    processed = self.run_once()
+            except Exception as e:
+                processed = 0
+                with self._lock:
+                    self._stats['poll_errors'] += 1
+                self.app.logger.error(f"Order events: polling failed: {e}", exc_info=True)
+            if processed < self.batch_size: # A full batch means more may be due: go again at once
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def run_once(self):
+        """Claims and processes one batch of due events (needs an app context). Returns how many were claimed."""
+        events = run_write(claim_order_events, self.batch_size, self.lease_seconds)
+        with self._lock:
+            self._stats['claimed'] += len(events)
+        for event in events:
+            self._process(event)
+        return len(events)
+
+    def _process(self, event):
+        started = time.monotonic()
+        try:
+            process_order_event(event)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            dead = run_write(_fail_event, event['id'], event['attempts'], error, self.max_attempts, self.retry_base_seconds)
+            with self._lock:
+                self._stats['dead' if dead else 'retried'] += 1
+            log = self.app.logger.error if dead else self.app.logger.warning
+            log(f"Order event #{event['id']} ({event['event_type']}, order #{event['order_id']}) failed, attempt "
+                f"{event['attempts']}/{self.max_attempts}{' - moved to dead letters' if dead else ''}: {error}")
+            return
+        lag = event['lag_seconds'] + (time.monotonic() - started)
+        with self._lock:
+            self._stats['completed'] += 1
+            self._stats['last_lag_seconds'] = round(lag, 3)
+            self._stats['max_lag_seconds'] = max(self._stats['max_lag_seconds'], round(lag, 3))
+            self._stats['total_lag_seconds'] += lag
+            self._stats['total_processing_seconds'] += time.monotonic() - started
+
+    def stats(self):
+        """Returns a snapshot of this worker's metrics (throughput, retries, created-to-done lag)."""
+        with self._lock:
+            snapshot = dict(self._stats)
+        completed = snapshot['completed']
+        snapshot.update({
+            'pid': self.pid,
+            'running': self._thread is not None and self._thread.is_alive(),
+            'batch_size': self.batch_size,
+            'max_attempts': self.max_attempts,
+            'avg_lag_seconds': round(snapshot['total_lag_seconds'] / completed, 3) if completed else 0.0,
+            'avg_processing_ms': round(snapshot['total_processing_seconds'] * 1000.0 / completed, 3) if completed else 0.0,
+        })
+        del snapshot['total_lag_seconds'], snapshot['total_processing_seconds']
+        return snapshot
+
+
+def _create_worker(app):
+    config = app.config
+    return OrderEventWorker(
+        app,
+        batch_size=config.get('ORDER_EVENTS_BATCH_SIZE', 20),
+        poll_interval=config.get('ORDER_EVENTS_POLL_SECONDS', 5.0),
+        lease_seconds=config.get('ORDER_EVENTS_LEASE_SECONDS', 300),
+        max_attempts=config.get('ORDER_EVENTS_MAX_ATTEMPTS', 8),
+        retry_base_seconds=config.get('ORDER_EVENTS_RETRY_BASE_SECONDS', 30)
+    )
+
+
+_worker_lock = threading.Lock()
+
+def get_order_event_worker(app=None):
+    """
+    Returns this worker process's running OrderEventWorker, or None when ORDER_EVENTS_WORKER_ENABLED
+    is off. Like the write queue, the worker (and its thread) is recreated after a fork.
+    """
+    if app is None:
+        app = current_app._get_current_object()
+    if not app.config.get('ORDER_EVENTS_WORKER_ENABLED', False):
+        return None
+    worker = app.extensions.get('order_event_worker')
+    if worker is None or worker.pid != os.getpid():
+        with _worker_lock:
+            worker = app.extensions.get('order_event_worker')
+            if worker is None or worker.pid != os.getpid():
+                worker = _create_worker(app)
+                worker.start()
+                app.extensions['order_event_worker'] = worker
+                app.logger.info(f"Order event worker started (pid {worker.pid}).")
+    return worker
+
+
+def notify_order_events():
+    """Wakes this process's worker, if any, so a just-committed event is handled right away."""
+    worker = get_order_event_worker()
+    if worker is not None:
+        worker.wake()
+
+
+def order_event_metrics(db):
+    """Queue-side metrics: events per status, due backlog and the age of the oldest unfinished event."""
+    counts = {status: 0 for status in ORDER_EVENT_STATUSES}
+    for row in db.execute("SELECT status, COUNT(*) FROM order_events GROUP BY status"):
+        counts[row[0]] = row[1]
+    backlog = db.execute(
+        """SELECT COUNT(*) AS due, (julianday('now') - julianday(MIN(created_at))) * 86400.0 AS oldest_age_seconds
+           FROM order_events WHERE status IN ('pending', 'processing') AND available_at <= CURRENT_TIMESTAMP"""
+    ).fetchone()
+    oldest_unfinished = db.execute(
+        """SELECT (julianday('now') - julianday(MIN(created_at))) * 86400.0 FROM order_events
+           WHERE status IN ('pending', 'processing')"""
+    ).fetchone()[0]
+    return {
+        'counts': counts,
+        'due': backlog['due'],
+        'oldest_due_age_seconds': round(backlog['oldest_age_seconds'], 3) if backlog['oldest_age_seconds'] is not None else None,
+        'oldest_unfinished_age_seconds': round(oldest_unfinished, 3) if oldest_unfinished is not None else None,
+    }
+
+
+def dead_order_events(db, limit=50):
+    return [dict(row) for row in db.execute(
+        """SELECT id, order_id, event_type, attempts, steps_done, last_error, created_at, processed_at
+           FROM order_events WHERE status = 'dead' ORDER BY processed_at DESC, id DESC LIMIT ?""",
+        (limit,)
+    )]
+
+
+def init_order_event_worker(app):
+    """Starts the worker thread lazily, in each worker process, when ORDER_EVENTS_WORKER_ENABLED is set."""
+    if not app.config.get('ORDER_EVENTS_WORKER_ENABLED', False):
+        return
+
+    @app.before_request
+    def ensure_order_event_worker():
+        get_order_event_worker(app)
+
+
+@click.group('order-events')
+def order_events_cli():
+    """Post-order pipeline (invoices, confirmation e-mails)."""
+
+
+@order_events_cli.command('run')
+@click.option('--once', is_flag=True, help="Process the events due now, then exit.")
+@with_appcontext
+def order_events_run_command(once):
+    """Process order events in the foreground (when the in-process worker is disabled)."""
+    worker = _create_worker(current_app._get_current_object())
+    if once:
+        total = 0
+        while True:
+            with current_app.app_context():
+                claimed = worker.run_once()
+            total += claimed
+            if claimed < worker.batch_size:
+                break
+        click.echo(f"Processed {total} event(s): {json.dumps(worker.stats())}")
+        return
+    click.echo("Processing order events (Ctrl+C to stop)...")
+    worker.start()
+    try:
+        while worker._thread.is_alive():
+            worker._thread.join(1.0)
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+@order_events_cli.command('stats')
+@with_appcontext
+def order_events_stats_command():
+    """Print queue metrics and the most recent dead events."""
+    db = get_db_connection()
+    click.echo(json.dumps(dict(order_event_metrics(db), dead_events=dead_order_events(db, limit=20)), indent=2, default=str))
+
+
+@order_events_cli.command('requeue')
+@click.argument('event_ids', nargs=-1, type=int)
+@with_appcontext
+def order_events_requeue_command(event_ids):
+    """Retry dead events (the given ids, or all of them)."""
+    db = get_db_connection()
+    try:
+        requeued = requeue_dead_events(db, list(event_ids))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    click.echo(f"Requeued {requeued} dead event(s).")
+
+
+def register_order_event_commands(app):
+    """Registers the `flask order-events` command group."""
+    app.cli.add_command(order_events_cli)
@@ -0,0 +1,192 @@
+import csv
+import io
+import json
+import os
+import sys
+import zlib
+from datetime import timezone
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from .database import get_db_connection
+from .utils import parse_datetime_from_iso
+
+# --- Order Export (Accounting) ---
+# Finance pulls the order history every month. Building it as a list of dicts (the admin
+# listing's approach) grows with the history, so the export walks
+# orders ⨝ users ⨝ order_items in (order_date, id) order with fetchmany(ORDER_EXPORT_BATCH_SIZE),
+# renders each batch as CSV or JSONL lines and writes it out in ~64 KB chunks, optionally
+# through a streaming gzip compressor: memory stays flat whatever the row count.
+# One row per order line; an order without lines still gets one row with empty line columns.
+
+ORDER_EXPORT_COLUMNS = (
+    'order_id', 'order_reference', 'order_date', 'status', 'currency', 'order_total', 'shipping_cost',
+    'payment_method', 'payment_transaction_id', 'invoice_number',
+    'customer_id', 'customer_email', 'customer_name', 'company_name', 'vat_number',
+    'billing_postal_code', 'billing_city', 'billing_country',
+    'line_id', 'product_id', 'variant_id', 'product_name', 'variant_description', 'quantity', 'unit_price', 'line_total',
+)
+ORDER_EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+ORDER_STATUSES = ('pending_payment', 'paid', 'processing', 'shipped', 'delivered', 'cancelled', 'refunded')
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+
+def parse_export_date(value, name):
+    """'2024-05-01' or an ISO datetime -> 'YYYY-MM-DD HH:MM:SS' in UTC, as order_date is stored; None if empty."""
+    if not value:
+        return None
+    parsed = parse_datetime_from_iso(value) # Naive values are taken as UTC
+    if parsed is None:
+        raise ValueError(f"Invalid '{name}' value: {value!r} (expected an ISO 8601 date or datetime)")
+    return parsed.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def parse_export_statuses(value):
+    """'paid,shipped' -> ('paid', 'shipped'); None for all statuses. Raises ValueError for unknown ones."""
+    if not value:
+        return None
+    statuses = tuple(dict.fromkeys(status.strip() for status in value.split(',') if status.strip()))
+    unknown = [status for status in statuses if status not in ORDER_STATUSES]
+    if unknown:
+        raise ValueError(f"Unknown order status(es): {', '.join(unknown)}. Use: {', '.join(ORDER_STATUSES)}")
+    return statuses or None
+
+
+def iter_order_export_batches(db_conn, date_from=None, date_to=None, statuses=None, batch_size=None):
+    """
+    Yields batches of rows (sequences in ORDER_EXPORT_COLUMNS order), one row per order line,
+    oldest order first.
+    :param date_from: 'YYYY-MM-DD HH:MM:SS' (UTC), inclusive.
+    :param date_to: 'YYYY-MM-DD HH:MM:SS' (UTC), exclusive (a month is from=2024-05-01, to=2024-06-01).
+    :param statuses: Order statuses to keep (all if None).
+    """
+    batch_size = batch_size or current_app.config.get('ORDER_EXPORT_BATCH_SIZE', 1000)
+    conditions, params = [], []
+    if date_from:
+        conditions.append("o.order_date >= ?")
+        params.append(date_from)
+    if date_to:
+        conditions.append("o.order_date < ?")
+        params.append(date_to)
+    if statuses:
+        conditions.append(f"o.status IN ({', '.join('?' for _ in statuses)})")
+        params.extend(statuses)
+
+    # Every column is computed in SQL, so rows go to the writers as they come out of fetchmany.
+    # +o.order_date: the value as stored, without the PARSE_DECLTYPES datetime conversion.
+    cursor = db_conn.execute(
+        f"""SELECT o.id, printf('TRUVRA%05d', o.id), +o.order_date, o.status, COALESCE(o.currency, 'EUR'), o.total_amount,
+                   o.shipping_cost, o.payment_method, o.payment_transaction_id, i.invoice_number,
+                   u.id, u.email, TRIM(COALESCE(u.first_name, '') || ' ' || COALESCE(u.last_name, '')), u.company_name, u.vat_number,
+                   o.billing_postal_code, o.billing_city, o.billing_country,
+                   oi.id, oi.product_id, oi.variant_id, oi.product_name, oi.variant_description,
+                   oi.quantity, oi.unit_price, oi.total_price
+            FROM orders o
+            JOIN users u ON u.id = o.user_id
+            LEFT JOIN invoices i ON i.id = o.invoice_id
+            LEFT JOIN order_items oi ON oi.order_id = o.id
+            {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+            ORDER BY o.order_date, o.id, oi.id""",
+        params
+    )
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def generate_csv_rows(batches):
+    """Yields the export as CSV, header first, then one string per batch."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(ORDER_EXPORT_COLUMNS)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def generate_jsonl_rows(batches):
+    """Yields the export as JSON Lines (one object per row), one string per batch."""
+    for rows in batches:
+        yield ''.join(json.dumps(dict(zip(ORDER_EXPORT_COLUMNS, row)), ensure_ascii=False) + '\n' for row in rows)
+
+
+def _encoded_chunks(parts, compress=False, chunk_bytes=EXPORT_CHUNK_BYTES):
+    """Joins small strings into ~chunk_bytes UTF-8 chunks, gzip-compressed as a single stream if asked."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None # wbits 31: gzip container
+    pending, size = [], 0
+    for part in parts:
+        pending.append(part)
+        size += len(part)
+        if size >= chunk_bytes:
+            data = ''.join(pending).encode('utf-8')
+            pending, size = [], 0
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+    data = ''.join(pending).encode('utf-8')
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+def generate_order_export(db_conn, export_format='csv', date_from=None, date_to=None, statuses=None,
+                          compress=False, batch_size=None):
+    """Byte chunks of the whole export in the given format ('csv' or 'jsonl'), gzipped if `compress`."""
+    batches = iter_order_export_batches(db_conn, date_from=date_from, date_to=date_to, statuses=statuses, batch_size=batch_size)
+    parts = generate_jsonl_rows(batches) if export_format == 'jsonl' else generate_csv_rows(batches)
+    return _encoded_chunks(parts, compress=compress)
+
+
+def order_export_filename(export_format, date_from=None, date_to=None, compress=False):
+    period = '_'.join(value[:10] for value in (date_from, date_to) if value)
+    return f"orders{'-' + period if period else ''}.{export_format}{'.gz' if compress else ''}"
+
+
+@click.command('export-orders')
+@click.option('--format', 'export_format', type=click.Choice(sorted(ORDER_EXPORT_FORMATS)), default='csv', show_default=True)
+@click.option('--from', 'date_from', default=None, help='Orders placed at or after this ISO date/datetime (UTC).')
+@click.option('--to', 'date_to', default=None, help='Orders placed before this ISO date/datetime (UTC), exclusive.')
+@click.option('--status', 'statuses', default=None, help='Comma-separated order statuses (default: all).')
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False, writable=True), default=None, help='File to write (default: stdout).')
+@with_appcontext
+def export_orders_command(export_format, date_from, date_to, statuses, compress, output):
+    """Write orders and order lines for accounting (CSV or JSON Lines)."""
+    try:
+        date_from = parse_export_date(date_from, 'from')
+        date_to = parse_export_date(date_to, 'to')
+        statuses = parse_export_statuses(statuses)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    chunks = generate_order_export(get_db_connection(), export_format=export_format, date_from=date_from,
+                                   date_to=date_to, statuses=statuses, compress=compress)
+    if output is None:
+        for chunk in chunks:
+            sys.stdout.buffer.write(chunk)
+        sys.stdout.buffer.flush()
+        return
+    # Written next to the target and renamed, so a reader never sees half an export.
+    temporary_path = f"{output}.tmp"
+    with open(temporary_path, 'wb') as export_file:
+        for chunk in chunks:
+            export_file.write(chunk)
+    os.replace(temporary_path, output)
+    click.echo(f"Wrote {export_format} order export to {output}", err=True)
+
+
+def register_order_export_commands(app):
+    """Registers `flask export-orders`."""
+    app.cli.add_command(export_orders_command)
@@ -0,0 +1,83 @@
+from .database import query_db
+from .pagination import Keyset
+from .utils import format_datetime_for_display
+
+# --- Customer Order History ---
+# A page of one customer's orders, newest first, with each order's summary (line and item
+# counts, first line and its thumbnail) computed in the same grouped query: the keyset page
+# of orders is picked from idx_orders_user_history (migration 0015) without touching the
+# orders table, then joined to its items. Professional accounts with thousands of orders
+# pay for one page, not for their whole history.
+
+HISTORY_KEYSET = Keyset(('order_date', 'id'), descending=True)
+
+
+def public_order_reference(order_id):
+    """The order number shown to customers (checkout response, e-mails)."""
+    return f"TRUVRA{order_id:05d}"
+
+
+def order_history_page(db, user_id, limit, cursor=None):
+    """
+    Returns (orders as dicts, next_cursor) for one page of the user's history.
+    Raises InvalidCursorError for a malformed cursor.
+    """
+    cursor_condition, cursor_params = HISTORY_KEYSET.condition(cursor)
+    # With exactly one min() aggregate, SQLite takes the bare columns (first line's name and
+    # image) from the row holding the minimum, i.e. the order's first line.
+    rows = query_db(
+        f"""SELECT o.id, o.order_date, o.status, o.total_amount, o.currency, o._keyset_0, o._keyset_1,
+                   COUNT(oi.id) AS line_count, COALESCE(SUM(oi.quantity), 0) AS item_count,
+                   MIN(oi.id) AS first_item_id, oi.product_name AS first_item_name, p.main_image_url AS first_item_image_url
+            FROM (SELECT id, order_date, status, total_amount, currency {HISTORY_KEYSET.select_columns()}
+                  FROM orders
+                  WHERE user_id = ? {'AND ' + cursor_condition if cursor_condition else ''}
+                  {HISTORY_KEYSET.order_by()} LIMIT ?) o
+            LEFT JOIN order_items oi ON oi.order_id = o.id
+            LEFT JOIN products p ON p.id = oi.product_id
+            GROUP BY o.id
+            ORDER BY o._keyset_0 DESC, o._keyset_1 DESC""",
+        [user_id] + cursor_params + [limit + 1], db_conn=db
+    )
+    orders, next_cursor = HISTORY_KEYSET.paginate(rows, limit)
+    for order in orders:
+        order['orderId'] = public_order_reference(order['id'])
+        order['order_date'] = format_datetime_for_display(order['order_date'])
+        first_item_id = order.pop('first_item_id')
+        order['first_item'] = {
+            'id': first_item_id,
+            'product_name': order.pop('first_item_name'),
+            'image_url': order.pop('first_item_image_url'),
+        } if first_item_id is not None else None
+    return orders, next_cursor
+
+
+def load_order_detail(db, user_id, order_id):
+    """One of the user's orders with its lines, serialized items and invoice; None if not theirs."""
+    order = query_db(
+        """SELECT o.id, o.order_date, o.status, o.total_amount, o.currency, o.payment_method,
+                  o.shipping_address_line1, o.shipping_address_line2, o.shipping_city, o.shipping_postal_code,
+                  o.shipping_country, o.shipping_method, o.shipping_cost, o.tracking_number, o.notes_customer,
+                  i.invoice_number, i.status AS invoice_status
+           FROM orders o
+           LEFT JOIN invoices i ON i.id = o.invoice_id
+           WHERE o.id = ? AND o.user_id = ?""",
+        [order_id, user_id], db_conn=db, one=True
+    )
+    if order is None:
+        return None
+    order = dict(order)
+    order['orderId'] = public_order_reference(order['id'])
+    order['order_date'] = format_datetime_for_display(order['order_date'])
+    order['items'] = [dict(row) for row in query_db(
+        """SELECT oi.id, oi.product_id, oi.variant_id, oi.quantity, oi.unit_price, oi.total_price,
+                  oi.product_name, oi.variant_description, p.slug AS product_slug, p.main_image_url AS image_url,
+                  si.item_uid AS serialized_item_uid, si.passport_url
+           FROM order_items oi
+           LEFT JOIN products p ON p.id = oi.product_id
+           LEFT JOIN serialized_inventory_items si ON si.id = oi.serialized_item_id
+           WHERE oi.order_id = ?
+           ORDER BY oi.id""",
+        [order_id], db_conn=db
+    )]
+    return order
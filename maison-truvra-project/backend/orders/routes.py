@@ -1,183 +1,197 @@
 # backend/orders/routes.py
 from flask import Blueprint, request, jsonify, current_app, g
-from ..database import get_db, record_stock_movement
+from flask_jwt_extended import get_jwt_identity, jwt_required, verify_jwt_in_request
+from ..checkout import place_order, reserve_cart
+from ..database import get_db_connection
+from ..idempotency import idempotency_claim, idempotent, store_idempotent_response
+from ..order_events import notify_order_events
+from ..order_history import load_order_detail, order_history_page, public_order_reference
+from ..pagination import NEXT_CURSOR_HEADER, InvalidCursorError, get_page_size
+from ..stock_reservations import HoldLimitError, InsufficientStockError, release_hold
 from ..utils import is_valid_email
+from ..write_queue import WriteQueueFullError, run_write
 from ..auth.routes import admin_required # Assuming you might need admin_required for some order ops later
-import jwt # For decoding token if user_id comes from token
 
 orders_bp = Blueprint('orders_bp', __name__, url_prefix='/api/orders')
 
+HISTORY_PAGE_SIZE = 20
+
+def _checkout_user_id(data):
+    """
+    Orders belong to a user account (orders.user_id is required): the JWT identity if the
+    request carries a valid token, else an explicit userId from the payload (legacy clients).
+    Holds (/reservations) require the token.
+    """
+    user_id = None
+    try:
+        verify_jwt_in_request(optional=True)
+        user_id = get_jwt_identity()
+    except Exception as e:
+        current_app.logger.info(f"Checkout : jeton ignoré ({e}).")
+    return user_id or data.get('userId')
+
+def _order_placed_response(order_id, total_amount):
+    response = jsonify({
+        "success": True,
+        "message": "Commande passée avec succès !",
+        "orderId": public_order_reference(order_id),
+        "totalAmount": round(total_amount, 2)
+    })
+    response.status_code = 201
+    return response
+
+def _place_order_idempotently(db, claim, *args, **kwargs):
+    """Write job: place_order, and the response stored for the request's Idempotency-Key in the same transaction."""
+    order_id, total_amount = place_order(db, *args, **kwargs)
+    store_idempotent_response(db, claim, _order_placed_response(order_id, total_amount))
+    return order_id, total_amount
+
 @orders_bp.route('/checkout', methods=['POST'])
+@idempotent() # Mobile clients retry on timeouts: same Idempotency-Key, same order
 def checkout():
-    data = request.get_json()
-    current_app.logger.info(f"Données de checkout reçues : {data}")
+    data = request.get_json(silent=True) or {}
+    cart_items = data.get('cartItems')
+    hold_token = data.get('holdToken') # From POST /reservations; the order is then the held lines
+    current_app.logger.info(f"Checkout reçu : {len(cart_items) if isinstance(cart_items, list) else 0} ligne(s) de panier.")
 
     customer_email = data.get('customerEmail')
     shipping_address_data = data.get('shippingAddress') 
-    cart_items = data.get('cartItems')
-    
-    # Determine user_id: from payload if explicitly sent, or from JWT if available
-    user_id = data.get('userId', None)
-    if not user_id and hasattr(g, 'current_user_id') and g.current_user_id:
-        user_id = g.current_user_id
-    elif not user_id and request.headers.get('Authorization'): # Fallback: check token directly if g not set
-        auth_header = request.headers.get('Authorization')
-        if auth_header and auth_header.startswith('Bearer '):
-            token = auth_header.split(" ")[1]
-            try:
-                payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
-                user_id = payload.get('user_id')
-            except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-                user_id = None # Token invalid or expired, proceed as guest or require login
+    user_id = _checkout_user_id(data)
 
     # --- Validations d'entrée ---
     if not customer_email or not is_valid_email(customer_email):
         return jsonify({"success": False, "message": "Adresse e-mail du client invalide ou manquante."}), 400
     if not shipping_address_data or not all(k in shipping_address_data for k in ['address', 'zipcode', 'city', 'country', 'firstname', 'lastname']):
         return jsonify({"success": False, "message": "Adresse de livraison incomplète."}), 400
-    if not cart_items or not isinstance(cart_items, list) or len(cart_items) == 0:
+    if not hold_token and (not cart_items or not isinstance(cart_items, list) or len(cart_items) == 0):
         return jsonify({"success": False, "message": "Panier vide ou invalide."}), 400
-
-    shipping_address_full = (
-        f"{shipping_address_data.get('firstname', '')} {shipping_address_data.get('lastname', '')}\n"
-        f"{shipping_address_data['address']}\n"
-        f"{shipping_address_data.get('apartment', '')}\n"
-        f"{shipping_address_data['zipcode']} {shipping_address_data['city']}\n"
-        f"{shipping_address_data['country']}"
-    ).replace('\n\n','\n').strip()
-
-    db = None # Initialize db to None
+    if not user_id:
+        return jsonify({"success": False, "message": "Veuillez vous connecter pour passer commande."}), 401
+
+    shipping_address = {
+        'line1': shipping_address_data['address'],
+        'line2': shipping_address_data.get('apartment') or None,
+        'city': shipping_address_data['city'],
+        'postal_code': shipping_address_data['zipcode'],
+        'country': shipping_address_data['country'],
+    }
+
+    payment_successful = True # Placeholder for actual payment integration
+    if not payment_successful:
+        return jsonify({"success": False, "message": "Le paiement a échoué."}), 400
+
+    customer_name_for_order = f"{shipping_address_data.get('firstname', '')} {shipping_address_data.get('lastname', '')}".strip()
     try:
-        db = get_db()
-        cursor = db.cursor()
-        
-        total_amount_calculated = 0
-        validated_items_for_order = []
-
-        for item_from_cart in cart_items:
-            product_id_cart = item_from_cart.get('id')
-            quantity_ordered = int(item_from_cart.get('quantity', 0))
-            price_from_cart = float(item_from_cart.get('price', 0))
-            variant_option_id_cart = item_from_cart.get('variant_option_id', None) 
-            
-            if quantity_ordered <= 0:
-                raise ValueError(f"Quantité invalide pour {item_from_cart.get('name')}.")
-
-            actual_price_db = 0
-            current_stock_db = 0
-
-            if variant_option_id_cart:
-                cursor.execute("SELECT price, stock_quantity FROM product_weight_options WHERE option_id = ? AND product_id = ?", 
-                               (variant_option_id_cart, product_id_cart))
-                variant_info = cursor.fetchone()
-                if not variant_info:
-                    raise ValueError(f"Option de produit {item_from_cart.get('name')} (Variante ID: {variant_option_id_cart}) non trouvée.")
-                actual_price_db = variant_info['price']
-                current_stock_db = variant_info['stock_quantity']
-            else: 
-                cursor.execute("SELECT base_price, stock_quantity FROM products WHERE id = ?", (product_id_cart,))
-                product_info = cursor.fetchone()
-                if not product_info:
-                    raise ValueError(f"Produit {item_from_cart.get('name')} (ID: {product_id_cart}) non trouvé.")
-                if product_info['base_price'] is None and not variant_option_id_cart:
-                     raise ValueError(f"Configuration de prix incorrecte pour le produit {product_id_cart}. variant_option_id manquant.")
-                actual_price_db = product_info['base_price']
-                current_stock_db = product_info['stock_quantity']
-            
-            if abs(actual_price_db - price_from_cart) > 0.01: # Price check tolerance
-                current_app.logger.warning(
-                    f"Discordance de prix pour {product_id_cart} (Variante: {variant_option_id_cart}). "
-                    f"Client: {price_from_cart}, DB: {actual_price_db}. Utilisation du prix DB."
-                )
-            
-            if current_stock_db < quantity_ordered:
-                raise ValueError(f"Stock insuffisant pour {item_from_cart.get('name')}. Demandé: {quantity_ordered}, Disponible: {current_stock_db}")
-
-            total_amount_calculated += actual_price_db * quantity_ordered
-            validated_items_for_order.append({
-                "product_id": product_id_cart,
-                "product_name": item_from_cart.get('name'),
-                "quantity": quantity_ordered,
-                "price_at_purchase": actual_price_db,
-                "variant": item_from_cart.get('variant'),
-                "variant_option_id": variant_option_id_cart
-            })
-        
-        payment_successful = True # Placeholder for actual payment integration
-        if not payment_successful:
-            if db: db.rollback()
-            return jsonify({"success": False, "message": "Le paiement a échoué."}), 400
-
-        customer_name_for_order = f"{shipping_address_data.get('firstname', '')} {shipping_address_data.get('lastname', '')}".strip()
-        cursor.execute(
-            "INSERT INTO orders (user_id, customer_email, customer_name, shipping_address, total_amount, status) VALUES (?, ?, ?, ?, ?, ?)",
-            (user_id, customer_email, customer_name_for_order, shipping_address_full, total_amount_calculated, 'Paid')
+        # Validation and inserts run as one write job (set-based, see checkout.py); stock is
+        # taken with conditional decrements, so concurrent checkouts cannot oversell.
+        order_id, total_amount_calculated = run_write(
+            _place_order_idempotently, idempotency_claim(), user_id, cart_items or [], shipping_address,
+            internal_note=f"Client : {customer_name_for_order} <{customer_email}>",
+            hold_token=hold_token, customer_email=customer_email, customer_name=customer_name_for_order or None
         )
-        order_id = cursor.lastrowid
         current_app.logger.info(f"Commande #{order_id} créée pour {customer_email}.")
-
-        for item in validated_items_for_order:
-            cursor.execute(
-                '''INSERT INTO order_items (order_id, product_id, product_name, quantity, price_at_purchase, variant, variant_option_id) 
-                   VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                (order_id, item['product_id'], item['product_name'], item['quantity'], 
-                 item['price_at_purchase'], item['variant'], item['variant_option_id'])
-            )
-            record_stock_movement(cursor, item['product_id'], -item['quantity'], 'vente', 
-                                  variant_option_id=item['variant_option_id'], order_id=order_id, 
-                                  notes=f"Vente pour commande #{order_id}")
-        
-        db.commit()
-        
-        return jsonify({
-            "success": True, 
-            "message": "Commande passée avec succès !",
-            "orderId": f"TRUVRA{order_id:05d}",
-            "totalAmount": round(total_amount_calculated, 2)
-        }), 201
-
+        # Invoice and confirmation e-mail are handled by the order event worker, after the response.
+        try:
+            notify_order_events()
+        except Exception as e:
+            current_app.logger.error(f"Commande #{order_id} : réveil du traitement post-commande impossible ({e}), il sera repris au prochain passage.")
+        return _order_placed_response(order_id, total_amount_calculated)
+
+    except InsufficientStockError as se:
+        current_app.logger.info(f"Checkout refusé, stock insuffisant : {se}")
+        return jsonify({"success": False, "message": str(se)}), 409
     except ValueError as ve:
-        if db: db.rollback()
         current_app.logger.warning(f"Erreur de validation lors du checkout : {ve}")
         return jsonify({"success": False, "message": str(ve)}), 400
+    except WriteQueueFullError:
+        current_app.logger.warning(f"Checkout pour {customer_email} refusé : file d'écriture saturée.")
+        return jsonify({"success": False, "message": "Le service est momentanément saturé, veuillez réessayer."}), 503
     except Exception as e:
-        if db: db.rollback()
         current_app.logger.error(f"Erreur de checkout : {e}", exc_info=True)
         return jsonify({"success": False, "message": "Une erreur interne est survenue lors de la création de la commande."}), 500
-    finally:
-        if db: db.close()
 
-@orders_bp.route('/history', methods=['GET'])
-def get_order_history():
-    # This route should be protected, e.g., by requiring a valid user token
-    user_id = None
-    auth_header = request.headers.get('Authorization')
-    if not auth_header or not auth_header.startswith('Bearer '):
-        return jsonify({"success": False, "message": "Authentification requise."}), 401
+@orders_bp.route('/reservations', methods=['POST'])
+@jwt_required() # Holds take stock off sale: signed-in customers only, within their hold limits
+def create_reservation():
+    """
+    Holds the cart's stock for STOCK_RESERVATION_TTL_SECONDS (e.g. while the customer pays).
+    Pass the returned holdToken to /checkout; unused holds are released when they expire.
+    """
+    data = request.get_json(silent=True) or {}
+    cart_items = data.get('cartItems')
+    if not cart_items or not isinstance(cart_items, list):
+        return jsonify({"success": False, "message": "Panier vide ou invalide."}), 400
 
-    token = auth_header.split(" ")[1]
     try:
-        payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
-        user_id = payload.get('user_id')
-        if not user_id:
-            return jsonify({"success": False, "message": "Token invalide (user_id manquant)."}), 401
-    except jwt.ExpiredSignatureError:
-        return jsonify({"success": False, "message": "Token expiré."}), 401
-    except jwt.InvalidTokenError:
-        return jsonify({"success": False, "message": "Token invalide."}), 401
-
-    db = None
+        hold_token, expires_at, order_items, total_amount = run_write(reserve_cart, get_jwt_identity(), cart_items)
+    except HoldLimitError as le:
+        return jsonify({"success": False, "message": str(le)}), 429
+    except InsufficientStockError as se:
+        return jsonify({"success": False, "message": str(se)}), 409
+    except ValueError as ve:
+        return jsonify({"success": False, "message": str(ve)}), 400
+    except WriteQueueFullError:
+        return jsonify({"success": False, "message": "Le service est momentanément saturé, veuillez réessayer."}), 503
+    except Exception as e:
+        current_app.logger.error(f"Erreur lors de la réservation du panier : {e}", exc_info=True)
+        return jsonify({"success": False, "message": "Erreur serveur lors de la réservation du panier."}), 500
+
+    return jsonify({
+        "success": True,
+        "holdToken": hold_token,
+        "expiresAt": expires_at.isoformat(),
+        "totalAmount": total_amount,
+        "items": [{'productId': item['product_id'], 'variantId': item['variant_id'], 'quantity': item['quantity'],
+                   'unitPrice': item['unit_price']} for item in order_items]
+    }), 201
+
+@orders_bp.route('/reservations/<string:hold_token>', methods=['DELETE'])
+@jwt_required()
+def cancel_reservation(hold_token):
+    """Gives a hold's stock back before it expires (cart abandoned or edited)."""
     try:
-        db = get_db()
-        cursor = db.cursor()
-        cursor.execute(
-            "SELECT order_id, total_amount, order_date, status FROM orders WHERE user_id = ? ORDER BY order_date DESC",
-            (user_id,)
+        released = run_write(release_hold, hold_token, get_jwt_identity())
+    except WriteQueueFullError:
+        return jsonify({"success": False, "message": "Le service est momentanément saturé, veuillez réessayer."}), 503
+    except Exception as e:
+        current_app.logger.error(f"Erreur lors de la libération de la réservation {hold_token} : {e}", exc_info=True)
+        return jsonify({"success": False, "message": "Erreur serveur lors de la libération de la réservation."}), 500
+    if not released:
+        return jsonify({"success": False, "message": "Réservation introuvable ou déjà clôturée."}), 404
+    return jsonify({"success": True, "released": released}), 200
+
+@orders_bp.route('/history', methods=['GET'])
+@jwt_required()
+def get_order_history():
+    """
+    The customer's orders, newest first, one page at a time (?limit=, ?cursor= from nextCursor),
+    each with its line and item counts and first line (for the thumbnail).
+    """
+    user_id = get_jwt_identity()
+    try:
+        orders, next_cursor = order_history_page(
+            get_db_connection(), user_id, get_page_size(request.args, default=HISTORY_PAGE_SIZE), request.args.get('cursor')
         )
-        orders = [dict(row) for row in cursor.fetchall()]
-        return jsonify({"success": True, "orders": orders}), 200
+    except InvalidCursorError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
     except Exception as e:
         current_app.logger.error(f"Erreur lors de la récupération de l'historique des commandes pour l'utilisateur {user_id}: {e}", exc_info=True)
         return jsonify({"success": False, "message": "Erreur serveur lors de la récupération de l'historique."}), 500
-    finally:
-        if db: db.close()
+    response = jsonify({"success": True, "orders": orders, "nextCursor": next_cursor})
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response, 200
+
+@orders_bp.route('/<int:order_id>', methods=['GET'])
+@jwt_required()
+def get_order_detail(order_id):
+    """One of the customer's orders with its lines (404 for orders of other accounts)."""
+    user_id = get_jwt_identity()
+    try:
+        order = load_order_detail(get_db_connection(), user_id, order_id)
+    except Exception as e:
+        current_app.logger.error(f"Erreur lors de la récupération de la commande {order_id} pour l'utilisateur {user_id}: {e}", exc_info=True)
+        return jsonify({"success": False, "message": "Erreur serveur lors de la récupération de la commande."}), 500
+    if order is None:
+        return jsonify({"success": False, "message": "Commande introuvable."}), 404
+    return jsonify({"success": True, "order": order}), 200
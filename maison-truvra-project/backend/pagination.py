@@ -0,0 +1,110 @@
+import base64
+import binascii
+import json
+from flask import jsonify
+
+# --- Keyset (Cursor) Pagination ---
+# LIMIT/OFFSET makes SQLite walk and discard every skipped row, so page 500 of the audit
+# log costs 500 times page 1. Keyset pagination instead remembers the sort key of the last
+# row returned and asks for rows strictly after it with a row-value comparison
+# ((a, b) < (?, ?)), which an index on the same columns answers with a single seek.
+# The last row's key travels to the client as an opaque cursor.
+# Admin list endpoints keep returning a plain JSON array (the admin UI expects one) and pass
+# the cursor for the next page in the X-Next-Cursor response header.
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor cannot be decoded or does not match the requested ordering."""
+
+
+def encode_cursor(values):
+    """Encodes sort-key values as an opaque, URL-safe cursor."""
+    payload = json.dumps(list(values), separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, expected_length):
+    """Decodes a cursor produced by encode_cursor, checking it carries `expected_length` values."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (ValueError, UnicodeError, binascii.Error) as e:
+        raise InvalidCursorError(f"Malformed pagination cursor: {e}") from e
+    if not isinstance(values, list) or len(values) != expected_length:
+        raise InvalidCursorError("Pagination cursor does not match this listing's sort order.")
+    return values
+
+
+class Keyset:
+    """
+    A stable ordering for keyset pagination: SQL expressions compared as one row value,
+    all in the same direction. The last expression must make the key unique (usually the id).
+
+        keyset = Keyset(('al.timestamp', 'al.id'), descending=True)
+        condition, condition_params = keyset.condition(cursor)
+        sql = f"SELECT al.* {keyset.select_columns()} FROM audit_log al WHERE ... {keyset.order_by()} LIMIT ?"
+        rows, next_cursor = keyset.paginate(query_db(sql, params + [limit + 1], db_conn=db), limit)
+
+    Sort expressions must not produce NULL (row values never compare with NULL); wrap
+    nullable columns in COALESCE.
+    """
+
+    def __init__(self, columns, descending=False):
+        self.columns = tuple(columns)
+        self.descending = descending
+
+    def condition(self, cursor):
+        """Returns (sql, params) restricting results to rows after the cursor, or (None, []) without one."""
+        if not cursor:
+            return None, []
+        values = decode_cursor(cursor, len(self.columns))
+        operator = '<' if self.descending else '>'
+        placeholders = ', '.join('?' for _ in self.columns)
+        return f"({', '.join(self.columns)}) {operator} ({placeholders})", values
+
+    def select_columns(self):
+        """
+        Extra select-list entries (with a leading comma) carrying each row's sort key.
+        The unary + makes each an expression without a declared type, so PARSE_DECLTYPES
+        converters leave the value exactly as stored and the cursor compares like the column.
+        """
+        return ''.join(f", +{column} AS _keyset_{index}" for index, column in enumerate(self.columns))
+
+    def order_by(self):
+        direction = 'DESC' if self.descending else 'ASC'
+        return "ORDER BY " + ", ".join(f"{column} {direction}" for column in self.columns)
+
+    def paginate(self, rows, limit):
+        """
+        Takes up to limit + 1 fetched rows and returns (page as list of dicts, next_cursor).
+        next_cursor is None on the last page. The sort-key columns are stripped from the dicts.
+        """
+        rows = [dict(row) for row in rows or []]
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        key_names = [f"_keyset_{index}" for index in range(len(self.columns))]
+        next_cursor = encode_cursor([rows[-1][name] for name in key_names]) if has_more and rows else None
+        for row in rows:
+            for name in key_names:
+                row.pop(name, None)
+        return rows, next_cursor
+
+
+def get_page_size(args, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE, param='limit'):
+    """Reads a page size from request args, clamped to [1, maximum]."""
+    value = args.get(param, default, type=int)
+    return max(1, min(value or default, maximum))
+
+
+def list_response(items, next_cursor, status=200):
+    """JSON array response carrying the next page's cursor (if any) in the X-Next-Cursor header."""
+    response = jsonify(items)
+    response.status_code = status
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response
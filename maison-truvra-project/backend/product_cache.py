@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from .http_cache import forget_catalog_version, get_catalog_version
+
+# --- Product Detail Cache ---
+# The product page costs four queries plus date formatting and JSON encoding on every hit.
+# The assembled JSON body is kept per worker process in a bounded LRU with a TTL, keyed
+# by (slug, locale). Each entry remembers the catalog version (migration 0005) it was built
+# from and is only served while that version is current. Any catalog write, from any worker
+# process, bumps the version through triggers, so workers never serve a stale page for
+# longer than CATALOG_VERSION_CACHE_SECONDS. Admin write paths also call
+# invalidate_product_detail, which drops the product's entries at once in their own process.
+
+
+class ProductDetailCache:
+    """Thread-safe LRU + TTL cache of serialized product detail responses."""
+
+    def __init__(self, max_entries=1000, ttl_seconds=300.0):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = float(ttl_seconds)
+        self._entries = OrderedDict() # (slug, locale) -> (body, product_id, catalog_version, stored_at)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0, 'expired': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get(self, key, catalog_version):
+        """Returns the cached body for key if it was built from catalog_version and has not expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            body, _, entry_version, stored_at = entry
+            if entry_version != catalog_version:
+                del self._entries[key]
+                self._stats['stale'] += 1
+                self._stats['misses'] += 1
+                return None
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return body
+
+    def put(self, key, body, product_id, catalog_version):
+        with self._lock:
+            self._entries[key] = (body, product_id, catalog_version, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, product_id=None):
+        """Drops the entries of one product (all locales), or every entry when product_id is None."""
+        with self._lock:
+            if product_id is None:
+                removed = len(self._entries)
+                self._entries.clear()
+            else:
+                keys = [key for key, entry in self._entries.items() if entry[1] == product_id]
+                for key in keys:
+                    del self._entries[key]
+                removed = len(keys)
+            self._stats['invalidations'] += removed
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats, entries=len(self._entries))
+        lookups = snapshot['hits'] + snapshot['misses']
+        snapshot.update({
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'hit_rate': round(snapshot['hits'] / lookups, 4) if lookups else 0.0,
+        })
+        return snapshot
+
+
+def get_product_detail_cache(app=None):
+    """Returns the app's ProductDetailCache, or None when PRODUCT_DETAIL_CACHE_ENABLED is off."""
+    if app is None:
+        app = current_app._get_current_object()
+    if not app.config.get('PRODUCT_DETAIL_CACHE_ENABLED', True):
+        return None
+    cache = app.extensions.get('product_detail_cache')
+    if cache is None:
+        cache = app.extensions.setdefault('product_detail_cache', ProductDetailCache(
+            max_entries=app.config.get('PRODUCT_DETAIL_CACHE_MAX_ENTRIES', 1000),
+            ttl_seconds=app.config.get('PRODUCT_DETAIL_CACHE_TTL_SECONDS', 300.0)
+        ))
+    return cache
+
+
+def get_cached_product_detail(slug, locale):
+    """Returns (cached body or None, current catalog version)."""
+    cache = get_product_detail_cache()
+    version, _ = get_catalog_version()
+    if cache is None:
+        return None, version
+    return cache.get((slug, locale), version), version
+
+
+def cache_product_detail(slug, locale, body, product_id, catalog_version):
+    cache = get_product_detail_cache()
+    if cache is not None:
+        cache.put((slug, locale), body, product_id, catalog_version)
+
+
+def invalidate_product_detail(product_id=None):
+    """
+    Write-through hook for routes that change what the product page shows: drops this
+    process's cached pages for the product (or all of them) and its cached catalog version.
+    Call after the write has committed.
+    """
+    forget_catalog_version()
+    cache = get_product_detail_cache()
+    if cache is not None:
+        cache.invalidate(int(product_id) if product_id is not None else None) # Ids may arrive as strings from JSON bodies
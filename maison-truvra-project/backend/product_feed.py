@@ -0,0 +1,240 @@
+import csv
+import io
+import os
+import sys
+from datetime import timezone
+from xml.sax.saxutils import escape
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from .database import get_db_connection, load_child_rows, query_db
+from .utils import parse_datetime_from_iso
+
+# --- Marketplace Product Feed ---
+# Google Shopping style feeds (RSS 2.0 XML with the g: namespace, or CSV with the same
+# columns) for nightly pushes to marketplaces. The catalog is walked in product-id order with
+# fetchmany(FEED_BATCH_SIZE); each batch loads its weight options and images with one query
+# per table, is rendered and dropped, so memory stays flat however large the catalog is.
+# Variable-weight products become one item per active weight option, grouped by item_group_id.
+# With `since`, only products whose updated_at moved (migration 0009 keeps it current) are
+# emitted, including deactivated ones as out of stock so marketplaces delist them.
+
+FEED_COLUMNS = (
+    'id', 'item_group_id', 'title', 'description', 'link', 'image_link', 'additional_image_link',
+    'availability', 'price', 'brand', 'product_type', 'condition', 'identifier_exists', 'unit_pricing_measure',
+)
+FEED_MAX_ADDITIONAL_IMAGES = 10 # Google Shopping limit
+FEED_CHUNK_BYTES = 64 * 1024 # Items are written out in chunks of about this size
+FEED_FORMATS = {
+    'xml': 'application/xml',
+    'csv': 'text/csv',
+}
+
+
+def parse_feed_since(value):
+    """'2024-05-01' or an ISO datetime -> 'YYYY-MM-DD HH:MM:SS' in UTC, as CURRENT_TIMESTAMP stores it; None if empty."""
+    if not value:
+        return None
+    parsed = parse_datetime_from_iso(value) # Naive values are taken as UTC
+    if parsed is None:
+        raise ValueError(f"Invalid 'since' value: {value!r} (expected an ISO 8601 date or datetime)")
+    return parsed.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _category_paths(db_conn):
+    """category id -> "Parent > Child" path, from the closure table (categories are few)."""
+    paths = {}
+    rows = query_db(
+        """SELECT cc.descendant_id, c.name
+           FROM category_closure cc JOIN categories c ON c.id = cc.ancestor_id
+           ORDER BY cc.descendant_id, cc.depth DESC""",
+        db_conn=db_conn
+    )
+    for row in rows or []:
+        paths.setdefault(row['descendant_id'], []).append(row['name'])
+    return {category_id: ' > '.join(names) for category_id, names in paths.items()}
+
+
+def _absolute_url(base_url, path):
+    if not path:
+        return ''
+    if path.startswith(('http://', 'https://')):
+        return path
+    return f"{base_url}/assets/{path.lstrip('/')}"
+
+
+def iter_feed_items(db_conn, since=None, batch_size=None, site_url=None, currency_default='EUR'):
+    """
+    Yields one dict (FEED_COLUMNS) per feed item, reading products in batches.
+    :param since: 'YYYY-MM-DD HH:MM:SS' (UTC); only products updated at or after it, active or not.
+    """
+    batch_size = batch_size or current_app.config.get('FEED_BATCH_SIZE', 500)
+    site_url = (site_url or current_app.config.get('FEED_SITE_URL', '')).rstrip('/')
+    category_paths = _category_paths(db_conn)
+
+    query = """
+        SELECT id, name, description, category_id, brand, type, base_price, currency, main_image_url,
+               aggregate_stock_quantity, aggregate_stock_weight_grams, unit_of_measure, is_active, slug, sku_prefix
+        FROM products
+    """
+    params = []
+    if since:
+        query += " WHERE updated_at >= ?"
+        params.append(since)
+    else:
+        query += " WHERE is_active = TRUE"
+    query += " ORDER BY id"
+
+    cursor = db_conn.execute(query, params)
+    try:
+        while True:
+            products = cursor.fetchmany(batch_size)
+            if not products:
+                break
+            product_ids = [product['id'] for product in products]
+            weight_options = load_child_rows(
+                db_conn,
+                # Changed-since feeds also carry deactivated options, so they are delisted
+                f"SELECT product_id, id, weight_grams, price, sku_suffix, aggregate_stock_quantity, is_active FROM product_weight_options WHERE product_id IN ({{placeholders}}){'' if since else ' AND is_active = TRUE'} ORDER BY product_id, weight_grams",
+                (product['id'] for product in products if product['type'] == 'variable_weight'), 'product_id'
+            )
+            images = load_child_rows(
+                db_conn,
+                "SELECT product_id, image_url FROM product_images WHERE product_id IN ({placeholders}) ORDER BY product_id, is_primary DESC, id",
+                product_ids, 'product_id'
+            )
+            for product in products:
+                yield from _product_feed_items(product, weight_options.get(product['id'], []), images.get(product['id'], []),
+                                               category_paths, site_url, currency_default)
+    finally:
+        cursor.close()
+
+
+def _product_feed_items(product, options, images, category_paths, site_url, currency_default):
+    image_urls = [_absolute_url(site_url, image['image_url']) for image in images]
+    main_image = _absolute_url(site_url, product['main_image_url']) or (image_urls[0] if image_urls else '')
+    base = {
+        'item_group_id': '',
+        'title': product['name'],
+        'description': product['description'] or product['name'],
+        'link': f"{site_url}/produit-detail.html?slug={product['slug']}",
+        'image_link': main_image,
+        'additional_image_link': [url for url in image_urls if url != main_image][:FEED_MAX_ADDITIONAL_IMAGES],
+        'brand': product['brand'] or '',
+        'product_type': category_paths.get(product['category_id'], ''),
+        'condition': 'new',
+        'identifier_exists': 'no',
+        'unit_pricing_measure': '',
+    }
+    currency = product['currency'] or currency_default
+
+    if product['type'] == 'variable_weight' and options:
+        base['item_group_id'] = product['sku_prefix'] or str(product['id'])
+        for option in options:
+            in_stock = product['is_active'] and option['is_active'] and (option['aggregate_stock_quantity'] or 0) > 0
+            weight = f"{option['weight_grams']:g}"
+            yield dict(base,
+                       id=f"{product['sku_prefix'] or product['id']}-{option['sku_suffix']}",
+                       title=f"{product['name']} - {weight} g",
+                       price=f"{option['price']:.2f} {currency}",
+                       availability='in_stock' if in_stock else 'out_of_stock',
+                       unit_pricing_measure=f"{weight} g")
+        return
+
+    in_stock = product['is_active'] and (
+        (product['aggregate_stock_quantity'] or 0) > 0 or (product['aggregate_stock_weight_grams'] or 0) > 0
+    )
+    price = product['base_price']
+    yield dict(base,
+               id=product['sku_prefix'] or str(product['id']),
+               price=f"{price:.2f} {currency}" if price is not None else '',
+               availability='in_stock' if in_stock else 'out_of_stock')
+
+
+def generate_xml_feed(items, title='Maison Trüvra', site_url=''):
+    """Yields the feed as RSS 2.0 / Google Shopping XML, one string per item."""
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<rss version="2.0" xmlns:g="http://base.google.com/ns/1.0">\n<channel>\n'
+           f"<title>{escape(title)}</title>\n<link>{escape(site_url)}</link>\n"
+           f"<description>{escape(title)} product feed</description>\n")
+    for item in items:
+        lines = ['<item>']
+        for column in FEED_COLUMNS:
+            value = item.get(column)
+            if value in (None, '', []):
+                continue
+            if column == 'additional_image_link':
+                lines.extend(f"<g:additional_image_link>{escape(url)}</g:additional_image_link>" for url in value)
+            elif column in ('title', 'description', 'link'):
+                lines.append(f"<{column}>{escape(str(value))}</{column}>")
+            else:
+                lines.append(f"<g:{column}>{escape(str(value))}</g:{column}>")
+        lines.append('</item>\n')
+        yield '\n'.join(lines)
+    yield '</channel>\n</rss>\n'
+
+
+def generate_csv_feed(items):
+    """Yields the feed as CSV (header first), one string per item."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=FEED_COLUMNS, extrasaction='ignore', lineterminator='\n')
+    writer.writeheader()
+    for item in items:
+        writer.writerow(dict(item, additional_image_link=','.join(item.get('additional_image_link') or [])))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _in_chunks(parts, chunk_bytes=FEED_CHUNK_BYTES):
+    """Joins small strings into chunks of about chunk_bytes, so streams are not written item by item."""
+    pending, size = [], 0
+    for part in parts:
+        pending.append(part)
+        size += len(part)
+        if size >= chunk_bytes:
+            yield ''.join(pending)
+            pending, size = [], 0
+    if pending:
+        yield ''.join(pending)
+
+
+def generate_feed(db_conn, feed_format='xml', since=None, batch_size=None):
+    """Chunks of the whole feed in the given format ('xml' or 'csv')."""
+    site_url = current_app.config.get('FEED_SITE_URL', '').rstrip('/')
+    items = iter_feed_items(db_conn, since=since, batch_size=batch_size, site_url=site_url)
+    if feed_format == 'csv':
+        return _in_chunks(generate_csv_feed(items))
+    return _in_chunks(generate_xml_feed(items, title=current_app.config.get('FEED_TITLE', 'Maison Trüvra'), site_url=site_url))
+
+
+@click.command('export-feed')
+@click.option('--format', 'feed_format', type=click.Choice(sorted(FEED_FORMATS)), default='xml', show_default=True)
+@click.option('--since', default=None, help='Only products changed since this ISO date/datetime (UTC).')
+@click.option('--output', '-o', type=click.Path(dir_okay=False, writable=True), default=None, help='File to write (default: stdout).')
+@with_appcontext
+def export_feed_command(feed_format, since, output):
+    """Write the marketplace product feed (Google Shopping XML or CSV)."""
+    try:
+        since = parse_feed_since(since)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--since')
+    chunks = generate_feed(get_db_connection(), feed_format=feed_format, since=since)
+    if output is None:
+        for chunk in chunks:
+            sys.stdout.write(chunk)
+        return
+    # Written next to the target and renamed, so a concurrent upload never sees half a feed.
+    temporary_path = f"{output}.tmp"
+    with open(temporary_path, 'w', encoding='utf-8', newline='') as feed_file:
+        for chunk in chunks:
+            feed_file.write(chunk)
+    os.replace(temporary_path, output)
+    click.echo(f"Wrote {feed_format} feed to {output}", err=True)
+
+
+def register_feed_commands(app):
+    """Registers `flask export-feed`."""
+    app.cli.add_command(export_feed_command)
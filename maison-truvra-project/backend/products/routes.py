@@ -1,7 +1,16 @@
 import sqlite3
 from flask import Blueprint, request, jsonify, current_app, g
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt # For review submission
-from ..database import get_db_connection, query_db # query_db uses get_db_connection
+from ..category_tree import build_category_tree, subtree_condition
+from ..database import get_db_connection, load_child_rows, query_db # query_db uses get_db_connection
+from ..facets import (
+    PRODUCT_PRICE_SORT_SQL, build_facet_query, facet_filters, fetch_facet_rows, price_range_conditions,
+    product_filter_conditions, shape_facets
+)
+from ..http_cache import catalog_cache
+from ..product_cache import cache_product_detail, get_cached_product_detail
+from ..pagination import InvalidCursorError, Keyset, get_page_size
+from ..search import build_fts_query, fts_products_source
 from ..utils import format_datetime_for_display, generate_slug # Assuming generate_slug is in utils
 
 # This is the more comprehensive blueprint that will be kept.
@@ -24,78 +33,174 @@ def get_locale():
     return request.headers.get('Accept-Language', 'en').split(',')[0].split('-')[0]
 
 
+# Sort options for the public product list, as keyset orderings (see pagination.Keyset).
+# The trailing p.id makes each order total, so cursor pages never skip or repeat products.
+PRODUCT_LIST_SORTS = {
+    'relevance': Keyset(('fts.rank', 'p.id')), # bm25: lower is more relevant; only with a search
+    'name_asc': Keyset(('p.name', 'p.id')),
+    'name_desc': Keyset(('p.name', 'p.id'), descending=True),
+    'price_asc': Keyset((PRODUCT_PRICE_SORT_SQL, 'p.id')), # Effective "from" price, weight options included
+    'price_desc': Keyset((PRODUCT_PRICE_SORT_SQL, 'p.id'), descending=True),
+    'date_desc': Keyset(('p.created_at', 'p.id'), descending=True), # Newest first
+    'rating': Keyset(('COALESCE(rs.average_rating, 0)', 'COALESCE(rs.review_count, 0)', 'p.id'), descending=True), # Best rated first
+}
+
+# Approved reviews on the product page, newest first. The detail response embeds the first
+# page; GET /<product_id>/reviews?cursor= serves the following ones.
+REVIEWS_KEYSET = Keyset(('r.review_date', 'r.id'), descending=True)
+REVIEWS_PAGE_SIZE = 10
+
+# Cart and checkout pages refresh every line through GET /batch in one request.
+PRODUCT_BATCH_MAX_ITEMS = 250
+
+
+def rating_summary(stats_row):
+    """Rating block for a product from its product_rating_stats row (None without approved reviews)."""
+    if not stats_row or not stats_row['review_count']:
+        return {'average': None, 'count': 0, 'histogram': {str(stars): 0 for stars in range(1, 6)}}
+    return {
+        'average': round(stats_row['average_rating'], 2),
+        'count': stats_row['review_count'],
+        'histogram': {str(stars): stats_row[f'rating_{stars}_count'] for stars in range(1, 6)},
+    }
+
+
+def get_approved_reviews_page(db, product_id, cursor=None, limit=REVIEWS_PAGE_SIZE):
+    """One page of a product's approved reviews, newest first. Returns (reviews, next_cursor)."""
+    query = f"""
+        SELECT r.id, r.rating, r.comment, r.review_date, u.first_name as user_first_name {REVIEWS_KEYSET.select_columns()}
+        FROM reviews r
+        JOIN users u ON r.user_id = u.id
+        WHERE r.product_id = ? AND r.is_approved = TRUE
+    """
+    params = [product_id]
+    cursor_condition, cursor_params = REVIEWS_KEYSET.condition(cursor)
+    if cursor_condition:
+        query += f" AND {cursor_condition}"
+        params.extend(cursor_params)
+    query += f" {REVIEWS_KEYSET.order_by()} LIMIT ?"
+    reviews, next_cursor = REVIEWS_KEYSET.paginate(query_db(query, params + [limit + 1], db_conn=db), limit)
+    for review_dict in reviews:
+        review_dict['review_date'] = format_datetime_for_display(review_dict['review_date'])
+    return reviews, next_cursor
+
+
 @products_bp.route('/', methods=['GET'])
+@catalog_cache(max_age=60, stale_while_revalidate=300)
 def get_products_list():
     db = get_db()
     lang = get_locale() # For potential future localized fields
 
     try:
         page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
+        per_page = get_page_size(request.args, default=10, param='per_page')
         category_slug = request.args.get('category')
         search_term = request.args.get('search')
-        sort_by = request.args.get('sort', 'name_asc') # e.g., name_asc, name_desc, price_asc, price_desc, date_desc
+        sort_by = request.args.get('sort', 'name_asc') # e.g., relevance, name_asc, name_desc, price_asc, price_desc, date_desc, rating
+        # Keyset pagination: pass back the previous response's next_cursor instead of a page number.
+        # page/OFFSET is still honoured when no cursor is given, for existing clients.
+        cursor = request.args.get('cursor')
+
+        offset = 0 if cursor else (page - 1) * per_page
 
-        offset = (page - 1) * per_page
+        fts_query = build_fts_query(search_term)
+        if search_term and fts_query is None: # Nothing searchable (e.g. only punctuation)
+            return jsonify({"products": [], "page": page, "per_page": per_page, "total_products": 0, "total_pages": 0, "next_cursor": None}), 200
+        if fts_query and 'sort' not in request.args:
+            sort_by = 'relevance' # Searches rank by relevance unless another order is requested
 
-        base_query = """
+        # Full-text search (products_fts, accent-insensitive, prefix matching) drives the query,
+        # so it also provides the bm25 rank used by sort=relevance.
+        products_source = fts_products_source() if fts_query else "products p"
+        source_params = [fts_query] if fts_query else []
+
+        # Sorting logic
+        if sort_by == 'relevance' and not fts_query:
+            sort_by = 'name_asc'
+        keyset = PRODUCT_LIST_SORTS.get(sort_by, PRODUCT_LIST_SORTS['name_asc']) # Default sort: name
+
+        base_query = f"""
             SELECT 
                 p.id, p.name, p.description, p.slug, p.base_price, p.currency, 
                 p.main_image_url, p.type, p.unit_of_measure, p.is_featured,
                 p.aggregate_stock_quantity, p.aggregate_stock_weight_grams,
-                c.name as category_name, c.slug as category_slug
-            FROM products p
+                p.min_price, p.max_price, p.in_stock,
+                c.name as category_name, c.slug as category_slug,
+                rs.average_rating, COALESCE(rs.review_count, 0) as review_count
+                {keyset.select_columns()}
+            FROM {products_source}
             LEFT JOIN categories c ON p.category_id = c.id
+            LEFT JOIN product_rating_stats rs ON rs.product_id = p.id
             WHERE p.is_active = TRUE
         """
-        count_query = """
+        count_query = f"""
             SELECT COUNT(p.id)
-            FROM products p
+            FROM {products_source}
             LEFT JOIN categories c ON p.category_id = c.id
             WHERE p.is_active = TRUE
         """
 
         conditions = []
-        params = []
+        params = list(source_params)
 
         if category_slug:
-            conditions.append("c.slug = ?")
+            # The category and all of its subcategories (category_closure); ?subcategories=false for an exact match
+            if request.args.get('subcategories', 'true').lower() == 'false':
+                conditions.append("c.slug = ?")
+            else:
+                conditions.append(subtree_condition('p.category_id'))
             params.append(category_slug)
-        
-        if search_term:
-            # Basic search on name and description. Can be expanded.
-            conditions.append("(LOWER(p.name) LIKE ? OR LOWER(p.description) LIKE ?)")
-            params.extend([f"%{search_term.lower()}%", f"%{search_term.lower()}%"])
+        # ?min_price= / ?max_price= on the effective price (index range on idx_products_min_price_id)
+        range_conditions, range_params = price_range_conditions(request.args)
+        conditions.extend(range_conditions)
+        params.extend(range_params)
+        base_conditions, base_params = list(conditions), list(params) # Search, category, price range: what facets count within
+
+        # Facet filters (?brand=, ?type=, ?in_stock=, ?price_band=), see facets.py
+        selected_facets = facet_filters(request.args)
+        filter_conditions, filter_params = product_filter_conditions(selected_facets)
+        conditions.extend(filter_conditions)
+        params.extend(filter_params)
 
         if conditions:
-            base_query += " AND " + " AND ".join(conditions)
             count_query += " AND " + " AND ".join(conditions)
-        
-        # Sorting logic
-        if sort_by == 'name_asc':
-            base_query += " ORDER BY p.name ASC"
-        elif sort_by == 'name_desc':
-            base_query += " ORDER BY p.name DESC"
-        elif sort_by == 'price_asc':
-            base_query += " ORDER BY p.base_price ASC"
-        elif sort_by == 'price_desc':
-            base_query += " ORDER BY p.base_price DESC"
-        elif sort_by == 'date_desc': # Newest first
-            base_query += " ORDER BY p.created_at DESC"
-        else: # Default sort
-            base_query += " ORDER BY p.name ASC"
-
-        base_query += " LIMIT ? OFFSET ?"
-        params.extend([per_page, offset])
-
-        products_data = query_db(base_query, params, db_conn=db)
-        total_products_row = query_db(count_query, params[:-2], db_conn=db, one=True) # Exclude limit/offset params for count
-        total_products = total_products_row[0] if total_products_row else 0
+        count_params = list(params)
+
+        cursor_condition, cursor_params = keyset.condition(cursor)
+        if cursor_condition:
+            conditions.append(cursor_condition)
+            params.extend(cursor_params)
+
+        if conditions:
+            base_query += " AND " + " AND ".join(conditions)
+        base_query += f" {keyset.order_by()} LIMIT ? OFFSET ?"
+        params.extend([per_page + 1, offset]) # One extra row tells whether there is a next page
+
+        products_data, next_cursor = keyset.paginate(query_db(base_query, params, db_conn=db), per_page)
+        # Counting is a full pass over the matches, so it is only done for the first request;
+        # following a cursor costs the same on every page.
+        total_products = None
+        if not cursor:
+            total_products_row = query_db(count_query, count_params, db_conn=db, one=True)
+            total_products = total_products_row[0] if total_products_row else 0
+
+        # ?facets=true adds the filter counts, computed from one grouped query
+        facets = None
+        if request.args.get('facets', 'false').lower() == 'true':
+            facet_query, facet_params = build_facet_query(products_source, base_conditions, base_params)
+            facets = shape_facets(fetch_facet_rows(db, facet_query, facet_params), selected_facets)
+
+        # Weight options for every variable-weight product on the page in one query
+        weight_options = load_child_rows(
+            db,
+            "SELECT product_id, id, weight_grams, price, sku_suffix, aggregate_stock_quantity FROM product_weight_options WHERE product_id IN ({placeholders}) AND is_active = TRUE ORDER BY product_id, weight_grams",
+            (product['id'] for product in products_data if product['type'] == 'variable_weight'), 'product_id'
+        )
 
         products_list = []
         if products_data:
-            for row in products_data:
-                product_dict = dict(row)
+            for product_dict in products_data:
+                product_dict['in_stock'] = bool(product_dict['in_stock'])
                 if product_dict.get('main_image_url'):
                     # Assuming assets are served from a public endpoint or a specific asset serving route
                     # This might need adjustment based on how frontend constructs URLs
@@ -105,34 +210,128 @@ def get_products_list():
                     # Placeholder for public URL construction:
                     product_dict['main_image_full_url'] = f"/assets/{product_dict['main_image_url']}" # Example
                 
-                # Fetch active weight options for variable products
+                # Active weight options for variable products
                 if product_dict['type'] == 'variable_weight':
-                    options_data = query_db(
-                        "SELECT id, weight_grams, price, sku_suffix, aggregate_stock_quantity FROM product_weight_options WHERE product_id = ? AND is_active = TRUE ORDER BY weight_grams",
-                        [product_dict['id']], db_conn=db
-                    )
-                    product_dict['weight_options'] = [dict(opt_row) for opt_row in options_data] if options_data else []
+                    product_dict['weight_options'] = [
+                        {key: value for key, value in option.items() if key != 'product_id'}
+                        for option in weight_options.get(product_dict['id'], [])
+                    ]
                 products_list.append(product_dict)
         
-        return jsonify({
+        response = {
             "products": products_list,
             "page": page,
             "per_page": per_page,
             "total_products": total_products,
-            "total_pages": (total_products + per_page - 1) // per_page if total_products > 0 else 0
-        }), 200
-
+            "total_pages": (total_products + per_page - 1) // per_page if total_products is not None else None,
+            "next_cursor": next_cursor
+        }
+        if facets is not None:
+            response["facets"] = facets
+        return jsonify(response), 200
+
+    except InvalidCursorError as e:
+        return jsonify(message=str(e)), 400
     except Exception as e:
         current_app.logger.error(f"Error fetching products list: {e}")
         return jsonify(message="Failed to fetch products"), 500
 
 
+def _batch_keys(args, param):
+    """Values of ?ids=1,2,3 / ?ids=1&ids=2 style params, deduplicated in request order."""
+    keys = []
+    for value in args.getlist(param):
+        keys.extend(key.strip() for key in value.split(',') if key.strip())
+    return list(dict.fromkeys(keys))
+
+
+@products_bp.route('/batch', methods=['GET'])
+@catalog_cache(max_age=0) # Prices and stock must be current: always revalidated against the catalog ETag
+def get_products_batch():
+    """
+    Current price, stock, active weight options and image of many products at once, for cart
+    and checkout hydration: ?ids=1,2,3 or ?slugs=a,b (up to PRODUCT_BATCH_MAX_ITEMS).
+    Products that are unknown or inactive are listed under "missing" so the cart can drop them.
+    ?compact=true returns only what a cart line needs.
+    """
+    db = get_db()
+    if request.args.get('ids'):
+        key_column = 'id'
+        try:
+            keys = [int(key) for key in _batch_keys(request.args, 'ids')]
+        except ValueError:
+            return jsonify(message="ids must be a comma-separated list of product ids"), 400
+    elif request.args.get('slugs'):
+        key_column = 'slug'
+        keys = _batch_keys(request.args, 'slugs')
+    else:
+        return jsonify(message="Provide ids or slugs"), 400
+    if len(keys) > PRODUCT_BATCH_MAX_ITEMS:
+        return jsonify(message=f"At most {PRODUCT_BATCH_MAX_ITEMS} products per request"), 400
+    compact = request.args.get('compact', 'false').lower() == 'true'
+
+    try:
+        # One query per table (per SQLITE_IN_CHUNK_SIZE keys): products, then their weight options
+        products_by_key = load_child_rows(
+            db,
+            f"""SELECT id, name, slug, type, base_price, min_price, max_price, in_stock, currency, unit_of_measure,
+                       main_image_url, aggregate_stock_quantity, aggregate_stock_weight_grams
+                FROM products WHERE {key_column} IN ({{placeholders}}) AND is_active = TRUE""",
+            keys, key_column
+        )
+        weight_options = load_child_rows(
+            db,
+            "SELECT product_id, id, weight_grams, price, sku_suffix, aggregate_stock_quantity FROM product_weight_options WHERE product_id IN ({placeholders}) AND is_active = TRUE ORDER BY product_id, weight_grams",
+            (rows[0]['id'] for rows in products_by_key.values() if rows and rows[0]['type'] == 'variable_weight'), 'product_id'
+        )
+
+        products_list, missing = [], []
+        for key in keys:
+            rows = products_by_key.get(key)
+            if not rows:
+                missing.append(key)
+                continue
+            product_dict = rows[0]
+            options = [
+                {option_key: value for option_key, value in option.items() if option_key != 'product_id'}
+                for option in weight_options.get(product_dict['id'], [])
+            ]
+            product_dict['in_stock'] = bool(product_dict['in_stock'])
+
+            if compact:
+                entry = {'id': product_dict['id'], 'slug': product_dict['slug'], 'price': product_dict['base_price'],
+                         'stock': product_dict['aggregate_stock_quantity'], 'in_stock': product_dict['in_stock']}
+                if product_dict['type'] == 'variable_weight':
+                    entry['weight_options'] = [
+                        {'id': option['id'], 'price': option['price'], 'stock': option['aggregate_stock_quantity']}
+                        for option in options
+                    ]
+            else:
+                entry = dict(product_dict)
+                if entry.get('main_image_url'):
+                    entry['main_image_full_url'] = f"/assets/{entry['main_image_url']}" # Example
+                if product_dict['type'] == 'variable_weight':
+                    entry['weight_options'] = options
+            products_list.append(entry)
+
+        return jsonify({"products": products_list, "missing": missing}), 200
+    except Exception as e:
+        current_app.logger.error(f"Error fetching product batch ({key_column}s={keys[:10]}...): {e}")
+        return jsonify(message="Failed to fetch products"), 500
+
+
 @products_bp.route('/<string:slug>', methods=['GET'])
+@catalog_cache(max_age=300, stale_while_revalidate=600)
 def get_product_detail(slug):
     db = get_db()
     lang = get_locale()
 
     try:
+        # Assembled pages are cached per (slug, locale) and catalog version (see product_cache.py)
+        cached_body, catalog_version = get_cached_product_detail(slug, lang)
+        if cached_body is not None:
+            return current_app.response_class(cached_body, mimetype='application/json'), 200
+
         product_query = """
             SELECT p.*, c.name as category_name, c.slug as category_slug
             FROM products p
@@ -170,29 +369,38 @@ def get_product_detail(slug):
             )
             product_details['weight_options'] = [dict(opt_row) for opt_row in options_data] if options_data else []
         
-        # Fetch approved reviews
-        reviews_query = """
-            SELECT r.id, r.rating, r.comment, r.review_date, u.first_name as user_first_name
-            FROM reviews r
-            JOIN users u ON r.user_id = u.id
-            WHERE r.product_id = ? AND r.is_approved = TRUE
-            ORDER BY r.review_date DESC
-        """
-        reviews_data = query_db(reviews_query, [product_details['id']], db_conn=db)
-        product_details['reviews'] = []
-        if reviews_data:
-            for rev_row in reviews_data:
-                review_dict = dict(rev_row)
-                review_dict['review_date'] = format_datetime_for_display(review_dict['review_date'])
-                product_details['reviews'].append(review_dict)
+        # Rating aggregates (product_rating_stats) and the first page of approved reviews
+        stats_row = query_db("SELECT * FROM product_rating_stats WHERE product_id = ?", [product_details['id']], db_conn=db, one=True)
+        product_details['rating'] = rating_summary(stats_row)
+        product_details['reviews'], product_details['reviews_next_cursor'] = get_approved_reviews_page(db, product_details['id'])
         
-        return jsonify(product_details), 200
+        body = current_app.json.dumps(product_details)
+        cache_product_detail(slug, lang, body, product_details['id'], catalog_version)
+        return current_app.response_class(body, mimetype='application/json'), 200
 
     except Exception as e:
         current_app.logger.error(f"Error fetching product detail for slug {slug}: {e}")
         return jsonify(message="Failed to fetch product details"), 500
 
 
+@products_bp.route('/<int:product_id>/reviews', methods=['GET'])
+@catalog_cache(max_age=300, stale_while_revalidate=600)
+def get_product_reviews(product_id):
+    """Approved reviews of a product, newest first; ?cursor= from reviews_next_cursor / next_cursor."""
+    db = get_db()
+    try:
+        reviews, next_cursor = get_approved_reviews_page(
+            db, product_id, cursor=request.args.get('cursor'),
+            limit=get_page_size(request.args, default=REVIEWS_PAGE_SIZE, maximum=50)
+        )
+        return jsonify(reviews=reviews, next_cursor=next_cursor), 200
+    except InvalidCursorError as e:
+        return jsonify(message=str(e)), 400
+    except Exception as e:
+        current_app.logger.error(f"Error fetching reviews for product {product_id}: {e}")
+        return jsonify(message="Failed to fetch reviews"), 500
+
+
 @products_bp.route('/<int:product_id>/reviews', methods=['POST'])
 @jwt_required() # User must be logged in to post a review
 def submit_review(product_id):
@@ -293,6 +501,7 @@ def submit_review(product_id):
 
 
 @products_bp.route('/categories', methods=['GET'])
+@catalog_cache(max_age=3600, stale_while_revalidate=3600)
 def get_public_categories():
     db = get_db()
     try:
@@ -315,7 +524,71 @@ def get_public_categories():
         current_app.logger.error(f"Error fetching public categories: {e}")
         return jsonify(message="Failed to fetch categories"), 500
 
+@products_bp.route('/categories/tree', methods=['GET'])
+@catalog_cache(max_age=3600, stale_while_revalidate=3600)
+def get_public_category_tree():
+    """Nested category tree; product_count counts active products in each category's whole subtree."""
+    db = get_db()
+    try:
+        categories_data = query_db(
+            """SELECT c.id, c.name, c.slug, c.description, c.image_url, c.parent_id,
+                      COALESCE(counts.product_count, 0) AS product_count
+               FROM categories c
+               LEFT JOIN (
+                   SELECT cc.ancestor_id, COUNT(p.id) AS product_count
+                   FROM category_closure cc
+                   JOIN products p ON p.category_id = cc.descendant_id AND p.is_active = TRUE
+                   GROUP BY cc.ancestor_id
+               ) counts ON counts.ancestor_id = c.id
+               ORDER BY c.name""",
+            db_conn=db
+        )
+        categories_list = []
+        for cat_row in categories_data or []:
+            cat_dict = dict(cat_row)
+            if cat_dict.get('image_url'):
+                cat_dict['image_full_url'] = f"/assets/{cat_dict['image_url']}" # Example public asset URL
+            categories_list.append(cat_dict)
+        return jsonify(build_category_tree(categories_list)), 200
+    except Exception as e:
+        current_app.logger.error(f"Error fetching category tree: {e}")
+        return jsonify(message="Failed to fetch category tree"), 500
+
+@products_bp.route('/<string:slug>/related', methods=['GET'])
+@catalog_cache(max_age=3600, stale_while_revalidate=3600)
+def get_related_products(slug):
+    """"Frequently bought together": the precomputed neighbours of a product (see recommendations.py)."""
+    db = get_db()
+    limit = get_page_size(request.args, default=current_app.config.get('RECOMMENDATIONS_TOP_N', 10),
+                          maximum=current_app.config.get('RECOMMENDATIONS_TOP_N', 10))
+    try:
+        # The LEFT JOINs keep one row for a product without recommendations, to tell it from an unknown slug.
+        rows = query_db(
+            """SELECT src.id AS source_id, p.id, p.name, p.slug, p.base_price, p.main_image_url, r.order_count
+               FROM products src
+               LEFT JOIN product_recommendations r ON r.product_id = src.id AND r.rank <= ?
+               LEFT JOIN products p ON p.id = r.related_product_id AND p.is_active = TRUE
+               WHERE src.slug = ? AND src.is_active = TRUE
+               ORDER BY r.rank""",
+            [limit, slug], db_conn=db
+        )
+        if not rows:
+            return jsonify(message="Product not found or not active"), 404
+
+        related = []
+        for row in rows:
+            if row['id'] is None: # No recommendations, or the neighbour was deactivated
+                continue
+            product_dict = dict(row)
+            del product_dict['source_id']
+            if product_dict.get('main_image_url'):
+                product_dict['main_image_full_url'] = f"/assets/{product_dict['main_image_url']}" # Example
+            related.append(product_dict)
+        return jsonify(related), 200
+    except Exception as e:
+        current_app.logger.error(f"Error fetching related products for {slug}: {e}")
+        return jsonify(message="Failed to fetch related products"), 500
+
 # Add other public product-related utility endpoints if needed, e.g.,
 # - Featured products
-# - Related products
 # - Search suggestions
@@ -6,6 +6,7 @@ from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 # from ..services.email_service import send_email # Uncomment when ready
 # from ..services.invoice_service import generate_invoice_pdf # Assuming this would be the actual service
 from ..database import get_db_connection, query_db
+from ..idempotency import idempotency_claim, idempotent, store_idempotent_response
 from ..utils import format_datetime_for_display
 
 professional_bp = Blueprint('professional', __name__, url_prefix='/api/professional')
@@ -169,6 +170,7 @@ def update_professional_application_status(user_id):
 
 @professional_bp.route('/invoices/generate', methods=['POST'])
 @staff_or_admin_required
+@idempotent()
 def generate_professional_invoice_pdf():
     data = request.json
     b2b_user_id = data.get('b2b_user_id')
@@ -264,7 +266,10 @@ def generate_professional_invoice_pdf():
                    VALUES (?, ?, ?, ?, ?)""",
                 (invoice_id, item.get('description'), item.get('quantity'), item.get('unit_price'), item.get('total_price'))
             )
-        
+
+        response = jsonify(message="B2B invoice generated successfully.", invoice_id=invoice_id, invoice_number=invoice_number, pdf_url=pdf_relative_path)
+        response.status_code = 201
+        store_idempotent_response(db, idempotency_claim(), response) # Committed with the invoice
         db.commit()
         audit_logger.log_action(
             user_id=current_admin_id,
@@ -274,7 +279,7 @@ def generate_professional_invoice_pdf():
             details=f"Generated B2B invoice {invoice_number} for user {b2b_user_id}. PDF: {pdf_relative_path}",
             status='success'
         )
-        return jsonify(message="B2B invoice generated successfully.", invoice_id=invoice_id, invoice_number=invoice_number, pdf_url=pdf_relative_path), 201
+        return response
 
     except Exception as e:
         db.rollback()
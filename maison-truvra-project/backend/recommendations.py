@@ -0,0 +1,145 @@
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from .database import get_db_connection, query_db
+from .http_cache import forget_catalog_version
+
+# --- "Frequently Bought Together" ---
+# An offline job counts, for every pair of products, the orders containing both, and keeps
+# the top N neighbours per product in product_recommendations (migration 0008). Counting is
+# set-based: each batch of orders is reduced to its distinct (order, product) lines and
+# self-joined on the order, so SQLite aggregates whole batches in one statement rather
+# than Python looping over orders. Refreshes are incremental: only orders above the
+# recommendation_state watermark are counted, and only the products they touch get
+# their top N rebuilt.
+
+# Orders that did not lead to a sale (as of when they are counted) are left out of the counts.
+EXCLUDED_ORDER_STATUSES = ('cancelled', 'refunded')
+
+
+def _count_order_batch(db_conn, after_order_id, up_to_order_id):
+    """Adds the pair counts of orders in (after_order_id, up_to_order_id] and marks their products dirty."""
+    db_conn.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS recommendation_lines (order_id INTEGER, product_id INTEGER, "
+        "PRIMARY KEY (order_id, product_id)) WITHOUT ROWID"
+    )
+    db_conn.execute("DELETE FROM recommendation_lines")
+    db_conn.execute(
+        f"""INSERT OR IGNORE INTO recommendation_lines (order_id, product_id)
+            SELECT oi.order_id, oi.product_id
+            FROM order_items oi
+            JOIN orders o ON o.id = oi.order_id
+            WHERE oi.order_id > ? AND oi.order_id <= ?
+              AND o.status NOT IN ({', '.join('?' for _ in EXCLUDED_ORDER_STATUSES)})""",
+        [after_order_id, up_to_order_id, *EXCLUDED_ORDER_STATUSES]
+    )
+    # Both directions of each pair; "WHERE true" keeps the upsert unambiguous after a join.
+    pairs = db_conn.execute(
+        """INSERT INTO product_pair_counts (product_id, related_product_id, order_count)
+           SELECT a.product_id, b.product_id, COUNT(*)
+           FROM recommendation_lines a
+           JOIN recommendation_lines b ON b.order_id = a.order_id AND b.product_id <> a.product_id
+           WHERE true
+           GROUP BY a.product_id, b.product_id
+           ON CONFLICT (product_id, related_product_id) DO UPDATE SET order_count = order_count + excluded.order_count"""
+    ).rowcount
+    db_conn.execute(
+        """INSERT OR IGNORE INTO recommendation_dirty_products (product_id)
+           SELECT DISTINCT a.product_id
+           FROM recommendation_lines a
+           JOIN recommendation_lines b ON b.order_id = a.order_id AND b.product_id <> a.product_id"""
+    )
+    return pairs
+
+
+def _rebuild_dirty_recommendations(db_conn, top_n):
+    """Recomputes the top N of every dirty product from its pair counts. Returns the number of products."""
+    dirty_count = db_conn.execute("SELECT COUNT(*) FROM recommendation_dirty_products").fetchone()[0]
+    if not dirty_count:
+        return 0
+    db_conn.execute("DELETE FROM product_recommendations WHERE product_id IN (SELECT product_id FROM recommendation_dirty_products)")
+    db_conn.execute(
+        """INSERT INTO product_recommendations (product_id, rank, related_product_id, order_count)
+           SELECT product_id, rank, related_product_id, order_count
+           FROM (
+               SELECT pc.product_id, pc.related_product_id, pc.order_count,
+                      ROW_NUMBER() OVER (PARTITION BY pc.product_id
+                                         ORDER BY pc.order_count DESC, pc.related_product_id) AS rank
+               FROM recommendation_dirty_products d
+               JOIN product_pair_counts pc ON pc.product_id = d.product_id
+           )
+           WHERE rank <= ?""",
+        [top_n]
+    )
+    db_conn.execute("DELETE FROM recommendation_dirty_products")
+    # The related products endpoint is served under the catalog ETag.
+    db_conn.execute("UPDATE catalog_version SET version = version + 1, changed_at = CURRENT_TIMESTAMP WHERE id = 1")
+    return dirty_count
+
+
+def refresh_recommendations(db_conn, full=False, top_n=None, batch_orders=None, logger=None):
+    """
+    Counts the orders placed since the last refresh (every order with full=True) and rebuilds
+    the top N of the products they touched. Each batch of orders is committed together with
+    the watermark, so an interrupted refresh resumes where it stopped.
+    Returns {'orders': ..., 'pairs': ..., 'products': ..., 'last_order_id': ...}.
+    """
+    top_n = top_n or current_app.config.get('RECOMMENDATIONS_TOP_N', 10)
+    batch_orders = batch_orders or current_app.config.get('RECOMMENDATIONS_BATCH_ORDERS', 20000)
+    try:
+        if full:
+            db_conn.execute("DELETE FROM product_pair_counts")
+            db_conn.execute("INSERT OR IGNORE INTO recommendation_dirty_products (product_id) SELECT DISTINCT product_id FROM product_recommendations")
+            db_conn.execute("UPDATE recommendation_state SET last_order_id = 0 WHERE id = 1")
+            db_conn.commit()
+
+        watermark = query_db("SELECT last_order_id FROM recommendation_state WHERE id = 1", db_conn=db_conn, one=True)['last_order_id']
+        max_order_id = query_db("SELECT COALESCE(MAX(id), 0) AS max_id FROM orders", db_conn=db_conn, one=True)['max_id']
+        stats = {'orders': 0, 'pairs': 0, 'products': 0, 'last_order_id': watermark}
+
+        while watermark < max_order_id:
+            upper = min(watermark + batch_orders, max_order_id)
+            stats['pairs'] += _count_order_batch(db_conn, watermark, upper)
+            stats['orders'] += db_conn.execute("SELECT COUNT(DISTINCT order_id) FROM recommendation_lines").fetchone()[0]
+            db_conn.execute("UPDATE recommendation_state SET last_order_id = ? WHERE id = 1", [upper])
+            db_conn.commit()
+            watermark = upper
+            if logger:
+                logger.info(f"Recommendations: counted orders up to id {upper} of {max_order_id}")
+
+        stats['products'] = _rebuild_dirty_recommendations(db_conn, top_n)
+        db_conn.execute("UPDATE recommendation_state SET refreshed_at = CURRENT_TIMESTAMP WHERE id = 1")
+        db_conn.commit()
+        stats['last_order_id'] = watermark
+    except Exception:
+        db_conn.rollback()
+        raise
+    if stats['products']:
+        forget_catalog_version()
+    return stats
+
+
+@click.group('recommendations')
+def recommendations_cli():
+    """"Frequently bought together" recommendations."""
+
+
+@recommendations_cli.command('refresh')
+@click.option('--full', is_flag=True, help='Recount every order instead of only the new ones.')
+@click.option('--top-n', type=int, default=None, help='Neighbours kept per product (default: RECOMMENDATIONS_TOP_N).')
+@click.option('--batch-orders', type=int, default=None, help='Order ids counted per transaction (default: RECOMMENDATIONS_BATCH_ORDERS).')
+@with_appcontext
+def recommendations_refresh_command(full, top_n, batch_orders):
+    """Count new orders into the co-occurrence table and rebuild the affected top N lists."""
+    start = time.perf_counter()
+    stats = refresh_recommendations(get_db_connection(), full=full, top_n=top_n, batch_orders=batch_orders,
+                                    logger=current_app.logger)
+    click.echo(f"Counted {stats['orders']} orders ({stats['pairs']} pair updates), rebuilt recommendations "
+               f"for {stats['products']} products in {time.perf_counter() - start:.1f}s "
+               f"(watermark: order {stats['last_order_id']}).")
+
+
+def register_recommendation_commands(app):
+    """Registers the `flask recommendations` command group."""
+    app.cli.add_command(recommendations_cli)
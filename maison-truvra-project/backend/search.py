@@ -0,0 +1,61 @@
+import re
+from unidecode import unidecode
+
+# --- Product Full-Text Search ---
+# Builds FTS5 MATCH expressions for the products_fts table (see migrations/0003_products_fts.sql).
+# The index folds accents itself (remove_diacritics 2); terms are also folded with unidecode
+# so that letters the tokenizer keeps as-is (œ, æ, ß...) match their ASCII spelling too.
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+MAX_SEARCH_TERMS = 8
+MIN_PREFIX_LENGTH = 2 # Matches the smallest prefix index
+
+# bm25 column weights, in products_fts column order: name, description, brand, category_name
+BM25_WEIGHTS = (10.0, 1.0, 4.0, 2.0)
+
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _term_expression(term):
+    """One search term as an FTS5 expression: quoted, prefix-matched, with its folded spelling."""
+    spellings = []
+    for spelling in (term.lower(), unidecode(term).lower()):
+        spelling = spelling.strip()
+        if spelling and spelling not in spellings:
+            spellings.append(spelling)
+    parts = [
+        _quote(spelling) + ('*' if len(spelling) >= MIN_PREFIX_LENGTH else '')
+        for spelling in spellings
+    ]
+    return parts[0] if len(parts) == 1 else '(' + ' OR '.join(parts) + ')'
+
+
+def build_fts_query(search_term):
+    """
+    Turns user input into a safe FTS5 MATCH expression: every word must match (implicit AND),
+    each as a prefix, so "truffe perig" finds "Truffe noire du Périgord".
+    Returns None when the input contains no searchable word.
+    """
+    if not search_term:
+        return None
+    terms = _TERM_RE.findall(search_term)[:MAX_SEARCH_TERMS]
+    if not terms:
+        return None
+    return ' '.join(_term_expression(term) for term in terms)
+
+
+def fts_products_source(alias='fts', product_alias='p'):
+    """
+    FROM-clause source for a products query restricted to FTS matches, exposing `<alias>.rank`
+    (bm25, lower is more relevant). Takes one parameter: the build_fts_query() expression.
+    The CROSS JOIN keeps the MATCH as the outer loop; otherwise SQLite may probe the
+    index once per product (e.g. for COUNT queries), which is quadratic on large catalogs.
+    """
+    weights = ', '.join(str(w) for w in BM25_WEIGHTS)
+    return f"""(
+                SELECT rowid AS product_id, bm25(products_fts, {weights}) AS rank
+                FROM products_fts WHERE products_fts MATCH ?
+            ) {alias}
+            CROSS JOIN products {product_alias} ON {product_alias}.id = {alias}.product_id"""
@@ -0,0 +1,270 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from .database import get_db_connection
+
+# --- Stock Reservations ---
+# Checkout used to read stock, compare it with the ordered quantity and decrement it in a
+# later statement, so two buyers of the last Tuber magnatum could both pass the check.
+# Stock now only leaves through a conditional decrement
+#     UPDATE ... SET aggregate_stock_quantity = aggregate_stock_quantity - ? WHERE id = ? AND aggregate_stock_quantity >= ?
+# which SQLite evaluates under its write lock: a line takes its whole quantity or nothing,
+# whatever the other writers (processes included) are doing. Serialized items are claimed
+# the same way, 'available' -> 'allocated'/'sold' in a single UPDATE.
+#
+# A hold (stock_reservations rows sharing a hold_token, migration 0012) keeps stock out of
+# sale for STOCK_RESERVATION_TTL_SECONDS while the customer pays. Checkout with the token
+# converts it into the order; otherwise it is released, explicitly or by
+# release_expired_holds once expired (`flask reservations sweep`, and a bounded batch
+# before every new hold so stock comes back even without cron). Holds write no stock
+# movement: the 'sale' movement is recorded when the order is placed. One account may only
+# keep STOCK_RESERVATION_MAX_HOLDS_PER_USER holds and STOCK_RESERVATION_MAX_UNITS_PER_USER
+# units out of sale at a time, so nobody can hold the catalog hostage.
+#
+# Every function here is meant to run inside a write job (write_queue.run_write): the
+# caller owns the transaction and rolls it back when one of them raises.
+
+class InsufficientStockError(ValueError):
+    """A conditional decrement found less stock than a line asks for."""
+
+
+class HoldLimitError(ValueError):
+    """The user already holds as many holds or units as allowed."""
+
+
+def _timestamp(dt):
+    """datetime -> 'YYYY-MM-DD HH:MM:SS' (UTC), the format CURRENT_TIMESTAMP stores and compares."""
+    return dt.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def decrement_stock(db, lines):
+    """
+    Takes each line's quantity out of its weight option's or product's aggregate stock, all or nothing.
+    :param lines: Dicts with product_id, variant_id (None for product-level stock), quantity and
+                  optionally name; at most one line per product/option.
+    Raises InsufficientStockError naming the first short line; nothing is decremented then.
+    """
+    option_rows = [(line['quantity'], line['variant_id'], line['quantity']) for line in lines if line['variant_id'] is not None]
+    product_rows = [(line['quantity'], line['product_id'], line['quantity']) for line in lines if line['variant_id'] is None]
+    db.execute("SAVEPOINT stock_decrement")
+    applied = 0
+    if option_rows:
+        applied += db.executemany(
+            """UPDATE product_weight_options SET aggregate_stock_quantity = aggregate_stock_quantity - ?
+               WHERE id = ? AND aggregate_stock_quantity >= ?""",
+            option_rows
+        ).rowcount
+    if product_rows:
+        applied += db.executemany(
+            """UPDATE products SET aggregate_stock_quantity = aggregate_stock_quantity - ?
+               WHERE id = ? AND aggregate_stock_quantity >= ?""",
+            product_rows
+        ).rowcount
+    if applied != len(option_rows) + len(product_rows):
+        # Undo the lines that did fit, so the stock read below is what every line competed for.
+        db.execute("ROLLBACK TO SAVEPOINT stock_decrement")
+        db.execute("RELEASE SAVEPOINT stock_decrement")
+        raise InsufficientStockError(_shortfall_message(db, lines))
+    db.execute("RELEASE SAVEPOINT stock_decrement")
+
+
+def _shortfall_message(db, lines):
+    for line in lines:
+        if line['variant_id'] is not None:
+            row = db.execute("SELECT aggregate_stock_quantity FROM product_weight_options WHERE id = ?", (line['variant_id'],)).fetchone()
+        else:
+            row = db.execute("SELECT aggregate_stock_quantity FROM products WHERE id = ?", (line['product_id'],)).fetchone()
+        available = (row[0] if row else 0) or 0
+        if available < line['quantity']:
+            label = line.get('name') or f"#{line['product_id']}"
+            return f"Stock insuffisant pour {label}. Demandé: {line['quantity']}, Disponible: {max(available, 0)}"
+    return "Stock insuffisant."
+
+
+def restore_stock(db, lines):
+    """Puts lines (product_id, variant_id, quantity) back into aggregate stock."""
+    db.executemany(
+        "UPDATE product_weight_options SET aggregate_stock_quantity = aggregate_stock_quantity + ? WHERE id = ?",
+        [(line['quantity'], line['variant_id']) for line in lines if line['variant_id'] is not None]
+    )
+    db.executemany(
+        "UPDATE products SET aggregate_stock_quantity = aggregate_stock_quantity + ? WHERE id = ?",
+        [(line['quantity'], line['product_id']) for line in lines if line['variant_id'] is None]
+    )
+
+
+_CLAIM_AVAILABLE_ITEMS = """
+    WHERE id IN (SELECT id FROM serialized_inventory_items
+                 WHERE product_id = ? AND variant_id IS ? AND status = 'available'
+                 ORDER BY expiry_date IS NULL, expiry_date, id LIMIT ?)
+"""
+
+
+def _serialized_lines(db, lines):
+    """The lines whose product has available serialized items (most products are not tracked item by item)."""
+    product_ids = list({line['product_id'] for line in lines})
+    if not product_ids:
+        return []
+    tracked = {row[0] for row in db.execute(
+        f"""SELECT DISTINCT product_id FROM serialized_inventory_items
+            WHERE status = 'available' AND product_id IN ({', '.join('?' for _ in product_ids)})""",
+        product_ids
+    )}
+    return [line for line in lines if line['product_id'] in tracked]
+
+
+def sell_serialized_items(db, sold_lines):
+    """
+    Marks up to `quantity` available serialized items of each line sold (first expiring first),
+    linked to the order item.
+    :param sold_lines: Dicts with order_item_id, unit_price, product_id, variant_id, quantity.
+    """
+    return db.executemany(
+        "UPDATE serialized_inventory_items SET status = 'sold', sold_at = CURRENT_TIMESTAMP, order_item_id = ?, "
+        "purchase_price = ?, updated_at = CURRENT_TIMESTAMP" + _CLAIM_AVAILABLE_ITEMS,
+        [(line['order_item_id'], line['unit_price'], line['product_id'], line['variant_id'], line['quantity'])
+         for line in _serialized_lines(db, list(sold_lines))]
+    ).rowcount
+
+
+def _check_hold_limits(db, user_id, quantity, max_holds, max_units):
+    holds, units = db.execute(
+        """SELECT COUNT(DISTINCT hold_token), COALESCE(SUM(quantity), 0) FROM stock_reservations
+           WHERE user_id = ? AND status = 'held' AND expires_at > CURRENT_TIMESTAMP""",
+        (user_id,)
+    ).fetchone()
+    if holds >= max_holds:
+        raise HoldLimitError(f"Vous avez déjà {holds} réservation(s) en cours. Finalisez ou annulez-en une avant d'en créer une autre.")
+    if units + quantity > max_units:
+        raise HoldLimitError(f"Une réservation est limitée à {max_units} article(s) au total par compte.")
+
+
+def create_hold(db, user_id, lines, ttl_seconds=None):
+    """
+    Reserves lines (product_id, variant_id, quantity[, name]) for ttl_seconds: conditional stock
+    decrement, one stock_reservations row per line and serialized items allocated to it.
+    Expired holds are swept first (a bounded batch), so their stock can be reserved again.
+    Returns (hold_token, expires_at as an aware UTC datetime).
+    Raises InsufficientStockError if any line cannot be reserved, HoldLimitError if the user
+    would exceed their hold limits; nothing is reserved then.
+    """
+    config = current_app.config
+    if ttl_seconds is None:
+        ttl_seconds = config.get('STOCK_RESERVATION_TTL_SECONDS', 900)
+    release_expired_holds(db, limit=config.get('STOCK_RESERVATION_SWEEP_LIMIT', 200))
+    _check_hold_limits(db, user_id, sum(line['quantity'] for line in lines),
+                       config.get('STOCK_RESERVATION_MAX_HOLDS_PER_USER', 3), config.get('STOCK_RESERVATION_MAX_UNITS_PER_USER', 100))
+    decrement_stock(db, lines)
+
+    hold_token = uuid.uuid4().hex
+    expires_at = datetime.now(timezone.utc).replace(microsecond=0) + timedelta(seconds=ttl_seconds)
+    db.executemany(
+        """INSERT INTO stock_reservations (hold_token, user_id, product_id, variant_id, quantity, expires_at)
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        [(hold_token, user_id, line['product_id'], line['variant_id'], line['quantity'], _timestamp(expires_at))
+         for line in lines]
+    )
+    db.executemany(
+        "UPDATE serialized_inventory_items SET status = 'allocated', reservation_id = ?, updated_at = CURRENT_TIMESTAMP"
+        + _CLAIM_AVAILABLE_ITEMS,
+        [(row['id'], row['product_id'], row['variant_id'], row['quantity']) for row in _serialized_lines(
+            db, db.execute("SELECT id, product_id, variant_id, quantity FROM stock_reservations WHERE hold_token = ?", (hold_token,)).fetchall())]
+    )
+    return hold_token, expires_at
+
+
+def load_hold(db, hold_token, user_id=None):
+    """The live (held, not yet expired) lines of a hold, optionally restricted to its owner; [] if none."""
+    query = """SELECT id, product_id, variant_id, quantity, expires_at FROM stock_reservations
+               WHERE hold_token = ? AND status = 'held' AND expires_at > CURRENT_TIMESTAMP"""
+    params = [hold_token]
+    if user_id is not None:
+        query += " AND user_id = ?"
+        params.append(user_id)
+    return db.execute(query + " ORDER BY id", params).fetchall()
+
+
+def convert_hold(db, hold_lines, order_id, order_items_by_line):
+    """
+    Turns a hold into the order's sale: the stock is already out, so only the reservation rows
+    and their allocated serialized items change.
+    :param order_items_by_line: {(product_id, variant_id): (order_item_id, unit_price)} for the order.
+    """
+    db.executemany(
+        "UPDATE stock_reservations SET status = 'converted', order_id = ?, closed_at = CURRENT_TIMESTAMP WHERE id = ?",
+        [(order_id, line['id']) for line in hold_lines]
+    )
+    db.executemany(
+        """UPDATE serialized_inventory_items SET status = 'sold', sold_at = CURRENT_TIMESTAMP, order_item_id = ?,
+                  purchase_price = ?, reservation_id = NULL, updated_at = CURRENT_TIMESTAMP
+           WHERE reservation_id = ? AND status = 'allocated'""",
+        [(*order_items_by_line[(line['product_id'], line['variant_id'])], line['id']) for line in hold_lines]
+    )
+
+
+def _close_holds(db, hold_lines, status):
+    """Releases hold lines (status 'released' or 'expired'): stock and serialized items go back."""
+    if not hold_lines:
+        return 0
+    restore_stock(db, hold_lines)
+    reservation_ids = [(line['id'],) for line in hold_lines]
+    db.executemany(
+        "UPDATE stock_reservations SET status = ?, closed_at = CURRENT_TIMESTAMP WHERE id = ?",
+        [(status, line['id']) for line in hold_lines]
+    )
+    db.executemany(
+        """UPDATE serialized_inventory_items SET status = 'available', reservation_id = NULL, updated_at = CURRENT_TIMESTAMP
+           WHERE reservation_id = ? AND status = 'allocated'""",
+        reservation_ids
+    )
+    return len(hold_lines)
+
+
+def release_hold(db, hold_token, user_id=None):
+    """Write job: gives a hold's stock back before it expires. Returns the number of lines released."""
+    hold_lines = db.execute(
+        "SELECT id, product_id, variant_id, quantity FROM stock_reservations WHERE hold_token = ? AND status = 'held'"
+        + (" AND user_id = ?" if user_id is not None else ""),
+        [hold_token] + ([user_id] if user_id is not None else [])
+    ).fetchall()
+    return _close_holds(db, hold_lines, 'released')
+
+
+def release_expired_holds(db, limit=None):
+    """Write job: releases expired hold lines (oldest first, at most `limit`). Returns how many."""
+    query = """SELECT id, product_id, variant_id, quantity FROM stock_reservations
+               WHERE status = 'held' AND expires_at <= CURRENT_TIMESTAMP ORDER BY expires_at"""
+    params = []
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
+    released = _close_holds(db, db.execute(query, params).fetchall(), 'expired')
+    if released:
+        current_app.logger.info(f"{released} ligne(s) de réservation expirée(s) libérée(s).")
+    return released
+
+
+@click.group('reservations')
+def reservations_cli():
+    """Checkout stock holds."""
+
+
+@reservations_cli.command('sweep')
+@with_appcontext
+def reservations_sweep_command():
+    """Release every expired hold, giving its stock back (run periodically, e.g. every minute from cron)."""
+    db = get_db_connection()
+    try:
+        released = release_expired_holds(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    click.echo(f"Released {released} expired hold line(s).")
+
+
+def register_reservation_commands(app):
+    """Registers the `flask reservations` command group."""
+    app.cli.add_command(reservations_cli)
@@ -104,6 +104,9 @@ def get_file_extension(filename):
     return ''
 
 # --- String Manipulation ---
+# Static routes under /api/products/ that a product slug would be shadowed by.
+RESERVED_PRODUCT_SLUGS = frozenset({'batch', 'categories'})
+
 def generate_slug(text):
     """
     Generates a URL-friendly slug from a given text string.
@@ -0,0 +1,267 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from flask import current_app, g
+
+# --- Single-Writer Queue ---
+# SQLite allows one writer at a time. With every request thread writing through its own
+# pooled connection, bursts (a newsletter blast during a sale) end in "database is locked".
+# When DB_WRITE_QUEUE_ENABLED is set, write jobs are handed to one writer thread per worker
+# process instead. It runs them on a dedicated connection, groups up to
+# DB_WRITE_QUEUE_BATCH_SIZE jobs into a single transaction (one fsync) and isolates each
+# job in a SAVEPOINT so a failing job does not take the rest of the batch down with it.
+# Readers are unaffected: GET routes keep using their pooled connections (WAL mode).
+#
+# A job is a callable taking the connection as first argument. It must not commit or
+# roll back itself; raise to abort it. Its return value (or exception) is delivered
+# through a concurrent.futures.Future once the batch has committed.
+
+
+class WriteQueueFullError(sqlite3.OperationalError):
+    """Raised when the write queue stays full for longer than the submit timeout (backpressure)."""
+
+
+class _WriteJob:
+    __slots__ = ('fn', 'args', 'kwargs', 'future', 'enqueued_at', 'label')
+
+    def __init__(self, fn, args, kwargs, label):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+        self.label = label
+
+
+class WriteQueue:
+    """Bounded queue feeding a single writer thread with group commit."""
+
+    def __init__(self, app, connection_pool, max_queue_size=1000, max_batch_size=64,
+                 max_batch_wait_ms=2.0, submit_timeout=5.0):
+        self.app = app
+        self.pool = connection_pool # A pool of size 1 providing the writer's tuned connection
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_batch_wait = float(max_batch_wait_ms) / 1000.0
+        self.submit_timeout = float(submit_timeout)
+        self.pid = os.getpid()
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._thread = None
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'batches': 0,
+            'batch_commit_failures': 0,
+            'max_batch_size_seen': 0,
+            'max_queue_depth_seen': 0,
+            'total_queue_wait_seconds': 0.0,
+            'total_commit_seconds': 0.0,
+        }
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        """Enqueues a write job and returns its Future. Blocks up to submit_timeout when the queue is full."""
+        if self._stopping:
+            raise sqlite3.ProgrammingError("Cannot submit to a stopped write queue.")
+        self.start()
+        job = _WriteJob(fn, args, kwargs, getattr(fn, '__name__', repr(fn)))
+        try:
+            self._queue.put(job, timeout=self.submit_timeout)
+        except queue.Full:
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise WriteQueueFullError(
+                f"Write queue is full ({self._queue.maxsize} pending jobs) after {self.submit_timeout}s."
+            )
+        with self._lock:
+            self._stats['submitted'] += 1
+            self._stats['max_queue_depth_seen'] = max(self._stats['max_queue_depth_seen'], self._queue.qsize())
+        return job.future
+
+    def stop(self, timeout=5.0):
+        """Stops the writer after the jobs already queued have been processed."""
+        self._stopping = True
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def _collect_batch(self, first_job):
+        batch = [first_job]
+        deadline = time.monotonic() + self.max_batch_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                job = self._queue.get_nowait() if remaining <= 0 else self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if job is None: # Stop sentinel: finish this batch first
+                self._queue.put(None)
+                break
+            batch.append(job)
+        return batch
+
+    def _run(self):
+        conn = self.pool.acquire()
+        with self.app.app_context():
+            # Jobs that call get_db_connection() (e.g. the audit log) get the writer connection.
+            g.db_conn = conn
+            try:
+                while True:
+                    job = self._queue.get()
+                    if job is None:
+                        break
+                    self._run_batch(conn, self._collect_batch(job))
+            finally:
+                g.pop('db_conn', None)
+                self.pool.release(conn)
+
+    def _run_batch(self, conn, batch):
+        started = time.monotonic()
+        outcomes = [] # (job, result, exception)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as e:
+            for job in batch:
+                if job.future.set_running_or_notify_cancel():
+                    job.future.set_exception(e)
+            self._record_batch(batch, started, failed=len(batch), commit_failed=True)
+            return
+
+        for job in batch:
+            if not job.future.set_running_or_notify_cancel():
+                continue # Cancelled by the submitter while queued
+            conn.execute("SAVEPOINT write_job")
+            try:
+                result = job.fn(conn, *job.args, **job.kwargs)
+                conn.execute("RELEASE SAVEPOINT write_job")
+                outcomes.append((job, result, None))
+            except Exception as e:
+                try:
+                    conn.execute("ROLLBACK TO SAVEPOINT write_job")
+                    conn.execute("RELEASE SAVEPOINT write_job")
+                except sqlite3.Error:
+                    pass # The transaction itself is gone; the commit below reports it
+                outcomes.append((job, None, e))
+
+        commit_error = None
+        try:
+            conn.commit()
+        except sqlite3.Error as e:
+            commit_error = e
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                pass
+            self.app.logger.error(f"Write queue: group commit of {len(outcomes)} job(s) failed: {e}")
+
+        failed = 0
+        for job, result, error in outcomes:
+            error = error or commit_error
+            if error is not None:
+                failed += 1
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(result)
+        self._record_batch(batch, started, failed=failed, commit_failed=commit_error is not None)
+
+    def _record_batch(self, batch, started, failed, commit_failed):
+        now = time.monotonic()
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['completed'] += len(batch) - failed
+            self._stats['failed'] += failed
+            self._stats['max_batch_size_seen'] = max(self._stats['max_batch_size_seen'], len(batch))
+            self._stats['total_queue_wait_seconds'] += sum(started - job.enqueued_at for job in batch)
+            self._stats['total_commit_seconds'] += now - started
+            if commit_failed:
+                self._stats['batch_commit_failures'] += 1
+
+    def stats(self):
+        """Returns a snapshot of writer metrics (queue depth, batching and latency)."""
+        with self._lock:
+            snapshot = dict(self._stats)
+        processed = snapshot['completed'] + snapshot['failed']
+        snapshot.update({
+            'pid': self.pid,
+            'running': self._thread is not None and self._thread.is_alive(),
+            'queue_depth': self._queue.qsize(),
+            'queue_capacity': self._queue.maxsize,
+            'max_batch_size': self.max_batch_size,
+            'avg_batch_size': round(processed / snapshot['batches'], 2) if snapshot['batches'] else 0.0,
+            'avg_queue_wait_ms': round(snapshot['total_queue_wait_seconds'] * 1000.0 / processed, 3) if processed else 0.0,
+            'avg_batch_ms': round(snapshot['total_commit_seconds'] * 1000.0 / snapshot['batches'], 3) if snapshot['batches'] else 0.0,
+        })
+        del snapshot['total_queue_wait_seconds'], snapshot['total_commit_seconds']
+        return snapshot
+
+
+_write_queue_lock = threading.Lock()
+
+def get_write_queue(app=None):
+    """
+    Returns this worker process's WriteQueue, or None when DB_WRITE_QUEUE_ENABLED is off.
+    Like the connection pool, the queue (and its thread) is recreated after a fork.
+    """
+    if app is None:
+        app = current_app._get_current_object()
+    if not app.config.get('DB_WRITE_QUEUE_ENABLED', False):
+        return None
+    write_queue = app.extensions.get('write_queue')
+    if write_queue is None or write_queue.pid != os.getpid():
+        with _write_queue_lock:
+            write_queue = app.extensions.get('write_queue')
+            if write_queue is None or write_queue.pid != os.getpid():
+                from .database import create_connection_pool # Local import: database imports the profiler
+                write_queue = WriteQueue(
+                    app,
+                    create_connection_pool(app, size=1),
+                    max_queue_size=app.config.get('DB_WRITE_QUEUE_MAX_SIZE', 1000),
+                    max_batch_size=app.config.get('DB_WRITE_QUEUE_BATCH_SIZE', 64),
+                    max_batch_wait_ms=app.config.get('DB_WRITE_QUEUE_BATCH_WAIT_MS', 2.0),
+                    submit_timeout=app.config.get('DB_WRITE_QUEUE_SUBMIT_TIMEOUT', 5.0)
+                )
+                app.extensions['write_queue'] = write_queue
+                app.logger.info(f"Database write queue started (pid {write_queue.pid}, batch size {write_queue.max_batch_size}).")
+    return write_queue
+
+
+def submit_write(fn, *args, **kwargs):
+    """
+    Submits a write job and returns a Future.
+    Without the write queue the job runs immediately on the request's connection
+    (committed on success, rolled back on error) and an already-resolved Future is returned.
+    """
+    write_queue = get_write_queue()
+    if write_queue is not None:
+        return write_queue.submit(fn, *args, **kwargs)
+
+    from .database import get_db_connection
+    future = Future()
+    future.set_running_or_notify_cancel()
+    db = get_db_connection()
+    try:
+        result = fn(db, *args, **kwargs)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        future.set_exception(e)
+    else:
+        future.set_result(result)
+    return future
+
+
+def run_write(fn, *args, **kwargs):
+    """Runs a write job (see submit_write) and waits for its committed result, re-raising its exception."""
+    timeout = current_app.config.get('DB_WRITE_QUEUE_RESULT_TIMEOUT', 30.0)
+    return submit_write(fn, *args, **kwargs).result(timeout=timeout)
@@ -159,6 +159,47 @@ function getCartItemCount() {
     return cart.reduce((count, item) => count + item.quantity, 0);
 }
 
+/**
+ * Refreshes the price of every cart line from the server in a single request
+ * (GET /products/batch, compact mode) and drops products that are no longer sold.
+ * Relies on `makeApiRequest` from api.js; on failure the stored cart is left as is.
+ * @returns {Promise<Array<Object>>} The refreshed cart items.
+ */
+async function refreshCartFromServer() {
+    const cart = loadCart();
+    if (cart.length === 0) return cart;
+
+    const productIds = [...new Set(cart.map(item => item.id))];
+    let batch;
+    try {
+        batch = await makeApiRequest(`/products/batch?ids=${productIds.join(',')}&compact=true`);
+    } catch (error) {
+        console.error("Error refreshing cart from server:", error);
+        return cart;
+    }
+
+    const productsById = new Map(batch.products.map(product => [product.id, product]));
+    const refreshedCart = [];
+    cart.forEach(item => {
+        const product = productsById.get(item.id);
+        if (!product) return; // Unknown or deactivated product
+        if (item.variantId) {
+            const option = (product.weight_options || []).find(opt => opt.id === item.variantId);
+            if (!option) return; // Weight option no longer offered
+            item.price = parseFloat(option.price);
+        } else if (product.price !== null) {
+            item.price = parseFloat(product.price);
+        }
+        refreshedCart.push(item);
+    });
+
+    if (refreshedCart.length < cart.length) {
+        showGlobalMessage("Certains articles de votre panier ne sont plus disponibles et ont été retirés.", "info");
+    }
+    saveCart(refreshedCart);
+    return refreshedCart;
+}
+
 /**
  * Clears all items from the shopping cart.
  */
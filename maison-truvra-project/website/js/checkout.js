@@ -49,7 +49,8 @@ document.addEventListener('DOMContentLoaded', () => {
             return;
         }
 
-        const cartItems = await getCartItems(); // From cart.js
+        // Current prices for every line in one request (cart.js), before the totals are shown
+        const cartItems = typeof refreshCartFromServer === 'function' ? await refreshCartFromServer() : getCartItems();
         itemsContainer.innerHTML = ''; // Clear previous items
 
         if (cartItems.length === 0) {